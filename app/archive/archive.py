@@ -0,0 +1,152 @@
+import json, logging, mmap, os, re, threading, time, zlib
+from datetime import datetime, timezone
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+class ArchiveEntry(NamedTuple):
+    """Index record of one archived response"""
+
+    endpoint: str
+    url: str
+    start_date: str
+    end_date: str
+    fetched_at: float
+    segment: str
+    offset: int
+    length: int
+
+
+class Archive:
+    """Append-only archive of raw Fitbit responses
+
+    Responses are zlib compressed and appended to segment files, one segment
+    per endpoint and month. An index.jsonl file holds an ArchiveEntry per
+    response. Segments are read through mmap, so scanning years of history
+    only pages in the slices that are actually decompressed.
+    """
+
+    def __init__(self, path: str, compression_level: int = 6):
+        self.path = path
+        self.compression_level = compression_level
+        self.index_path = os.path.join(self.path, "index.jsonl")
+        self._entries: Optional[List[ArchiveEntry]] = None
+        self._maps = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+
+    def _segment_name(self, endpoint: str, day: str) -> str:
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", endpoint).strip("_")
+        return os.path.join(slug, day[:7] + ".seg")
+
+    def append(
+        self,
+        endpoint: str,
+        url: str,
+        content: bytes,
+        fetched_at: Optional[float] = None,
+    ) -> ArchiveEntry:
+        """Store a raw response body for url
+
+        endpoint: endpoint the url belongs to, with dates replaced by placeholders
+        """
+        fetched_at = fetched_at or time.time()
+        dates = DATE_PATTERN.findall(url)
+        if not dates:
+            dates = [
+                datetime.fromtimestamp(fetched_at, timezone.utc).strftime("%Y-%m-%d")
+            ]
+        segment = self._segment_name(endpoint, dates[0])
+        data = zlib.compress(content, self.compression_level)
+
+        with self._lock:
+            segment_path = os.path.join(self.path, segment)
+            os.makedirs(os.path.dirname(segment_path), exist_ok=True)
+            with open(segment_path, "ab") as file:
+                offset = file.tell()
+                file.write(data)
+
+            entry = ArchiveEntry(
+                endpoint=endpoint,
+                url=url,
+                start_date=dates[0],
+                end_date=dates[1] if len(dates) > 1 else dates[0],
+                fetched_at=fetched_at,
+                segment=segment,
+                offset=offset,
+                length=len(data),
+            )
+            with open(self.index_path, "a") as file:
+                file.write(json.dumps(entry._asdict()) + "\n")
+            if self._entries is not None:
+                self._entries.append(entry)
+
+        return entry
+
+    def entries(self) -> List[ArchiveEntry]:
+        """All index entries, in the order they were archived"""
+        if self._entries is None:
+            entries = []
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r") as file:
+                    for line in file:
+                        try:
+                            entries.append(ArchiveEntry(**json.loads(line)))
+                        except (ValueError, TypeError):
+                            # A torn last line from a crash mid append
+                            logging.error(
+                                f"Skipping broken archive index line: {line!r}"
+                            )
+            self._entries = entries
+        return self._entries
+
+    def find(
+        self,
+        endpoint: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+    ) -> Iterator[ArchiveEntry]:
+        """Entries of endpoint whose date range overlaps start_date to end_date"""
+        for entry in self.entries():
+            if endpoint and entry.endpoint != endpoint:
+                continue
+            if start_date and entry.end_date < start_date:
+                continue
+            if end_date and entry.start_date > end_date:
+                continue
+            yield entry
+
+    def _view(self, entry: ArchiveEntry) -> memoryview:
+        mapped = self._maps.get(entry.segment)
+        if mapped is None or len(mapped) < entry.offset + entry.length:
+            # Map again when the segment has grown since it was mapped
+            if mapped is not None:
+                mapped.close()
+            with open(os.path.join(self.path, entry.segment), "rb") as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[entry.segment] = mapped
+        return memoryview(mapped)[entry.offset : entry.offset + entry.length]
+
+    def read(self, entry: ArchiveEntry) -> bytes:
+        """Raw response body of entry"""
+        view = self._view(entry)
+        try:
+            return zlib.decompress(view)
+        finally:
+            view.release()
+
+    def read_json(self, entry: ArchiveEntry):
+        return json.loads(self.read(entry))
+
+    def scan(self, **filters) -> Iterator[Tuple[ArchiveEntry, bytes]]:
+        """Entries matching filters with their body, segment by segment for sequential reads"""
+        entries = sorted(self.find(**filters), key=lambda e: (e.segment, e.offset))
+        for entry in entries:
+            yield entry, self.read(entry)
+
+    def close(self) -> None:
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps = {}
@@ -0,0 +1,203 @@
+import logging, re
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from fitbit import endpoints, fitbit
+from .archive import Archive, ArchiveEntry
+
+TIME_WINDOW = r"(?:/time/(?P<start_time>\d{2}:\d{2})/(?P<end_time>\d{2}:\d{2}))?"
+DATE = r"(?P<{}>\d{{4}}-\d{{2}}-\d{{2}})"
+RANGE = DATE.format("start_date") + "/" + DATE.format("end_date")
+
+ACTIVITY_SUMMARY = ("Activity Minutes", "distance", "calories", "Total Steps")
+
+# url pattern, FitbitClient method and the measurements it produces
+REPLAYS = [
+    (
+        r"/1/user/-/activities/(?P<resource>calories|distance|steps|heart)/date/"
+        + DATE.format("date_str")
+        + r"/1d/1min"
+        + TIME_WINDOW,
+        "get_intraday_activity_by_date",
+        None,
+    ),
+    (
+        r"/1/user/-/activities/heart/date/"
+        + DATE.format("date_str")
+        + r"/1d/(?P<detail_level>1sec)"
+        + TIME_WINDOW,
+        "get_intraday_heart_rate_series_by_date",
+        ("HeartRate_Intraday",),
+    ),
+    (
+        r"/1/user/-/activities/heart/date/" + DATE.format("date_str") + r"/1d",
+        "get_intraday_heart_rate_by_date",
+        ("HR zones", "RestingHR"),
+    ),
+    (
+        r"/1.2/user/-/sleep/date/" + RANGE,
+        "get_sleep_log_by_interval",
+        ("Sleep Summary", "Sleep Levels"),
+    ),
+    # Every page of the sleep log list replays on its own, from the logs it holds
+    (
+        r"/1.2/user/-/sleep/list",
+        "sleep_log_points",
+        ("Sleep Summary", "Sleep Levels"),
+    ),
+    (r"/1/user/-/devices", "get_battery_level", ("DeviceBatteryLevel",)),
+    (
+        r"/1/user/-/activities/tracker/\w+/date/" + RANGE,
+        "get_activity_summary_by_interval",
+        ACTIVITY_SUMMARY,
+    ),
+]
+# Registered endpoints replay through their url template
+REPLAYS += [
+    (
+        re.escape(endpoint.url[len(endpoints.API) :].removesuffix(".json"))
+        .replace(re.escape("{start_date}"), DATE.format("start_date"))
+        .replace(re.escape("{end_date}"), DATE.format("end_date")),
+        endpoint.method,
+        (endpoint.measurement,),
+    )
+    for endpoint in endpoints.ENDPOINTS.values()
+]
+REPLAYS = [
+    (re.compile(pattern + r"\.json$"), method, measurements)
+    for pattern, method, measurements in REPLAYS
+]
+
+
+class ReplayCall(NamedTuple):
+    """A FitbitClient method call that can be rebuilt from archived responses"""
+
+    method: str
+    kwargs: Tuple[Tuple[str, object], ...]
+    measurements: Tuple[str, ...]
+
+
+class ReplayClient:
+    """Stands in for FitbitOauth2Client, serving archived responses instead of calling Fitbit
+
+    Requests for urls that aren't archived raise KeyError, which the
+    FitbitClient methods log and skip.
+    """
+
+    def __init__(self, responses: Optional[dict] = None):
+        self.responses = responses or {}
+
+    def make_request(self, url: str, *args, **kwargs):
+        return self.responses[url]
+
+
+def replay_call(url: str, resources: Dict[str, tuple]) -> Optional[ReplayCall]:
+    """The FitbitClient call that requested url, None for urls that can't be replayed
+
+    resources: resource tuples of the intraday activity sync by resource name
+    """
+    path = url.split("://", 1)[-1]
+    path = path[path.find("/") :].split("?", 1)[0]
+
+    for pattern, method, measurements in REPLAYS:
+        match = pattern.fullmatch(path)
+        if match is None:
+            continue
+
+        kwargs = {key: value for key, value in match.groupdict().items() if value}
+        if method == "sleep_log_points":
+            kwargs["url"] = url
+        if "resource" in kwargs:
+            resource = resources.get(kwargs.pop("resource"))
+            if resource is None:
+                return None
+            kwargs["measurement_list"] = [resource]
+            measurements = (resource[1],)
+
+        return ReplayCall(
+            method,
+            tuple(
+                (key, tuple(v) if isinstance(v, list) else v)
+                for key, v in sorted(kwargs.items())
+            ),
+            measurements,
+        )
+    return None
+
+
+def plan_replay(
+    archive: Archive,
+    resources: Dict[str, tuple],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    measurements: Optional[Iterable[str]] = None,
+) -> Dict[str, List[Tuple[ReplayCall, List[ArchiveEntry]]]]:
+    """Calls to replay per day, each with the archived responses it needs
+
+    Only the latest response per url is replayed, as later fetches of the
+    same url supersede earlier ones.
+    """
+    measurements = set(measurements or [])
+    latest = {}
+    for entry in archive.find(start_date=start_date, end_date=end_date):
+        if entry.url not in latest or entry.fetched_at >= latest[entry.url].fetched_at:
+            latest[entry.url] = entry
+
+    calls = defaultdict(list)
+    for entry in latest.values():
+        call = replay_call(entry.url, resources)
+        if call is None:
+            logging.debug(f"No replay for archived url {entry.url}")
+            continue
+        if measurements and not measurements.intersection(call.measurements):
+            continue
+        calls[call].append(entry)
+
+    # Within a day, calls run in fetch order, so later responses are written last
+    days = defaultdict(list)
+    for call, entries in sorted(
+        calls.items(), key=lambda item: max(entry.fetched_at for entry in item[1])
+    ):
+        days[min(entry.start_date for entry in entries)].append((call, entries))
+    return dict(sorted(days.items()))
+
+
+def replay_day(
+    archive_path: str,
+    calls: List[Tuple[ReplayCall, List[ArchiveEntry]]],
+    device_name: str = None,
+    measurements: Optional[Iterable[str]] = None,
+) -> list:
+    """Run the calls of one day against their archived responses
+
+    Returns what the FitbitClient methods returned: lists of points, or
+    frames for the series methods. Points of other measurements are left out.
+    """
+    measurements = set(measurements or [])
+    archive = Archive(archive_path)
+    client = ReplayClient()
+    fitbitClient = fitbit.FitbitClient(device_name=device_name, client=client)
+
+    results = []
+    try:
+        for call, entries in calls:
+            client.responses = {
+                entry.url: archive.read_json(entry) for entry in entries
+            }
+            kwargs = {
+                key: list(value) if key == "measurement_list" else value
+                for key, value in call.kwargs
+            }
+            if call.method == "sleep_log_points":
+                page = client.make_request(kwargs["url"])
+                result = fitbitClient.sleep_log_points(page.get("sleep") or [])
+            else:
+                result = getattr(fitbitClient, call.method)(**kwargs)
+            if isinstance(result, list) and measurements:
+                result = [
+                    point for point in result if point["measurement"] in measurements
+                ]
+            results.append(result)
+    finally:
+        archive.close()
+
+    return results
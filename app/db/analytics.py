@@ -0,0 +1,72 @@
+"""Rolling baselines over synced data, for notebooks
+
+client = InfluxDBClient(..., write_log=WriteLog(SyncState(path)))
+analytics.baseline(client, "hrv", "2024-01-01", "2024-07-01", "Europe/Berlin")
+"""
+
+from datetime import date, timedelta
+from typing import Iterable
+import pandas as pd
+
+# Daily metrics baselines are computed for, as measurement and field
+BASELINES = {
+    "hrv": ("HRV_Intraday", "dailyRmssd"),
+    "resting_hr": ("RestingHR", "value"),
+    "breathing_rate": ("BreathingRate", "value"),
+    "sleep_efficiency": ("Sleep Summary", "efficiency"),
+}
+
+
+def daily(frame: pd.DataFrame, field: str, timezone: str, how: str = "mean"):
+    """field aggregated per local day, as a Series indexed by day
+
+    Daily values are stored at local midnight, so days have to be taken in
+    the account's timezone rather than in UTC.
+    """
+    times = pd.to_datetime(frame["time"], utc=True).dt.tz_convert(timezone)
+    days = pd.DatetimeIndex(times.dt.date, name="day")
+    return frame[field].groupby(days).agg(how).astype(float)
+
+
+def rolling(series: pd.Series, windows: Iterable[int] = (7, 30), min_periods: int = 3):
+    """Mean, standard deviation and z-score of each day against the days before it
+
+    Windows are calendar days, so days without data shorten a window
+    instead of stretching it. A day is never part of its own baseline.
+
+    series: values indexed by day, as returned by daily
+    windows: baseline lengths in days
+    """
+    columns = {"value": series}
+    for window in windows:
+        past = series.rolling(f"{window}D", closed="left", min_periods=min_periods)
+        mean, std = past.mean(), past.std()
+        columns[f"mean_{window}d"] = mean
+        columns[f"std_{window}d"] = std
+        columns[f"zscore_{window}d"] = (series - mean) / std
+    return pd.DataFrame(columns)
+
+
+def baseline(
+    dbClient,
+    name: str,
+    start: str,
+    end: str,
+    timezone: str,
+    windows: Iterable[int] = (7, 30),
+) -> pd.DataFrame:
+    """Rolling baselines of a metric from BASELINES, for the days from start up to end
+
+    dbClient: InfluxDBClient, reads are served from its cache when it has one
+    start, end: ISO dates
+    timezone: timezone of the Fitbit account
+    """
+    measurement, field = BASELINES[name]
+    windows = list(windows)
+    # Read far enough back for the first day to have full windows
+    history = (date.fromisoformat(start) - timedelta(days=max(windows) + 1)).isoformat()
+    frame = dbClient.read(measurement, history, end, fields=[field])
+    if frame.empty:
+        return rolling(pd.Series(dtype=float, index=pd.DatetimeIndex([])), windows)
+    result = rolling(daily(frame, field, timezone), windows)
+    return result[result.index >= pd.Timestamp(start)]
@@ -0,0 +1,147 @@
+import hashlib, json, logging, os, time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+
+
+def month_of(time_value) -> str:
+    """UTC month (YYYY-MM) of a point time: ISO string in UTC, datetime or epoch seconds"""
+    if isinstance(time_value, str):
+        return time_value[:7]
+    if isinstance(time_value, datetime):
+        if time_value.tzinfo is not None:
+            time_value = time_value.astimezone(timezone.utc)
+        return time_value.strftime("%Y-%m")
+    return datetime.fromtimestamp(int(time_value), timezone.utc).strftime("%Y-%m")
+
+
+def months(start: str, end: str) -> Iterable[str]:
+    """Months from the one holding start to the one holding end"""
+    year, month = int(start[:4]), int(start[5:7])
+    last = (int(end[:4]), int(end[5:7]))
+    while (year, month) <= last:
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class WriteLog:
+    """When each month of each measurement was last written, the watermarks read caches check
+
+    Kept in the "written" section of a SyncState, so a notebook reading the
+    state file of a running sync sees what the sync wrote once it is saved.
+    Records are saved by save, once per sync step rather than per write.
+    """
+
+    SECTION = "written"
+
+    def __init__(self, state):
+        """state: SyncState, or anything with its section, save and reload methods"""
+        self.state = state
+        self.unsaved = False
+
+    def record(self, written: Iterable[Tuple[str, object]]) -> None:
+        """Mark (measurement, time) pairs as written now"""
+        keys = {measurement + "/" + month_of(time) for measurement, time in written}
+        if not keys:
+            return
+        now = time.time()
+        section = self.state.section(self.SECTION)
+        for key in keys:
+            section[key] = now
+        self.unsaved = True
+
+    def save(self) -> None:
+        """Save what was recorded since the last save"""
+        if self.unsaved:
+            self.state.save()
+            self.unsaved = False
+
+    def changed_since(
+        self, measurement: str, start: str, end: str, since: float
+    ) -> bool:
+        """Whether data of measurement from start to end was written after since (epoch seconds)"""
+        self.state.reload()
+        section = self.state.section(self.SECTION)
+        return any(
+            section.get(measurement + "/" + month, 0) > since
+            for month in months(start, end)
+        )
+
+
+class QueryCache:
+    """Query results as Arrow tables, dropped once the WriteLog shows their range was written
+
+    Entries are kept in memory, least recently used first out, and with a
+    directory also as Parquet files, so they outlive the process.
+    """
+
+    def __init__(
+        self, writeLog: WriteLog, directory: Optional[str] = None, max_entries: int = 64
+    ):
+        self.writeLog = writeLog
+        self.directory = directory
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(measurement: str, start: str, end: str, **options) -> str:
+        return hashlib.sha1(
+            json.dumps([measurement, start, end, options], sort_keys=True).encode()
+        ).hexdigest()
+
+    def get(self, key: str, measurement: str, start: str, end: str):
+        """Cached table, None when there is none or the range was written since"""
+        entry = self.entries.get(key)
+        if entry is None and self.directory:
+            entry = self._load(key)
+        if entry is not None:
+            cached_at, table = entry
+            if not self.writeLog.changed_since(measurement, start, end, cached_at):
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                self._evict()
+                self.hits += 1
+                return table
+            self.entries.pop(key, None)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, table, cached_at: float) -> None:
+        """Keep table as the result at cached_at, the time its query was sent"""
+        self.entries[key] = (cached_at, table)
+        self.entries.move_to_end(key)
+        self._evict()
+        if self.directory:
+            self._store(key, table, cached_at)
+
+    def _evict(self) -> None:
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".parquet")
+
+    def _load(self, key: str):
+        import pyarrow.parquet as pq
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = pq.read_table(path)
+        except OSError as err:
+            logging.error("Unable to read cached query %s: %s", path, err)
+            return None
+        return float(table.schema.metadata[b"cached_at"]), table
+
+    def _store(self, key: str, table, cached_at: float) -> None:
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.directory, exist_ok=True)
+        metadata = dict(table.schema.metadata or {}, cached_at=str(cached_at))
+        # Write to a temporary file first, so a crash never leaves half a file
+        tmp_path = self._path(key) + ".tmp"
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, self._path(key))
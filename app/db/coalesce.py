@@ -0,0 +1,27 @@
+from typing import Iterable, List
+
+
+def coalesce_points(points: Iterable[dict]) -> List[dict]:
+    """Merge points sharing measurement, tags and time into one point with all their fields
+
+    Points keep the position of the first point of their series and time.
+    When two points hold the same field, the later value wins, as it would
+    in InfluxDB. Points passed in are not modified.
+    """
+    merged = {}
+    copied = set()
+    for point in points:
+        key = (
+            point["measurement"],
+            tuple(sorted((point.get("tags") or {}).items())),
+            point["time"],
+        )
+        first = merged.get(key)
+        if first is None:
+            merged[key] = point
+            continue
+        if key not in copied:
+            first = merged[key] = dict(first, fields=dict(first["fields"]))
+            copied.add(key)
+        first["fields"].update(point["fields"])
+    return list(merged.values())
@@ -1,25 +1,121 @@
-from influxdb_client_3 import InfluxDBClient3, InfluxDBError, Point
-import logging
+from .cache import QueryCache, WriteLog
+from .coalesce import coalesce_points
+from .dead_letter import DeadLetter
+from .line_protocol import LineProtocolEncoder, measurement_and_time
+from .schema import SchemaCache
+from typing import Dict, List, Optional, Tuple
+import logging, time
+
+
+def _is_rejection(err: Exception) -> bool:
+    """Whether InfluxDB refused the data itself, rather than being unreachable"""
+    status = getattr(err, "status", None)
+    if status is None and getattr(err, "response", None) is not None:
+        status = err.response.status
+    return status in (400, 422)
+
+
+def encode_points(
+    points: list, schema: SchemaCache, encoder: LineProtocolEncoder = None
+) -> Tuple[bytes, List[tuple]]:
+    """Line protocol of points as write_points_to_influxdb writes them, and (point, reason) for the ones it can't
+
+    Needs no connection, so points can be encoded in worker processes and
+    written with InfluxDBClient.write_line_protocol.
+    """
+    accepted, rejected = schema.prepare(coalesce_points(points))
+    return (encoder or LineProtocolEncoder()).encode(accepted), rejected
+
+
+def _identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def select_sql(
+    measurement: str,
+    start: str,
+    end: str,
+    fields: Optional[List[str]] = None,
+    tags: Optional[Dict[str, str]] = None,
+) -> str:
+    """SQL reading measurement from start up to end, ordered by time"""
+    columns = ", ".join(["time"] + [_identifier(field) for field in fields or []])
+    conditions = [f"time >= {_literal(start)}", f"time < {_literal(end)}"] + [
+        f"{_identifier(tag)} = {_literal(value)}" for tag, value in (tags or {}).items()
+    ]
+    return (
+        f"SELECT {columns if fields else '*'} FROM {_identifier(measurement)}"
+        f" WHERE {' AND '.join(conditions)} ORDER BY time"
+    )
 
 
 class InfluxDBClient:
-    def __init__(self, host: str, token: str, org: str, database: str):
+    def __init__(
+        self,
+        host: str,
+        token: str,
+        org: str,
+        database: str,
+        dead_letter_path: str = None,
+        gzip: bool = False,
+        write_log: WriteLog = None,
+        query_cache_path: str = None,
+        timeout: int = 60_000,
+    ):
+        """write_log: marks what was written, enables the cache of read
+        query_cache_path: directory read results are kept in between runs, in memory when not given
+        timeout: milliseconds to wait for InfluxDB to answer a request
+        """
         self.host = host
         self.token = token
         self.org = org
         self.database = database
         self.verify_ssl: str = False
+        self.gzip = gzip
+        self.timeout = timeout
+        self.encoder = LineProtocolEncoder()
+        self.schema = SchemaCache()
+        self.deadLetter = DeadLetter(dead_letter_path)
+        self.writeLog = write_log
+        self.queryCache = (
+            QueryCache(write_log, directory=query_cache_path) if write_log else None
+        )
+        self._client = None
+
+    @property
+    def client(self):
+        """InfluxDBClient3, created on first use
+
+        influxdb_client_3 loads pyarrow and pandas, which takes longer than a
+        one-shot sync needs to send its first Fitbit request.
+        """
+        if self._client is None:
+            self._client = self._connect()
+        return self._client
+
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+
+    def _connect(self):
+        from influxdb_client_3 import InfluxDBClient3, InfluxDBError
 
         try:
-            self.client = InfluxDBClient3(
+            client = InfluxDBClient3(
                 host=self.host,
                 token=self.token,
                 org=self.org,
                 database=self.database,
                 verify_ssl=self.verify_ssl,
-                timeout=60000,
+                timeout=self.timeout,
+                enable_gzip=self.gzip,
             )
             logging.info("Successfully connected to influxdb database")
+            return client
 
         except InfluxDBError as err:
             logging.error("Unable to connect with influxdb database! Aborted")
@@ -28,21 +124,165 @@ class InfluxDBClient:
             logging.error("Unable to connect with influxdb database! Aborted")
             raise Exception("InfluxDB connection failed:" + str(err))
 
-    def write_points_to_influxdb(self, points) -> None:
-        try:
-            # influxdbclient.write_points(points)
-            self.client.write(record=points, write_precision="s")
+    def write_points_to_influxdb(self, points) -> bool:
+        """Write points, returning False when InfluxDB couldn't be reached for some of them
+
+        Points InfluxDB refuses are dead lettered, writing them again wouldn't help.
+        """
+        # One wide row per series and time instead of a row per field
+        accepted, rejected = self.schema.prepare(coalesce_points(points))
+        for point, reason in rejected:
+            self.deadLetter.add([point], reason)
+        return self._write_points(accepted)
+
+    def write_points(self, points: list) -> bool:
+        """Sink interface, see sink.Sink"""
+        return self.write_points_to_influxdb(points)
+
+    def write_frame(self, frame, measurement: str, tag_columns: list) -> bool:
+        """Sink interface, see sink.Sink"""
+        return self.write_dataframe_to_influxdb(frame, measurement, tag_columns)
 
-            # Dummy write to flush the buffer!??
-            point = (
-                Point("measurement").tag("location", "paris").field("temperature", 70)
+    def flush(self) -> None:
+        """Sink interface, saves the write log"""
+        if self.writeLog is not None:
+            self.writeLog.save()
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+
+    def write_line_protocol(self, body: bytes, rejected=()) -> bool:
+        """Write points encoded elsewhere, e.g. by encode_points in a worker process
+
+        body: line protocol at second precision
+        rejected: (point, reason) pairs encode_points left out, dead lettered here
+        """
+        for point, reason in rejected:
+            self.deadLetter.add([point], reason)
+        if not body:
+            return True
+        return self._write_batch(
+            body.decode().split("\n"),
+            lambda lines: "\n".join(lines).encode(),
+            self._wrote_lines,
+        )
+
+    def _write_points(self, points: list) -> bool:
+        # Encode once to line protocol instead of letting the client parse every dict
+        return self._write_batch(points, self.encoder.encode, self._wrote_points)
+
+    def _wrote_points(self, points: list) -> None:
+        self.schema.learn(points)
+        if self.writeLog is not None:
+            self.writeLog.record(
+                (point["measurement"], point["time"]) for point in points
             )
-            #### self.client.write(point)  # write synchronously
 
-            logging.info("Successfully updated influxdb database with new points")
-        except InfluxDBError as err:
-            logging.error("Unable to connect2 with influxdb database! " + str(err))
+    def _wrote_lines(self, lines: list) -> None:
+        if self.writeLog is not None:
+            self.writeLog.record(map(measurement_and_time, lines))
+
+    def _write_batch(self, batch: list, encode, learn) -> bool:
+        """Write a batch, bisecting batches InfluxDB rejects to isolate the points it can't take
+
+        batch: points, or lines of line protocol
+        encode: line protocol body of a batch
+        learn: called with batches InfluxDB accepted
+        Returns False when InfluxDB couldn't be reached for some of the batch
+        """
+        try:
+            body = encode(batch)
+            if not body:
+                return True
+            self.client.write(record=body, write_precision="s")
+            learn(batch)
 
+            logging.info("Successfully updated influxdb database with new points")
+            return True
         except Exception as err:
-            logging.error("Unable to connect2 with influxdb database! " + str(err))
-            logging.error(f"failing points: {points}")
+            if not _is_rejection(err):
+                # The caller keeps its progress and writes the batch again
+                logging.error("Unable to connect2 with influxdb database! %s", err)
+                return False
+            elif len(batch) == 1:
+                self.deadLetter.add(batch, str(err))
+                return True
+            else:
+                # Writes are idempotent, points of the good half are just written again
+                middle = len(batch) // 2
+                first = self._write_batch(batch[:middle], encode, learn)
+                return self._write_batch(batch[middle:], encode, learn) and first
+
+    def query(self, sql: str):
+        """Result of an SQL query as a pandas DataFrame"""
+        return self.client.query(sql, mode="pandas")
+
+    def read(
+        self,
+        measurement: str,
+        start: str,
+        end: str,
+        fields: Optional[List[str]] = None,
+        tags: Optional[Dict[str, str]] = None,
+        arrow: bool = False,
+    ):
+        """Points of measurement from start up to end, as a pandas DataFrame or an Arrow table
+
+        Results are cached while the write log shows nothing was written to
+        their months since.
+
+        start, end: dates or times in UTC, ISO formatted
+        fields: field columns to read, with time, all columns when not given
+        tags: tag values points must have
+        arrow: return a pyarrow Table instead of a DataFrame
+        """
+        key = QueryCache.key(measurement, start, end, fields=fields, tags=tags)
+        table = None
+        if self.queryCache is not None:
+            table = self.queryCache.get(key, measurement, start, end)
+        if table is None:
+            sent_at = time.time()
+            table = self.client.query(
+                select_sql(measurement, start, end, fields, tags), mode="all"
+            )
+            if self.queryCache is not None:
+                self.queryCache.put(key, table, sent_at)
+        return table if arrow else table.to_pandas()
+
+    def write_dataframe_to_influxdb(
+        self, frame, measurement: str, tag_columns: list, batch_size: int = 50_000
+    ) -> bool:
+        """Write a frame column by column, batch_size rows per request
+
+        frame: pandas DataFrame with a time column, tag columns and field columns
+        measurement: measurement to write to
+        tag_columns: columns written as tags, the remaining columns are fields
+        Returns False when some rows couldn't be written
+        """
+        written = True
+        for start in range(0, len(frame), batch_size):
+            batch = frame.iloc[start : start + batch_size]
+            try:
+                self.client.write(
+                    record=batch,
+                    data_frame_measurement_name=measurement,
+                    data_frame_tag_columns=tag_columns,
+                    data_frame_timestamp_column="time",
+                    write_precision="s",
+                )
+                logging.info(
+                    f"Successfully updated influxdb database with {len(batch)} {measurement} rows"
+                )
+                if self.writeLog is not None:
+                    self.writeLog.record(
+                        (measurement, month)
+                        for month in batch["time"].dt.strftime("%Y-%m").unique()
+                    )
+            except Exception as err:
+                logging.error(
+                    f"Unable to write {len(batch)} {measurement} rows to influxdb database! "
+                    + str(err)
+                )
+                written = False
+        return written
@@ -0,0 +1,37 @@
+import json, logging, threading, time
+from typing import Iterable, Optional
+from .summary import PointSummary
+
+
+class DeadLetter:
+    """Points InfluxDB rejected, appended to a JSON lines file with the reason
+
+    Each line holds rejected_at (epoch seconds), reason and the point, or its
+    line of line protocol for points encoded elsewhere, so rejected points can
+    be fixed and written again. Without a path the points
+    are only logged.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def add(self, points: Iterable[dict], reason: str) -> None:
+        points = list(points)
+        if not points:
+            return
+        logging.error("Rejected %d points: %s", len(points), reason)
+        if not self.path:
+            logging.error("failing points: %s", PointSummary(points))
+            return
+
+        rejected_at = time.time()
+        with self._lock, open(self.path, "a") as file:
+            for point in points:
+                file.write(
+                    json.dumps(
+                        {"rejected_at": rejected_at, "reason": reason, "point": point},
+                        default=str,
+                    )
+                    + "\n"
+                )
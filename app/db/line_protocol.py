@@ -0,0 +1,132 @@
+import math, re
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+_ESCAPE_MEASUREMENT = str.maketrans(
+    {",": r"\,", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+_ESCAPE_KEY = str.maketrans(
+    {",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+_ESCAPE_STRING = str.maketrans({'"': r"\"", "\\": r"\\"})
+_MEASUREMENT = re.compile(r"(?:[^,\\ ]|\\.)*")
+
+
+def to_epoch_seconds(time) -> int:
+    """Epoch seconds of an ISO time string, datetime or number"""
+    if isinstance(time, str):
+        return int(datetime.fromisoformat(time).timestamp())
+    if isinstance(time, datetime):
+        return int(time.timestamp())
+    return int(time)
+
+
+def measurement_and_time(line: str) -> Tuple[str, int]:
+    """Measurement and timestamp of a line LineProtocolEncoder wrote"""
+    measurement = _MEASUREMENT.match(line).group()
+    return re.sub(r"\\(.)", r"\1", measurement), int(line.rsplit(" ", 1)[1])
+
+
+def format_field_value(value) -> Optional[str]:
+    """Line protocol representation of a field value, None when it can't be written"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        text = repr(value)
+        return text[:-2] if text.endswith(".0") else text
+    if isinstance(value, str):
+        return '"' + value.translate(_ESCAPE_STRING) + '"'
+    if hasattr(value, "item"):
+        # numpy scalars
+        return format_field_value(value.item())
+    raise ValueError(f'Type: "{type(value)}" of field value is not supported.')
+
+
+class LineProtocolEncoder:
+    """Encodes points to line protocol at second precision
+
+    Escaped measurement and tag sets, field keys and parsed timestamps are
+    cached across calls, and lines are built in one reused buffer.
+    """
+
+    def __init__(self, cache_size: int = 100_000):
+        self.cache_size = cache_size
+        self.buffer = bytearray()
+        self._series = {}
+        self._field_keys = {}
+        self._times = {}
+
+    def _series_key(self, measurement: str, tags: Tuple) -> bytes:
+        key = (measurement, tags)
+        series = self._series.get(key)
+        if series is None:
+            parts = [measurement.translate(_ESCAPE_MEASUREMENT)]
+            for tag_key, tag_value in tags:
+                if tag_value is None:
+                    continue
+                tag_value = str(tag_value).translate(_ESCAPE_KEY)
+                if tag_value.endswith("\\"):
+                    tag_value += " "
+                if tag_key != "" and tag_value != "":
+                    parts.append(str(tag_key).translate(_ESCAPE_KEY) + "=" + tag_value)
+            series = (",".join(parts) + " ").encode()
+            if len(self._series) < self.cache_size:
+                self._series[key] = series
+        return series
+
+    def _field_key(self, key: str) -> str:
+        escaped = self._field_keys.get(key)
+        if escaped is None:
+            escaped = self._field_keys[key] = str(key).translate(_ESCAPE_KEY) + "="
+        return escaped
+
+    def _timestamp(self, time) -> int:
+        if not isinstance(time, str):
+            return to_epoch_seconds(time)
+        timestamp = self._times.get(time)
+        if timestamp is None:
+            timestamp = to_epoch_seconds(time)
+            if len(self._times) >= self.cache_size:
+                self._times.clear()
+            self._times[time] = timestamp
+        return timestamp
+
+    def encode_line(self, point: dict) -> Optional[bytes]:
+        """One line without the newline, None when the point has no writable field"""
+        measurement = point["measurement"]
+        tags = tuple(sorted((point.get("tags") or {}).items()))
+        fields = sorted(point["fields"].items())
+        timestamp = self._timestamp(point["time"])
+
+        field_set = []
+        for key, value in fields:
+            value = format_field_value(value)
+            if value is not None:
+                field_set.append(self._field_key(key) + value)
+        if not field_set:
+            return None
+
+        return b"%s%s %d" % (
+            self._series_key(measurement, tags),
+            ",".join(field_set).encode(),
+            timestamp,
+        )
+
+    def encode(self, points: Iterable) -> bytes:
+        """Line protocol body for points, points without writable fields are left out"""
+        buffer = self.buffer
+        del buffer[:]
+        for point in points:
+            line = self.encode_line(point)
+            if line is None:
+                continue
+            if buffer:
+                buffer += b"\n"
+            buffer += line
+        return bytes(buffer)
@@ -0,0 +1,85 @@
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from .coalesce import coalesce_points
+from .line_protocol import to_epoch_seconds
+from .schema import field_type
+from .sink import Sink
+
+
+class ParquetSink(Sink):
+    """Points as Parquet files, partitioned by measurement and UTC date
+
+    Each write adds files under measurement=<name>/date=<YYYY-MM-DD>/ of
+    the root directory, with a time column (UTC), a column per tag and one
+    per field. Files are never rewritten, so points written again show up
+    again, readers drop duplicates of a series and time.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def write_points(self, points: list) -> bool:
+        import pyarrow as pa
+
+        rows = defaultdict(list)
+        for point in coalesce_points(points):
+            fields = {
+                key: value
+                for key, value in point["fields"].items()
+                if field_type(value) is not None
+            }
+            if fields:
+                rows[point["measurement"]].append(
+                    {
+                        "measurement": point["measurement"],
+                        "time": datetime.fromtimestamp(
+                            to_epoch_seconds(point["time"]), timezone.utc
+                        ),
+                        **{
+                            key: str(value)
+                            for key, value in (point.get("tags") or {}).items()
+                            if value is not None
+                        },
+                        **fields,
+                    }
+                )
+        # One table per measurement, so files only hold their own columns.
+        # Columns are the keys of every row, points may carry different fields
+        for measurement_rows in rows.values():
+            columns = dict.fromkeys(key for row in measurement_rows for key in row)
+            self._write(
+                pa.table(
+                    {
+                        column: [row.get(column) for row in measurement_rows]
+                        for column in columns
+                    }
+                )
+            )
+        return True
+
+    def write_frame(self, frame, measurement: str, tag_columns: list) -> bool:
+        import pyarrow as pa
+
+        if len(frame):
+            frame = frame.assign(measurement=measurement)
+            self._write(pa.Table.from_pandas(frame, preserve_index=False))
+        return True
+
+    def _write(self, table) -> None:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        times = table["time"].cast(pa.timestamp("s", tz="UTC"))
+        table = table.set_column(table.schema.get_field_index("time"), "time", times)
+        table = table.append_column("date", pc.strftime(times, format="%Y-%m-%d"))
+        ds.write_dataset(
+            table,
+            self.root,
+            format="parquet",
+            partitioning=["measurement", "date"],
+            partitioning_flavor="hive",
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
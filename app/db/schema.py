@@ -0,0 +1,81 @@
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def field_type(value) -> Optional[str]:
+    """InfluxDB type of a field value, None for values that can't be written"""
+    if hasattr(value, "item"):
+        # numpy scalars
+        value = value.item()
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "float" if math.isfinite(value) else None
+    if isinstance(value, str):
+        return "string"
+    return None
+
+
+class SchemaCache:
+    """Field types per measurement, learnt from points InfluxDB accepted
+
+    Points are checked against it before they are written: fields without a
+    writable value are dropped, integers and floats are converted to the type
+    the measurement already has, and other type conflicts are rejected up
+    front instead of failing the batch they are in.
+    """
+
+    def __init__(self, types: Optional[Dict[str, Dict[str, str]]] = None):
+        """types: field types per measurement known already, e.g. in another process"""
+        self.types: Dict[str, Dict[str, str]] = types or {}
+
+    def check(self, point: dict) -> Tuple[Optional[dict], Optional[str]]:
+        """The point fitted to the known schema, or None and the reason it can't be written"""
+        known = self.types.get(point["measurement"], {})
+        fields = {}
+        changed = False
+        for key, value in point["fields"].items():
+            kind = field_type(value)
+            if kind is None:
+                changed = True
+                continue
+            expected = known.get(key, kind)
+            if expected == "float" and kind == "integer":
+                value, changed = float(value), True
+            elif expected == "integer" and kind == "float" and value.is_integer():
+                value, changed = int(value), True
+            elif expected != kind:
+                return None, (
+                    f'field "{key}" is {kind}, '
+                    f'{point["measurement"]} has it as {expected}'
+                )
+            fields[key] = value
+
+        if not fields:
+            return None, "no writable fields"
+        if changed:
+            point = dict(point, fields=fields)
+        return point, None
+
+    def prepare(self, points: Iterable[dict]) -> Tuple[List[dict], List[tuple]]:
+        """Points that can be written, and (point, reason) for the ones that can't"""
+        accepted, rejected = [], []
+        for point in points:
+            checked, reason = self.check(point)
+            if checked is None:
+                rejected.append((point, reason))
+            else:
+                accepted.append(checked)
+        return accepted, rejected
+
+    def learn(self, points: Iterable[dict]) -> None:
+        """Remember field types of points InfluxDB accepted"""
+        for point in points:
+            known = self.types.setdefault(point["measurement"], {})
+            for key, value in point["fields"].items():
+                if key not in known:
+                    kind = field_type(value)
+                    if kind is not None:
+                        known[key] = kind
@@ -0,0 +1,82 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import List
+
+
+class Sink(ABC):
+    """Where the Syncronizer writes points to
+
+    InfluxDBClient is one, SQLiteSink and ParquetSink keep points locally.
+    """
+
+    @abstractmethod
+    def write_points(self, points: list) -> bool:
+        """Write points as dicts with measurement, time, tags and fields
+
+        Returns False when some points weren't written, so the sync progress
+        they carry is not kept and they are fetched again.
+        """
+
+    @abstractmethod
+    def write_frame(self, frame, measurement: str, tag_columns: list) -> bool:
+        """Write a pandas DataFrame with a time column, tag columns and field columns, see write_points"""
+
+    def flush(self) -> None:
+        """Make what was written visible to other processes, called after every sync step"""
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FanOutSink(Sink):
+    """Writes to every sink, a failing sink doesn't keep the others from being written"""
+
+    def __init__(self, sinks: List[Sink]):
+        self.sinks = sinks
+
+    def write_points(self, points: list) -> bool:
+        written = True
+        for sink in self.sinks:
+            try:
+                written &= sink.write_points(points) is not False
+            except Exception as err:
+                logging.error("Writing to %s failed: %s", type(sink).__name__, err)
+                written = False
+        return written
+
+    def write_frame(self, frame, measurement: str, tag_columns: list) -> bool:
+        written = True
+        for sink in self.sinks:
+            try:
+                written &= (
+                    sink.write_frame(frame, measurement, tag_columns) is not False
+                )
+            except Exception as err:
+                logging.error("Writing to %s failed: %s", type(sink).__name__, err)
+                written = False
+        return written
+
+    def flush(self) -> None:
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+class NullSink(Sink):
+    """Counts what it is given without keeping it, to run or benchmark syncs without a database"""
+
+    def __init__(self):
+        self.points = 0
+        self.rows = 0
+
+    def write_points(self, points: list) -> bool:
+        self.points += len(points)
+        return True
+
+    def write_frame(self, frame, measurement: str, tag_columns: list) -> bool:
+        self.rows += len(frame)
+        return True
@@ -0,0 +1,94 @@
+import json, sqlite3, threading
+from typing import Iterator, Tuple
+from .line_protocol import to_epoch_seconds
+from .schema import field_type
+from .sink import Sink
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    measurement TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    tags TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value,
+    PRIMARY KEY (measurement, tags, field, time)
+) WITHOUT ROWID
+"""
+
+INSERT = "INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?)"
+
+
+def _tags(tags) -> str:
+    return json.dumps(
+        {key: str(value) for key, value in tags if value is not None},
+        sort_keys=True,
+    )
+
+
+class SQLiteSink(Sink):
+    """Points in one SQLite table, a row per field of a point
+
+    Rows are keyed by measurement, tags, field and time (epoch seconds), so
+    writing a point again replaces it as it would in InfluxDB. Tags are
+    stored as a JSON object. Batches are inserted with executemany in one
+    transaction, with the database in WAL mode so it can be read while the
+    sync writes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps the database consistent without syncing every commit
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+
+    def _point_rows(self, points: list) -> Iterator[Tuple]:
+        times, series = {}, {}
+        for point in points:
+            time = times.get(point["time"])
+            if time is None:
+                time = times[point["time"]] = to_epoch_seconds(point["time"])
+            tags = tuple(sorted((point.get("tags") or {}).items()))
+            tag_text = series.get(tags)
+            if tag_text is None:
+                tag_text = series[tags] = _tags(tags)
+            for field, value in point["fields"].items():
+                if field_type(value) is not None:
+                    yield point["measurement"], time, tag_text, field, value
+
+    def _frame_rows(
+        self, frame, measurement: str, tag_columns: list
+    ) -> Iterator[Tuple]:
+        fields = [
+            column
+            for column in frame.columns
+            if column != "time" and column not in tag_columns
+        ]
+        groups = (
+            frame.groupby(tag_columns, sort=False) if tag_columns else [((), frame)]
+        )
+        for key, group in groups:
+            key = key if isinstance(key, tuple) else (key,)
+            tag_text = _tags(zip(tag_columns, key))
+            times = group["time"].dt.as_unit("s").astype("int64").tolist()
+            for field in fields:
+                for time, value in zip(times, group[field].tolist()):
+                    if field_type(value) is not None:
+                        yield measurement, time, tag_text, field, value
+
+    def _insert(self, rows: Iterator[Tuple]) -> None:
+        with self._lock, self.connection:
+            self.connection.executemany(INSERT, rows)
+
+    def write_points(self, points: list) -> bool:
+        self._insert(self._point_rows(points))
+        return True
+
+    def write_frame(self, frame, measurement: str, tag_columns: list) -> bool:
+        self._insert(self._frame_rows(frame, measurement, tag_columns))
+        return True
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,35 @@
+from collections import Counter
+from .line_protocol import measurement_and_time
+
+
+def _measurement_and_time(point) -> tuple:
+    if isinstance(point, str):
+        measurement, timestamp = measurement_and_time(point)
+        return measurement, str(timestamp)
+    return point.get("measurement"), str(point.get("time"))
+
+
+class PointSummary:
+    """Points as counts per measurement, time range and a few samples
+
+    Points are dicts, or lines of line protocol.
+
+    Built when a record is formatted, so a month of points costs nothing
+    unless the message is actually written.
+    """
+
+    def __init__(self, points, samples: int = 2):
+        self.points = points
+        self.samples = samples
+
+    def __str__(self) -> str:
+        points = list(self.points)
+        if not points:
+            return "no points"
+        measurements, times = zip(*map(_measurement_and_time, points))
+        counts = Counter(measurements)
+        return (
+            f"{len(points)} points ("
+            + ", ".join(f"{name}: {count}" for name, count in counts.most_common())
+            + f") from {min(times)} to {max(times)}, e.g. {points[: self.samples]}"
+        )
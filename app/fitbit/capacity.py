@@ -0,0 +1,195 @@
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from .latency import LatencyTracker
+from .retry import RequestDeferred
+from .scheduler import Priority, RequestScheduler
+
+# Requests per hour Fitbit serves a user of an app, more are answered with 429
+FITBIT_LIMIT = 150
+
+# A step of a sync, a url or the urls retried together once one is deferred
+Step = Union[str, List[str]]
+
+
+class Costs:
+    """Latency and response size of a url, as recorded by LatencyTracker.summary in real runs
+
+    Urls of an endpoint and range size never recorded take the recording of
+    the endpoint's closest range size, or seconds and size when the endpoint
+    was never recorded at all.
+    """
+
+    def __init__(
+        self, recorded: Optional[Dict[str, dict]] = None, seconds=1.0, size=20_000
+    ):
+        self.seconds = seconds
+        self.size = size
+        self.recorded: Dict[str, Dict[int, dict]] = {}
+        for key, stats in (recorded or {}).items():
+            endpoint, days = key.rsplit(" ", 1)
+            self.recorded.setdefault(endpoint, {})[int(days.rstrip("d"))] = stats
+
+    def __call__(self, url: str) -> Tuple[float, int]:
+        endpoint, days = LatencyTracker.key(url)
+        sizes = self.recorded.get(endpoint)
+        if not sizes:
+            return self.seconds, self.size
+        stats = sizes[min(sizes, key=lambda recorded: abs(recorded - days))]
+        return stats["p50"], int(stats["bytes"])
+
+
+class Projection(NamedTuple):
+    """Fitbit load of a sync configuration, per account unless noted
+
+    requests_per_hour: requests the live and daily syncs ask for, by priority name
+    served_per_hour: requests the scheduler let through, retries and backfill included
+    deferred: steps waiting for quota at the end of the first day
+    deferred_per_hour: live and daily steps deferred an hour once the sync is running, by priority name
+    falling_behind: whether live or daily steps are routinely deferred
+    cycle_seconds: time spent in Fitbit requests per cycle
+    bytes_per_hour: response bytes per hour, of all accounts
+    backfill_requests: requests the backfill needs
+    backfill_hours: hours until the backfill completes, None when it doesn't within the horizon
+    warnings: what will make requests fail or fall behind
+    """
+
+    requests_per_hour: Dict[str, float]
+    served_per_hour: float
+    deferred: int
+    deferred_per_hour: Dict[str, float]
+    falling_behind: bool
+    cycle_seconds: float
+    bytes_per_hour: float
+    backfill_requests: int
+    backfill_hours: Optional[float]
+    warnings: List[str]
+
+
+def project(
+    live_steps: List[Step],
+    daily_steps: List[Step],
+    backfill_urls: List[str] = (),
+    cadence_minutes: int = 10,
+    limit: int = FITBIT_LIMIT,
+    accounts: int = 1,
+    costs: Optional[Costs] = None,
+    horizon_hours: int = 24 * 365,
+) -> Projection:
+    """Run the steps of every cycle and the requests of the backfill through a RequestScheduler on a simulated clock
+
+    Steps are deferred and retried whole, like the retry queue does, and a
+    step already waiting is only queued once. Retries run before the
+    cycle's own steps, which request the same urls again.
+
+    live_steps, daily_steps: steps the live and daily syncs run every cycle
+    backfill_urls: urls the backfill requests, in order
+    cadence_minutes: minutes between cycles
+    limit: hourly quota the scheduler shares, FITBIT_RATE_LIMIT_PER_HOUR
+    accounts: accounts synced alike, each with its own Fitbit quota
+    costs: latency and size of a url, defaults for every url when not given
+    horizon_hours: simulated hours to wait for the backfill to complete
+    """
+    costs = costs or Costs()
+    live_steps = [[step] if isinstance(step, str) else step for step in live_steps]
+    daily_steps = [[step] if isinstance(step, str) else step for step in daily_steps]
+    cycles_per_hour = 60 / cadence_minutes
+    now = [0.0]
+    scheduler = RequestScheduler(limit=limit, clock=lambda: now[0])
+    backfill = deque(backfill_urls)
+    pending: Dict[Tuple[Priority, Tuple[str, ...]], List[str]] = {}
+    served: List[str] = []
+    deferrals = {"LIVE": 0, "DAILY": 0}
+    backfill_hours = None
+
+    def run(priority: Priority, step: List[str], counted: bool) -> None:
+        with scheduler.use(priority):
+            for url in step:
+                try:
+                    scheduler.acquire(url)
+                except RequestDeferred:
+                    pending[(priority, tuple(step))] = step
+                    if counted:
+                        deferrals[priority.name] += 1
+                    return
+                served.append(url)
+
+    day = int(24 * cycles_per_hour)
+    cycle = 0
+    while cycle < max(horizon_hours, 24) * cycles_per_hour:
+        # Deferrals are counted over the second half of the first day, once the sync runs steadily
+        counted = day // 2 <= cycle < day
+        # Retries run before the cycle's own steps, like the minutely retry job
+        retries = list(pending.items())
+        pending.clear()
+        for (priority, _), step in retries:
+            run(priority, step, counted)
+        for step in live_steps:
+            run(Priority.LIVE, step, counted)
+        for step in daily_steps:
+            run(Priority.DAILY, step, counted)
+        with scheduler.use(Priority.BACKFILL):
+            while backfill and scheduler.available():
+                scheduler.acquire(backfill[0])
+                served.append(backfill.popleft())
+
+        cycle += 1
+        now[0] = cycle * cadence_minutes * 60
+        if cycle == day:
+            deferred = len(pending)
+            served_per_hour = len(served) / 24
+            bytes_per_hour = accounts * sum(costs(url)[1] for url in served) / 24
+        if backfill_urls and not backfill and backfill_hours is None:
+            backfill_hours = now[0] / 3600
+        # Backfill gets no quota while live and daily steps are deferred, no need to wait for it
+        if cycle >= day and (
+            backfill_hours is not None or not backfill_urls or any(deferrals.values())
+        ):
+            break
+
+    deferred_per_hour = {name: count / 12 for name, count in deferrals.items()}
+    live_urls = [url for step in live_steps for url in step]
+    daily_urls = [url for step in daily_steps for url in step]
+    requests_per_hour = {
+        "LIVE": len(live_urls) * cycles_per_hour,
+        "DAILY": len(daily_urls) * cycles_per_hour,
+    }
+    cycle_seconds = sum(costs(url)[0] for url in live_urls + daily_urls)
+
+    warnings = []
+    if limit > FITBIT_LIMIT:
+        warnings.append(
+            f"FITBIT_RATE_LIMIT_PER_HOUR {limit} is above the {FITBIT_LIMIT} requests "
+            f"Fitbit serves an hour, requests past those get 429s"
+        )
+    if sum(requests_per_hour.values()) > limit:
+        warnings.append(
+            f"Live and daily syncs ask for {sum(requests_per_hour.values()):.0f} requests "
+            f"an hour, above the limit of {limit}"
+        )
+    falling_behind = any(deferred_per_hour.values())
+    if falling_behind:
+        warnings.append(
+            f"{deferred_per_hour['LIVE']:.1f} live and {deferred_per_hour['DAILY']:.1f} "
+            f"daily steps are deferred an hour, {deferred} steps are waiting for "
+            f"quota after a day, syncs fall behind"
+        )
+    if backfill_urls and backfill_hours is None and not falling_behind:
+        warnings.append(f"Backfill doesn't complete within {horizon_hours} hours")
+    if cycle_seconds > cadence_minutes * 60:
+        warnings.append(
+            f"A cycle takes {cycle_seconds:.0f} seconds, longer than the "
+            f"{cadence_minutes} minutes between cycles"
+        )
+
+    return Projection(
+        requests_per_hour=requests_per_hour,
+        served_per_hour=served_per_hour,
+        deferred=deferred,
+        deferred_per_hour=deferred_per_hour,
+        falling_behind=falling_behind,
+        cycle_seconds=cycle_seconds,
+        bytes_per_hour=bytes_per_hour,
+        backfill_requests=len(backfill_urls),
+        backfill_hours=backfill_hours,
+        warnings=warnings,
+    )
@@ -0,0 +1,206 @@
+import logging
+from datetime import date, datetime, timedelta
+from functools import reduce
+from itertools import chain
+from operator import itemgetter
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import pytz
+
+API = "https://api.fitbit.com"
+
+
+class Endpoint(NamedTuple):
+    """A Fitbit endpoint and how its response becomes points
+
+    method: FitbitClient method serving the endpoint
+    url: url template, filled in with start_date and end_date
+    max_days: longest date range Fitbit serves in one request
+    scope: OAuth scope the endpoint needs
+    path: keys from the response to the list of records
+    nested: key of a list of records within each record, for responses grouped by day
+    measurement: measurement the points are written to
+    fields: field name to key path in a record, or to (key path, convert)
+    time: key paths of the parts of a record's local time, joined by "T"
+    tags: tag name to key path in a record, the Device tag is the device name when not given
+    """
+
+    method: str
+    url: str
+    max_days: int
+    scope: str
+    path: Tuple[str, ...]
+    measurement: str
+    fields: Dict[str, object]
+    time: Tuple[Tuple[str, ...], ...] = (("dateTime",),)
+    tags: Optional[Dict[str, Tuple[str, ...]]] = None
+    nested: Optional[str] = None
+
+
+def vo2_max(index: int) -> Callable[[str], int]:
+    """Low (0) or high (1) end of a "40-44" VO2 max range, the value itself when it is no range"""
+
+    def convert(value: str) -> int:
+        bounds = value.split("-")
+        return int(bounds[min(index, len(bounds) - 1)])
+
+    return convert
+
+
+ENDPOINTS = {
+    endpoint.method: endpoint
+    for endpoint in [
+        Endpoint(
+            method="get_intraday_hrv_by_interval",
+            url=API + "/1/user/-/hrv/date/{start_date}/{end_date}.json",
+            max_days=30,
+            scope="heartrate",
+            path=("hrv",),
+            measurement="HRV_Intraday",
+            fields={
+                "dailyRmssd": ("value", "dailyRmssd"),
+                "deepRmssd": ("value", "deepRmssd"),
+            },
+        ),
+        Endpoint(
+            method="get_body_data_by_interval",
+            url=API + "/1/user/-/body/log/weight/date/{start_date}/{end_date}.json",
+            max_days=31,
+            scope="weight",
+            path=("weight",),
+            measurement="Body",
+            fields={"bmi": ("bmi",), "weight": ("weight",)},
+            time=(("date",), ("time",)),
+            tags={"Device": ("source",)},
+        ),
+        Endpoint(
+            method="get_temperature_skin_by_interval",
+            url=API + "/1/user/-/temp/skin/date/{start_date}/{end_date}.json",
+            max_days=30,
+            scope="temperature",
+            path=("tempSkin",),
+            measurement="TempSkin",
+            fields={"temp": ("value", "nightlyRelative")},
+        ),
+        Endpoint(
+            method="get_vo2max_cardio_score_by_interval",
+            url=API + "/1/user/-/cardioscore/date/{start_date}/{end_date}.json",
+            max_days=30,
+            scope="cardio_fitness",
+            path=("cardioScore",),
+            measurement="CardioScore",
+            fields={
+                "vo2Low": (("value", "vo2Max"), vo2_max(0)),
+                "vo2High": (("value", "vo2Max"), vo2_max(1)),
+            },
+        ),
+        Endpoint(
+            method="get_breathing_rate_by_interval",
+            url=API + "/1/user/-/br/date/{start_date}/{end_date}.json",
+            max_days=30,
+            scope="respiratory_rate",
+            path=("br",),
+            measurement="BreathingRate",
+            fields={"value": ("value", "breathingRate")},
+        ),
+        Endpoint(
+            method="get_spo2_by_interval",
+            url=API + "/1/user/-/spo2/date/{start_date}/{end_date}/all.json",
+            max_days=30,
+            scope="oxygen_saturation",
+            path=(),
+            nested="minutes",
+            measurement="SPO2_Intraday",
+            fields={"value": (("value",), float)},
+            time=(("minute",),),
+        ),
+        Endpoint(
+            method="get_spo2_summary_by_interval",
+            url=API + "/1/user/-/spo2/date/{start_date}/{end_date}.json",
+            max_days=30,
+            scope="oxygen_saturation",
+            path=(),
+            measurement="SPO2",
+            fields={
+                "avg": ("value", "avg"),
+                "max": ("value", "max"),
+                "min": ("value", "min"),
+            },
+        ),
+    ]
+}
+
+
+def getter(path: Tuple[str, ...]) -> Callable:
+    """Function walking path into nested dicts and lists, built from itemgetters"""
+    if not path:
+        return lambda value: value
+    if len(path) == 1:
+        return itemgetter(path[0])
+    getters = [itemgetter(key) for key in path]
+    return lambda value: reduce(lambda inner, get: get(inner), getters, value)
+
+
+def date_ranges(
+    start_date: str, end_date: str, max_days: int
+) -> Iterator[Tuple[str, str]]:
+    """start_date to end_date cut into ranges of at most max_days"""
+    start = date.fromisoformat(start_date)
+    last = date.fromisoformat(end_date)
+    while start <= last:
+        end = min(start + timedelta(days=max_days - 1), last)
+        yield start.isoformat(), end.isoformat()
+        start = end + timedelta(days=1)
+
+
+class Extractor:
+    """Points of an endpoint's response, with every key path compiled once"""
+
+    def __init__(self, endpoint: Endpoint, device_name: str, timezone):
+        self.endpoint = endpoint
+        self.timezone = timezone
+        self.records = getter(endpoint.path)
+        self.nested = itemgetter(endpoint.nested) if endpoint.nested else None
+        self.time = [getter(path) for path in endpoint.time]
+
+        self.fields = []
+        for name, spec in endpoint.fields.items():
+            if isinstance(spec[0], tuple):
+                path, convert = spec
+            else:
+                path, convert = spec, None
+            self.fields.append((name, getter(path), convert))
+
+        self.tags = {"Device": lambda record: device_name}
+        if endpoint.tags is not None:
+            self.tags = {tag: getter(path) for tag, path in endpoint.tags.items()}
+
+    def __call__(self, response) -> List[dict]:
+        records = self.records(response)
+        if records is None:
+            return []
+        if self.nested is not None:
+            records = chain.from_iterable(self.nested(record) for record in records)
+
+        points = []
+        for record in records:
+            try:
+                points.append(self.point(record))
+            except (KeyError, IndexError, ValueError) as e:
+                logging.error(
+                    f"Skipping {self.endpoint.measurement} record {record}: {e!r}"
+                )
+        return points
+
+    def point(self, record: dict) -> dict:
+        local_time = datetime.fromisoformat("T".join(get(record) for get in self.time))
+        fields = {}
+        for name, get, convert in self.fields:
+            value = get(record)
+            fields[name] = convert(value) if convert else value
+
+        return {
+            "measurement": self.endpoint.measurement,
+            "time": self.timezone.localize(local_time).astimezone(pytz.utc).isoformat(),
+            "tags": {tag: get(record) for tag, get in self.tags.items()},
+            "fields": fields,
+        }
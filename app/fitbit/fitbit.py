@@ -1,22 +1,146 @@
 from dataclasses import dataclass, field
-from typing import Any, Dict, Optional
-from dotenv import load_dotenv
-import os, base64, json, time, json, pytz, logging
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, List, Optional
+import os, base64, hashlib, json, time, json, pytz, logging
 import requests
 from datetime import datetime, timedelta
 import logging
 import urllib3
+from . import endpoints, latency, retry, scheduler
 
 # Disable warnings - risky buisness
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# Load environment variables
-load_dotenv()
-
-LOCAL_TIMEZONE = pytz.timezone(os.environ.get("FITBIT_LOCAL_TIMEZONE"))
 REQUEST_TIMEOUT = 30
 
 
+@lru_cache(maxsize=None)
+def local_timezone():
+    """Timezone of the Fitbit account, from FITBIT_LOCAL_TIMEZONE"""
+    return pytz.timezone(os.environ.get("FITBIT_LOCAL_TIMEZONE"))
+
+
+def __getattr__(name: str):
+    # Resolved on first use, after the entrypoint loaded the environment
+    if name == "LOCAL_TIMEZONE":
+        return local_timezone()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+DEVICES_URL = "https://api.fitbit.com/1/user/-/devices.json"
+
+# Activity summary metrics, each with a tracker time series. The daily
+# summary isn't used, its values count logged activities as well, the
+# tracker series only what the tracker recorded.
+ACTIVITY_SUMMARY_METRICS = [
+    "minutesSedentary",
+    "minutesLightlyActive",
+    "minutesFairlyActive",
+    "minutesVeryActive",
+    "distance",
+    "calories",
+    "steps",
+]
+
+
+def intraday_activity_url(
+    date_str: str, resource: tuple, start_time=None, end_time=None
+) -> str:
+    ur = (
+        "https://api.fitbit.com/1/user/-/activities/"
+        + resource[0]
+        + "/date/"
+        + date_str
+        + "/1d/"
+        + resource[2]
+    )
+    if start_time:
+        ur += "/time/" + start_time + "/" + (end_time or "23:59")
+    return ur + ".json"
+
+
+def heart_rate_zones_url(date_str: str) -> str:
+    return (
+        "https://api.fitbit.com/1/user/-/activities/heart/date/" + date_str + "/1d.json"
+    )
+
+
+def sleep_log_url(start_date: str, end_date: str) -> str:
+    return (
+        "https://api.fitbit.com/1.2/user/-/sleep/date/"
+        + start_date
+        + "/"
+        + end_date
+        + ".json"
+    )
+
+
+def sleep_log_list_url(after_date: str, offset: int = 0, limit: int = 100) -> str:
+    return (
+        "https://api.fitbit.com/1.2/user/-/sleep/list.json?afterDate="
+        + after_date
+        + f"&sort=asc&offset={offset}&limit={limit}"
+    )
+
+
+def sleep_log_fingerprint(sleep_log: dict) -> str:
+    """Digest of a sleep log, changing whenever Fitbit changes the log"""
+    return hashlib.sha1(
+        json.dumps(sleep_log, sort_keys=True).encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+def activity_summary_url(metric: str, start_date: str, end_date: str) -> str:
+    return (
+        "https://api.fitbit.com/1/user/-/activities/tracker/"
+        + metric
+        + "/date/"
+        + start_date
+        + "/"
+        + end_date
+        + ".json"
+    )
+
+
+def endpoint_urls(method: str, start_date: str, end_date: str) -> List[str]:
+    endpoint = endpoints.ENDPOINTS[method]
+    return [
+        endpoint.url.format(start_date=start, end_date=end)
+        for start, end in endpoints.date_ranges(start_date, end_date, endpoint.max_days)
+    ]
+
+
+def intraday_activity_urls(
+    date_str: str, measurement_list: list, start_time=None, end_time=None
+) -> List[str]:
+    return [
+        intraday_activity_url(date_str, resource, start_time, end_time)
+        for resource in measurement_list
+    ]
+
+
+def activity_summary_urls(start_date: str, end_date: str) -> List[str]:
+    return [
+        activity_summary_url(metric, start_date, end_date)
+        for metric in ACTIVITY_SUMMARY_METRICS
+    ]
+
+
+# Urls FitbitClient methods request, by method, taking the method's arguments.
+# Lets responses be fetched in one process and parsed in another.
+REQUEST_URLS: Dict[str, Callable[..., List[str]]] = {
+    "get_intraday_activity_by_date": intraday_activity_urls,
+    "get_intraday_heart_rate_by_date": lambda date_str: [
+        heart_rate_zones_url(date_str)
+    ],
+    "get_sleep_log_by_interval": lambda start_date, end_date: [
+        sleep_log_url(start_date, end_date)
+    ],
+    "get_activity_summary_by_interval": activity_summary_urls,
+    **{method: partial(endpoint_urls, method) for method in endpoints.ENDPOINTS},
+}
+
+
 RESOURCE = {
     "calories": "calories",
     "steps": "steps",
@@ -35,10 +159,19 @@ class FitbitOauth2Client:
         token_path,
         initial_access_token=None,
         initial_refresh_token=None,
+        archive=None,
     ):
         self.client_id = client_id
         self.client_secret = client_secret
         self.token_path = token_path
+        self.archive = archive
+        self.breakers: Dict[str, retry.CircuitBreaker] = {}
+        self.rate_limited_until: float = 0
+        self.latency = latency.LatencyTracker(default=REQUEST_TIMEOUT)
+        self.api_base = os.getenv(key="FITBIT_API_BASE", default=endpoints.API)
+        self.scheduler = scheduler.RequestScheduler(
+            limit=int(os.getenv(key="FITBIT_RATE_LIMIT_PER_HOUR", default=150))
+        )
 
         try:
             self.access_token, self.refresh_token = self.load_tokens_from_file()
@@ -65,7 +198,15 @@ class FitbitOauth2Client:
             #     client_secret=self.client_secret,
             # )
 
-    def make_request(
+    def make_request(self, url: str, *args, **kwargs):
+        """Parsed JSON response of a Fitbit request"""
+        return self._request(url, *args, **kwargs).json()
+
+    def make_raw_request(self, url: str, *args, **kwargs) -> bytes:
+        """Response body of a Fitbit request, left for the caller to parse"""
+        return self._request(url, *args, **kwargs).content
+
+    def _request(
         self,
         url: str,
         headers: Optional[dict] = None,
@@ -87,25 +228,67 @@ class FitbitOauth2Client:
                 }
             )
 
+        endpoint = retry.endpoint_key(url)
+        breaker = self.breakers.setdefault(endpoint, retry.CircuitBreaker())
+
+        wait = self.rate_limited_until - time.monotonic()
+        if wait > 0:
+            raise retry.RequestDeferred(url, "Rate limit reached", retry_after=wait)
+        if not breaker.allow():
+            raise retry.RequestDeferred(
+                url, "Circuit open", retry_after=breaker.retry_after()
+            )
+        if request_type == "GET":
+            self.scheduler.acquire(url)
+
         try:
+            sent_at = time.monotonic()
             resp = self._send_request(url, headers, data, request_type)
+            # Fast error answers, e.g. 429 or 401, would pull the timeouts down
+            if 200 <= resp.status_code < 300:
+                self.latency.record(url, time.monotonic() - sent_at, len(resp.content))
             self._log_rate_limits(resp.headers)
-            self._handle_response(resp, url, headers, data, request_type)
+            self.scheduler.update(resp.headers)
+            resp = self._handle_response(resp, url, headers, data, request_type)
+
+        except requests.exceptions.RequestException as e:
+            logging.error("Request failed: %s - %s", url, e)
+            if isinstance(e, requests.exceptions.Timeout):
+                self.latency.record_timeout(url)
+            breaker.record_failure()
+            raise retry.RequestDeferred(
+                url, "Request failed", retry_after=breaker.retry_after()
+            )
 
-            return resp.json()
+        if resp.status_code >= 500:
+            logging.error("Server error %s: %s", resp.status_code, url)
+            breaker.record_failure()
+            raise retry.RequestDeferred(
+                url,
+                f"Server error {resp.status_code}",
+                retry_after=breaker.retry_after(),
+            )
+        breaker.record_success()
 
-        except ConnectionError as e:
-            logging.exception(e)
+        # Keep the raw response, so points can be rebuilt without refetching
+        if self.archive is not None and request_type == "GET" and resp.ok:
+            try:
+                self.archive.append(endpoint, url, resp.content)
+            except OSError as e:
+                logging.error(f"Unable to archive response for {url}: {e}")
+
+        return resp
 
     def _send_request(self, url, headers, data, request_type):
+        # Connect and read timeouts follow the latencies seen for the endpoint and range size
+        timeout = self.latency.timeout(url)
+        # Lets a local stand-in serve the API, urls are kept as is everywhere else
+        if url.startswith(endpoints.API):
+            url = self.api_base.rstrip("/") + url[len(endpoints.API) :]
         if request_type == "GET":
-            return requests.get(
-                url, headers=headers, data=data, timeout=REQUEST_TIMEOUT
-            )
+            return requests.get(url, headers=headers, data=data, timeout=timeout)
         elif request_type == "POST":
-            return requests.post(
-                url, headers=headers, data=data, timeout=REQUEST_TIMEOUT
-            )
+            return requests.post(url, headers=headers, data=data, timeout=timeout)
         else:
             raise Exception("Invalid request type")
 
@@ -116,9 +299,16 @@ class FitbitOauth2Client:
             "fitbit-rate-limit-reset",
         ]
 
-        for header in rate_limit_headers:
-            if header in headers:
-                logging.info(f"{header}: {int(headers.get(header))}")
+        # Every response carries these, keep them to one lazily built debug line
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(
+                "Rate limit %s",
+                " ".join(
+                    f"{header[len('fitbit-rate-limit-'):]}={headers.get(header)}"
+                    for header in rate_limit_headers
+                    if header in headers
+                ),
+            )
 
     def _handle_response(self, resp, url, headers, data, request_type):
         if resp.status_code == 401:
@@ -129,15 +319,14 @@ class FitbitOauth2Client:
                 # Update the headers with the new access token
                 headers["Authorization"] = f"Bearer {self.access_token}"
                 # Resend the request with the refreshed tokens
-                logging.info(
-                    f"Resending request url: {url} headers: {headers} data: {data} request_type: {request_type}"
-                )
+                logging.info("Resending %s request: %s", request_type, url)
                 resp = self._send_request(url, headers, data, request_type)
         if resp.status_code == 429:
+            # Fitbit quota is per user, so every endpoint waits until it resets
             reset = int(resp.headers.get("fitbit-rate-limit-reset", 0)) + 60
-            logging.info(f"Rate limit reached, sleeping for {reset} seconds")
-            time.sleep(reset)
-            resp = self._send_request(url, headers, data, request_type)
+            logging.info(f"Rate limit reached, deferring requests for {reset} seconds")
+            self.rate_limited_until = time.monotonic() + reset
+            raise retry.RequestDeferred(url, "Rate limit reached", retry_after=reset)
         return resp
 
     def _refresh_tokens(self, client_id: str, client_secret: str) -> Dict:
@@ -159,9 +348,7 @@ class FitbitOauth2Client:
         self.access_token = json_data["access_token"]
         self.refresh_token = json_data["refresh_token"]
 
-        logging.info(
-            f"New access_token: {self.access_token} - New refresh_token: {self.refresh_token}"
-        )
+        logging.info("Refreshed access and refresh tokens")
 
         tokens = {
             "access_token": self.access_token,
@@ -188,7 +375,10 @@ class FitbitClient:
         initial_refresh_token=None,
         device_name: str = None,
         local_timezone: str = None,
+        archive=None,
+        client=None,
     ):
+        """client: stands in for the FitbitOauth2Client, e.g. to replay archived responses"""
         self.client_id = client_id or os.getenv(key="FITBIT_CLIENT_ID")
         self.client_secret = client_secret or os.getenv(key="FITBIT_CLIENT_SECRET")
         self.token_path = token_path or os.getenv(key="TOKEN_FILE_PATH")
@@ -201,29 +391,58 @@ class FitbitClient:
         self.device_name = device_name
         self.local_timezone = local_timezone
 
-        self.client = FitbitOauth2Client(
+        self.client = client or FitbitOauth2Client(
             client_id=self.client_id,
             client_secret=self.client_secret,
             token_path=self.token_path,
             initial_access_token=self.initial_access_token,
             initial_refresh_token=self.initial_refresh_token,
+            archive=archive,
         )
+        self.extractors: Dict[str, endpoints.Extractor] = {}
         logging.info("Fitbit client initialized")
 
-    def get_intraday_activity_by_date(self, date_str, measurement_list):
+    def _fetch_endpoint(self, method: str, start_date: str, end_date: str) -> list:
+        """Points of a registered endpoint, in as many requests as its range limit needs"""
+        endpoint = endpoints.ENDPOINTS[method]
+        extract = self.extractors.get(method)
+        if extract is None:
+            extract = self.extractors[method] = endpoints.Extractor(
+                endpoint, self.device_name, local_timezone()
+            )
+
+        # Ranges of endpoints that keep timing out are asked for in smaller pieces
+        max_days = endpoint.max_days
+        tracker = getattr(self.client, "latency", None)
+        if tracker is not None:
+            max_days = tracker.max_days(
+                endpoint.url.format(start_date=start_date, end_date=end_date), max_days
+            )
+
+        collected_records = []
+        for start, end in endpoints.date_ranges(start_date, end_date, max_days):
+            try:
+                response = self.client.make_request(
+                    endpoint.url.format(start_date=start, end_date=end)
+                )
+                collected_records += extract(response)
+                logging.info(
+                    f"Recorded {endpoint.measurement} for date {start} to {end}"
+                )
+            except (KeyError, TypeError) as e:
+                logging.error(f"{type(e).__name__}: {e}")
+
+        return collected_records
+
+    def get_intraday_activity_by_date(
+        self, date_str, measurement_list, start_time=None, end_time=None
+    ):
+        """Get intraday activity, for the whole day or for a HH:MM window from start_time"""
         collected_records = []
         for measurement in measurement_list:
-            ur = (
-                "https://api.fitbit.com/1/user/-/activities/"
-                + measurement[0]
-                + "/date/"
-                + date_str
-                + "/1d/"
-                + measurement[2]
-                + ".json"
-            )
+            ur = intraday_activity_url(date_str, measurement, start_time, end_time)
 
-            logging.info(f"URL to request: {ur}")
+            logging.debug("URL to request: %s", ur)
 
             res = self.client.make_request(ur)
 
@@ -238,7 +457,8 @@ class FitbitClient:
                 for value in data:
                     log_time = datetime.fromisoformat(date_str + "T" + value["time"])
                     utc_time = (
-                        LOCAL_TIMEZONE.localize(log_time)
+                        local_timezone()
+                        .localize(log_time)
                         .astimezone(pytz.utc)
                         .isoformat()
                     )
@@ -264,55 +484,52 @@ class FitbitClient:
 
         return collected_records
 
-    def get_intraday_hrv_by_interval(self, start_date: str, end_date: str):
-        collected_records = []
+    def get_intraday_heart_rate_series_by_date(
+        self, date_str: str, detail_level: str = "1sec", start_time=None, end_time=None
+    ):
+        """Get the heart rate series of a day as a frame with time, value and Device columns
+
+        Meant for the 1sec detail level, with up to 86,400 readings per day,
+        so the dataset is parsed in bulk instead of one record at a time.
+        """
+        ur = intraday_activity_url(
+            date_str,
+            ("heart", "HeartRate_Intraday", detail_level),
+            start_time,
+            end_time,
+        )
+
+        logging.debug("URL to request: %s", ur)
 
+        res = self.client.make_request(ur)
         try:
-            hrv_data_listx = self.client.make_request(
-                "https://api.fitbit.com/1/user/-/hrv/date/"
-                + start_date
-                + "/"
-                + end_date
-                + ".json"
-            )
+            dataset = res["activities-heart-intraday"]["dataset"]
+        except (KeyError, TypeError) as e:
+            logging.error(f"{type(e).__name__}: {e}")
+            dataset = []
 
-            hrv_data_list = hrv_data_listx["hrv"]
+        # pandas is only loaded when seconds level heart rate is synced
+        from . import heart_rate
 
-            if hrv_data_list != None:
-                for data in hrv_data_list:
-                    log_time = datetime.fromisoformat(
-                        data["dateTime"] + "T" + "00:00:00"
-                    )
-                    utc_time = (
-                        LOCAL_TIMEZONE.localize(log_time)
-                        .astimezone(pytz.utc)
-                        .isoformat()
-                    )
-                    collected_records.append(
-                        {
-                            "measurement": "HRV_Intraday",
-                            "time": utc_time,
-                            "tags": {"Device": self.device_name},
-                            "fields": {
-                                "dailyRmssd": data["value"]["dailyRmssd"],
-                                "deepRmssd": data["value"]["deepRmssd"],
-                            },
-                        }
-                    )
-        except KeyError as e:
-            logging.error(f"KeyError: {e}")
+        frame = heart_rate.parse_dataset(date_str, dataset, local_timezone())
+        frame["Device"] = self.device_name
+        logging.info(
+            f"Recorded {len(frame)} heart rate readings at {detail_level} for date {date_str}"
+        )
 
-        return collected_records
+        return frame
+
+    def get_intraday_hrv_by_interval(self, start_date: str, end_date: str):
+        """HRV per day from start_date to end_date"""
+        return self._fetch_endpoint(
+            "get_intraday_hrv_by_interval", start_date, end_date
+        )
 
     def get_intraday_heart_rate_by_date(self, date_str: str):
         collected_records = []
-        ur = (
-            "https://api.fitbit.com/1/user/-/activities/heart/date/"
-            + date_str
-            + "/1d/1min.json"
-        )
+        ur = heart_rate_zones_url(date_str)
 
-        logging.info(f"URL to request: {ur}")
+        logging.debug("URL to request: %s", ur)
 
         try:
             HR_zones_data_list = self.client.make_request(ur)["activities-heart"]
@@ -323,7 +540,8 @@ class FitbitClient:
                         data["dateTime"] + "T" + "00:00:00"
                     )
                     utc_time = (
-                        LOCAL_TIMEZONE.localize(log_time)
+                        local_timezone()
+                        .localize(log_time)
                         .astimezone(pytz.utc)
                         .isoformat()
                     )
@@ -357,223 +575,32 @@ class FitbitClient:
         return collected_records
 
     def get_body_data_by_interval(self, start_date: str, end_date: str):
-        collected_records = []
-
-        try:
-            body_list = self.client.make_request(
-                "https://api.fitbit.com/1/user/-/body/log/weight/date/"
-                + start_date
-                + "/"
-                + end_date
-                + ".json"
-            )["weight"]
-
-            if body_list != None:
-                for data in body_list:
-                    log_time = datetime.fromisoformat(data["date"] + "T" + data["time"])
-                    utc_time = (
-                        LOCAL_TIMEZONE.localize(log_time)
-                        .astimezone(pytz.utc)
-                        .isoformat()
-                    )
-                    collected_records.append(
-                        {
-                            "measurement": "Body",
-                            "time": utc_time,
-                            "tags": {"Device": data["source"]},
-                            "fields": {
-                                "bmi": data["bmi"],
-                                # "fat": data["fat"],
-                                "weight": data["weight"],
-                            },
-                        }
-                    )
-        except KeyError as e:
-            logging.error(f"KeyError: {e}")
-
-        return collected_records
+        """Weight and BMI logs per day from start_date to end_date"""
+        return self._fetch_endpoint("get_body_data_by_interval", start_date, end_date)
 
     def get_temperature_skin_by_interval(self, start_date: str, end_date: str):
-        collected_records = []
-
-        try:
-            temperature_list = self.client.make_request(
-                "https://api.fitbit.com/1/user/-/temp/skin/date/"
-                + start_date
-                + "/"
-                + end_date
-                + ".json"
-            )["tempSkin"]
-
-            if temperature_list != None:
-                for data in temperature_list:
-                    log_time = datetime.fromisoformat(
-                        data["dateTime"] + "T" + "00:00:00"
-                    )
-                    utc_time = (
-                        LOCAL_TIMEZONE.localize(log_time)
-                        .astimezone(pytz.utc)
-                        .isoformat()
-                    )
-                    collected_records.append(
-                        {
-                            "measurement": "TempSkin",
-                            "time": utc_time,
-                            "tags": {"Device": self.device_name},
-                            "fields": {
-                                "temp": data["value"]["nightlyRelative"],
-                            },
-                        }
-                    )
-        except KeyError as e:
-            logging.error(f"KeyError: {e}")
-
-        return collected_records
+        """Nightly relative skin temperature per day from start_date to end_date"""
+        return self._fetch_endpoint(
+            "get_temperature_skin_by_interval", start_date, end_date
+        )
 
     # Get VO2 Max Summary by Interval
     def get_vo2max_cardio_score_by_interval(self, start_date: str, end_date: str):
-        collected_records = []
-
-        try:
-            vo2_list = self.client.make_request(
-                "https://api.fitbit.com/1/user/-/cardioscore/date/"
-                + start_date
-                + "/"
-                + end_date
-                + ".json"
-            )["cardioScore"]
-
-            if vo2_list != None:
-                for data in vo2_list:
-                    log_time = datetime.fromisoformat(
-                        data["dateTime"] + "T" + "00:00:00"
-                    )
-                    utc_time = (
-                        LOCAL_TIMEZONE.localize(log_time)
-                        .astimezone(pytz.utc)
-                        .isoformat()
-                    )
-                    collected_records.append(
-                        {
-                            "measurement": "CardioScore",
-                            "time": utc_time,
-                            "tags": {"Device": self.device_name},
-                            "fields": {
-                                "vo2Low": list(
-                                    map(int, data["value"]["vo2Max"].split("-"))
-                                )[0],
-                                "vo2High": list(
-                                    map(int, data["value"]["vo2Max"].split("-"))
-                                )[1],
-                            },
-                        }
-                    )
-        except KeyError as e:
-            logging.error(f"KeyError: {e}")
-
-        return collected_records
+        """VO2 max range per day from start_date to end_date"""
+        return self._fetch_endpoint(
+            "get_vo2max_cardio_score_by_interval", start_date, end_date
+        )
 
     def get_sleep_log_by_interval(self, start_date: str, end_date: str):
         collected_records = []
 
         try:
-            sleep_data = self.client.make_request(
-                "https://api.fitbit.com/1.2/user/-/sleep/date/"
-                + start_date
-                + "/"
-                + end_date
-                + ".json"
-            )["sleep"]
+            sleep_data = self.client.make_request(sleep_log_url(start_date, end_date))[
+                "sleep"
+            ]
 
             if sleep_data != None:
-                for record in sleep_data:
-                    log_time = datetime.fromisoformat(record["startTime"])
-                    utc_time = (
-                        LOCAL_TIMEZONE.localize(log_time)
-                        .astimezone(pytz.utc)
-                        .isoformat()
-                    )
-                    try:
-                        minutesLight = record["levels"]["summary"]["light"]["minutes"]
-                        minutesREM = record["levels"]["summary"]["rem"]["minutes"]
-                        minutesDeep = record["levels"]["summary"]["deep"]["minutes"]
-                    except:
-                        minutesLight = record["levels"]["summary"]["asleep"]["minutes"]
-                        minutesREM = record["levels"]["summary"]["restless"]["minutes"]
-                        minutesDeep = 0
-
-                    collected_records.append(
-                        {
-                            "measurement": "Sleep Summary",
-                            "time": utc_time,
-                            "tags": {
-                                "Device": self.device_name,
-                                "isMainSleep": record["isMainSleep"],
-                            },
-                            "fields": {
-                                "efficiency": record["efficiency"],
-                                "minutesAfterWakeup": record["minutesAfterWakeup"],
-                                "minutesAsleep": record["minutesAsleep"],
-                                "minutesToFallAsleep": record["minutesToFallAsleep"],
-                                "minutesInBed": record["timeInBed"],
-                                "minutesAwake": record["minutesAwake"],
-                                "minutesLight": minutesLight,
-                                "minutesREM": minutesREM,
-                                "minutesDeep": minutesDeep,
-                            },
-                        }
-                    )
-
-                    sleep_level_mapping = {
-                        "wake": 3,
-                        "rem": 2,
-                        "light": 1,
-                        "deep": 0,
-                        "asleep": 1,
-                        "restless": 2,
-                        "awake": 3,
-                    }
-                    for sleep_stage in record["levels"]["data"]:
-                        log_time = datetime.fromisoformat(sleep_stage["dateTime"])
-                        utc_time = (
-                            LOCAL_TIMEZONE.localize(log_time)
-                            .astimezone(pytz.utc)
-                            .isoformat()
-                        )
-                        collected_records.append(
-                            {
-                                "measurement": "Sleep Levels",
-                                "time": utc_time,
-                                "tags": {
-                                    "Device": self.device_name,
-                                    "isMainSleep": record["isMainSleep"],
-                                },
-                                "fields": {
-                                    "level": sleep_level_mapping[sleep_stage["level"]],
-                                    "duration_seconds": sleep_stage["seconds"],
-                                },
-                            }
-                        )
-                    wake_time = datetime.fromisoformat(record["endTime"])
-                    utc_wake_time = (
-                        LOCAL_TIMEZONE.localize(wake_time)
-                        .astimezone(pytz.utc)
-                        .isoformat()
-                    )
-                    collected_records.append(
-                        {
-                            "measurement": "Sleep Levels",
-                            "time": utc_wake_time,
-                            "tags": {
-                                "Device": self.device_name,
-                                "isMainSleep": record["isMainSleep"],
-                            },
-                            "fields": {
-                                "level": sleep_level_mapping["wake"],
-                                "duration_seconds": None,
-                            },
-                        }
-                    )
+                collected_records += self.sleep_log_points(sleep_data)
                 logging.info(
                     "Recorded Sleep data for date " + start_date + " to " + end_date
                 )
@@ -589,22 +616,118 @@ class FitbitClient:
 
         return collected_records
 
+    def sleep_log_points(self, sleep_data: list) -> list:
+        """Sleep Summary and Sleep Levels points of sleep logs"""
+        collected_records = []
+        for record in sleep_data:
+            log_time = datetime.fromisoformat(record["startTime"])
+            utc_time = (
+                local_timezone().localize(log_time).astimezone(pytz.utc).isoformat()
+            )
+            try:
+                minutesLight = record["levels"]["summary"]["light"]["minutes"]
+                minutesREM = record["levels"]["summary"]["rem"]["minutes"]
+                minutesDeep = record["levels"]["summary"]["deep"]["minutes"]
+            except:
+                minutesLight = record["levels"]["summary"]["asleep"]["minutes"]
+                minutesREM = record["levels"]["summary"]["restless"]["minutes"]
+                minutesDeep = 0
+
+            collected_records.append(
+                {
+                    "measurement": "Sleep Summary",
+                    "time": utc_time,
+                    "tags": {
+                        "Device": self.device_name,
+                        "isMainSleep": record["isMainSleep"],
+                    },
+                    "fields": {
+                        "efficiency": record["efficiency"],
+                        "minutesAfterWakeup": record["minutesAfterWakeup"],
+                        "minutesAsleep": record["minutesAsleep"],
+                        "minutesToFallAsleep": record["minutesToFallAsleep"],
+                        "minutesInBed": record["timeInBed"],
+                        "minutesAwake": record["minutesAwake"],
+                        "minutesLight": minutesLight,
+                        "minutesREM": minutesREM,
+                        "minutesDeep": minutesDeep,
+                    },
+                }
+            )
+
+            sleep_level_mapping = {
+                "wake": 3,
+                "rem": 2,
+                "light": 1,
+                "deep": 0,
+                "asleep": 1,
+                "restless": 2,
+                "awake": 3,
+            }
+            for sleep_stage in record["levels"]["data"]:
+                log_time = datetime.fromisoformat(sleep_stage["dateTime"])
+                utc_time = (
+                    local_timezone().localize(log_time).astimezone(pytz.utc).isoformat()
+                )
+                collected_records.append(
+                    {
+                        "measurement": "Sleep Levels",
+                        "time": utc_time,
+                        "tags": {
+                            "Device": self.device_name,
+                            "isMainSleep": record["isMainSleep"],
+                        },
+                        "fields": {
+                            "level": sleep_level_mapping[sleep_stage["level"]],
+                            "duration_seconds": sleep_stage["seconds"],
+                        },
+                    }
+                )
+            wake_time = datetime.fromisoformat(record["endTime"])
+            utc_wake_time = (
+                local_timezone().localize(wake_time).astimezone(pytz.utc).isoformat()
+            )
+            collected_records.append(
+                {
+                    "measurement": "Sleep Levels",
+                    "time": utc_wake_time,
+                    "tags": {
+                        "Device": self.device_name,
+                        "isMainSleep": record["isMainSleep"],
+                    },
+                    "fields": {
+                        "level": sleep_level_mapping["wake"],
+                        "duration_seconds": None,
+                    },
+                }
+            )
+        return collected_records
+
+    def get_sleep_logs_after(self, after_date: str) -> list:
+        """Sleep logs of the nights after after_date, paging through the sleep log list"""
+        sleep_logs = []
+        url = sleep_log_list_url(after_date)
+        while url:
+            logging.debug("URL to request: %s", url)
+            response = self.client.make_request(url)
+            sleep_logs += response.get("sleep") or []
+            url = (response.get("pagination") or {}).get("next")
+        logging.info(f"Listed {len(sleep_logs)} sleep logs after {after_date}")
+        return sleep_logs
+
     # Get last synced battery level of the device
     def get_battery_level(self):
         collected_records = []
 
         try:
-            device = self.client.make_request(
-                "https://api.fitbit.com/1/user/-/devices.json"
-            )[0]
+            device = self.client.make_request(DEVICES_URL)[0]
 
             if device != None:
                 collected_records.append(
                     {
                         "measurement": "DeviceBatteryLevel",
-                        "time": LOCAL_TIMEZONE.localize(
-                            datetime.fromisoformat(device["lastSyncTime"])
-                        )
+                        "time": local_timezone()
+                        .localize(datetime.fromisoformat(device["lastSyncTime"]))
                         .astimezone(pytz.utc)
                         .isoformat(),
                         "fields": {"value": float(device["batteryLevel"])},
@@ -620,225 +743,44 @@ class FitbitClient:
 
     # Breathing rate
     def get_breathing_rate_by_interval(self, start_date: str, end_date: str):
-        collected_records = []
-
-        try:
-            br_data_list = self.client.make_request(
-                "https://api.fitbit.com/1/user/-/br/date/"
-                + start_date
-                + "/"
-                + end_date
-                + ".json"
-            )["br"]
-            if br_data_list != None:
-                for data in br_data_list:
-                    log_time = datetime.fromisoformat(
-                        data["dateTime"] + "T" + "00:00:00"
-                    )
-                    utc_time = (
-                        LOCAL_TIMEZONE.localize(log_time)
-                        .astimezone(pytz.utc)
-                        .isoformat()
-                    )
-                    collected_records.append(
-                        {
-                            "measurement": "BreathingRate",
-                            "time": utc_time,
-                            "tags": {"Device": self.device_name},
-                            "fields": {"value": data["value"]["breathingRate"]},
-                        }
-                    )
-                logging.info("Recorded BR for date " + start_date + " to " + end_date)
-            else:
-                logging.error(
-                    "Recording failed : BR for date " + start_date + " to " + end_date
-                )
-        except KeyError as e:
-            logging.error(f"KeyError: {e}")
-
-        return collected_records
+        """Breathing rate per day from start_date to end_date"""
+        return self._fetch_endpoint(
+            "get_breathing_rate_by_interval", start_date, end_date
+        )
 
     # Get SPo2 interval
     def get_spo2_by_interval(self, start_date: str, end_date: str):
-        collected_records = []
-
-        try:
-            spo2_data_list = self.client.make_request(
-                "https://api.fitbit.com/1/user/-/spo2/date/"
-                + start_date
-                + "/"
-                + end_date
-                + "/all.json"
-            )
-            if spo2_data_list != None:
-                for days in spo2_data_list:
-                    data = days["minutes"]
-                    for record in data:
-                        log_time = datetime.fromisoformat(record["minute"])
-                        utc_time = (
-                            LOCAL_TIMEZONE.localize(log_time)
-                            .astimezone(pytz.utc)
-                            .isoformat()
-                        )
-                        collected_records.append(
-                            {
-                                "measurement": "SPO2_Intraday",
-                                "time": utc_time,
-                                "tags": {"Device": self.device_name},
-                                "fields": {
-                                    "value": float(record["value"]),
-                                },
-                            }
-                        )
-                logging.info("Recorded SPO2 for date " + start_date + " to " + end_date)
-
-        except KeyError as e:
-            logging.error(f"KeyError: {e}")
-
-        return collected_records
+        """SpO2 readings during sleep per day from start_date to end_date"""
+        return self._fetch_endpoint("get_spo2_by_interval", start_date, end_date)
 
     # Get SPo2 Summary
     def get_spo2_summary_by_interval(self, start_date: str, end_date: str):
-        collected_records = []
-
-        try:
-            data_list = self.client.make_request(
-                "https://api.fitbit.com/1/user/-/spo2/date/"
-                + start_date
-                + "/"
-                + end_date
-                + ".json"
-            )
-            if data_list != None:
-                for data in data_list:
-                    log_time = datetime.fromisoformat(
-                        data["dateTime"] + "T" + "00:00:00"
-                    )
-                    utc_time = (
-                        LOCAL_TIMEZONE.localize(log_time)
-                        .astimezone(pytz.utc)
-                        .isoformat()
-                    )
-                    collected_records.append(
-                        {
-                            "measurement": "SPO2",
-                            "time": utc_time,
-                            "tags": {"Device": self.device_name},
-                            "fields": {
-                                "avg": data["value"]["avg"],
-                                "max": data["value"]["max"],
-                                "min": data["value"]["min"],
-                            },
-                        }
-                    )
-                logging.info(
-                    "Recorded Avg SPO2 for date " + start_date + " to " + end_date
-                )
-            else:
-                logging.error(
-                    "Recording failed : Avg SPO2 for date "
-                    + start_date
-                    + " to "
-                    + end_date
-                )
-        except KeyError as e:
-            logging.error(f"KeyError: {e}")
-
-        return collected_records
+        """Average, max and min SpO2 per day from start_date to end_date"""
+        return self._fetch_endpoint(
+            "get_spo2_summary_by_interval", start_date, end_date
+        )
 
     # get activity summary
     def get_activity_summary_by_interval(self, start_date: str, end_date: str):
+        """Get activity minutes, distance, calories and steps per day, as the tracker recorded them"""
         collected_records = []
 
         try:
-            activity_minutes_list = [
-                "minutesSedentary",
-                "minutesLightlyActive",
-                "minutesFairlyActive",
-                "minutesVeryActive",
-            ]
-            for activity_type in activity_minutes_list:
-                activity_minutes_data_list = self.client.make_request(
-                    "https://api.fitbit.com/1/user/-/activities/tracker/"
-                    + activity_type
-                    + "/date/"
-                    + start_date
-                    + "/"
-                    + end_date
-                    + ".json"
-                )["activities-tracker-" + activity_type]
-                if activity_minutes_data_list != None:
-                    for data in activity_minutes_data_list:
-                        log_time = datetime.fromisoformat(
-                            data["dateTime"] + "T" + "00:00:00"
-                        )
-                        utc_time = (
-                            LOCAL_TIMEZONE.localize(log_time)
-                            .astimezone(pytz.utc)
-                            .isoformat()
-                        )
-                        collected_records.append(
-                            {
-                                "measurement": "Activity Minutes",
-                                "time": utc_time,
-                                "tags": {"Device": self.device_name},
-                                "fields": {activity_type: int(data["value"])},
-                            }
-                        )
-                    logging.info(
-                        "Recorded "
-                        + activity_type
-                        + "for date "
-                        + start_date
-                        + " to "
-                        + end_date
-                    )
-                else:
-                    logging.error(
-                        "Recording failed : "
-                        + activity_type
-                        + " for date "
-                        + start_date
-                        + " to "
-                        + end_date
-                    )
-
-            activity_others_list = ["distance", "calories", "steps"]
-            for activity_type in activity_others_list:
-                activity_others_data_list = self.client.make_request(
-                    "https://api.fitbit.com/1/user/-/activities/tracker/"
-                    + activity_type
-                    + "/date/"
-                    + start_date
-                    + "/"
-                    + end_date
-                    + ".json"
+            for activity_type in ACTIVITY_SUMMARY_METRICS:
+                activity_data_list = self.client.make_request(
+                    activity_summary_url(activity_type, start_date, end_date)
                 )["activities-tracker-" + activity_type]
 
-                if activity_others_data_list != None:
-                    for data in activity_others_data_list:
-                        log_time = datetime.fromisoformat(
-                            data["dateTime"] + "T" + "00:00:00"
-                        )
-                        utc_time = (
-                            LOCAL_TIMEZONE.localize(log_time)
-                            .astimezone(pytz.utc)
-                            .isoformat()
-                        )
-                        activity_name = (
-                            "Total Steps" if activity_type == "steps" else activity_type
-                        )
+                if activity_data_list != None:
+                    for data in activity_data_list:
                         collected_records.append(
-                            {
-                                "measurement": activity_name,
-                                "time": utc_time,
-                                "tags": {"Device": self.device_name},
-                                "fields": {"value": float(data["value"])},
-                            }
+                            self._activity_summary_record(
+                                activity_type, data["dateTime"], data["value"]
+                            )
                         )
                     logging.info(
                         "Recorded "
-                        + activity_name
+                        + activity_type
                         + " for date "
                         + start_date
                         + " to "
@@ -847,7 +789,7 @@ class FitbitClient:
                 else:
                     logging.error(
                         "Recording failed : "
-                        + activity_name
+                        + activity_type
                         + " for date "
                         + start_date
                         + " to "
@@ -857,3 +799,22 @@ class FitbitClient:
             logging.error(f"KeyError: {e}")
 
         return collected_records
+
+    def _activity_summary_record(self, activity_type: str, date_str: str, value):
+        log_time = datetime.fromisoformat(date_str + "T" + "00:00:00")
+        utc_time = local_timezone().localize(log_time).astimezone(pytz.utc).isoformat()
+
+        if activity_type.startswith("minutes"):
+            return {
+                "measurement": "Activity Minutes",
+                "time": utc_time,
+                "tags": {"Device": self.device_name},
+                "fields": {activity_type: int(value)},
+            }
+
+        return {
+            "measurement": "Total Steps" if activity_type == "steps" else activity_type,
+            "time": utc_time,
+            "tags": {"Device": self.device_name},
+            "fields": {"value": float(value)},
+        }
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+def parse_dataset(date_str: str, dataset: list, timezone) -> pd.DataFrame:
+    """Turn an intraday dataset into a frame with UTC time and value columns
+
+    Times are parsed as fixed width HH:MM:SS bytes in one numpy pass instead
+    of one datetime per entry, which matters at 86,400 entries per day.
+
+    date_str: date of the dataset, YYYY-MM-DD
+    dataset: [{"time": "HH:MM:SS", "value": int}, ...]
+    timezone: local timezone of the times in the dataset
+    """
+    if not dataset:
+        return pd.DataFrame(
+            {
+                "time": pd.DatetimeIndex([], tz="UTC"),
+                "value": np.array([], dtype=np.int64),
+            }
+        )
+
+    digits = np.array([entry["time"] for entry in dataset], dtype="S8").view(
+        np.uint8
+    ).reshape(-1, 8).astype(np.int64) - ord("0")
+    seconds = (
+        (digits[:, 0] * 10 + digits[:, 1]) * 3600
+        + (digits[:, 3] * 10 + digits[:, 4]) * 60
+        + digits[:, 6] * 10
+        + digits[:, 7]
+    )
+    values = np.fromiter(
+        (entry["value"] for entry in dataset), dtype=np.int64, count=len(dataset)
+    )
+
+    local_time = pd.DatetimeIndex(
+        np.datetime64(date_str, "s") + seconds.astype("timedelta64[s]")
+    )
+    # Ambiguous times are taken as standard time, as pytz localize does
+    utc_time = local_time.tz_localize(
+        timezone,
+        ambiguous=np.zeros(len(local_time), dtype=bool),
+        nonexistent="shift_forward",
+    ).tz_convert("UTC")
+
+    return pd.DataFrame({"time": utc_time, "value": values})
+
+
+def compact_runs(frame: pd.DataFrame, resolution_seconds: int = 1) -> pd.DataFrame:
+    """Keep only the first reading of each run of repeated values
+
+    A reading after a gap longer than the detail level is always kept, so a
+    run never spans time without data.
+    """
+    if len(frame) < 2:
+        return frame
+
+    values = frame["value"].to_numpy()
+    times = frame["time"].dt.as_unit("s").astype(np.int64).to_numpy()
+
+    keep = np.empty(len(frame), dtype=bool)
+    keep[0] = True
+    keep[1:] = (values[1:] != values[:-1]) | (np.diff(times) > resolution_seconds)
+
+    return frame[keep].reset_index(drop=True)
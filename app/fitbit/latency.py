@@ -0,0 +1,120 @@
+import math
+from collections import deque
+from datetime import date
+from typing import Deque, Dict, Tuple
+from .retry import DATE_PATTERN, endpoint_key
+
+
+def range_days(url: str) -> int:
+    """Number of days a url asks for, 1 for urls of a single date or none"""
+    dates = DATE_PATTERN.findall(url)
+    if len(dates) < 2:
+        return 1
+    return (date.fromisoformat(dates[1]) - date.fromisoformat(dates[0])).days + 1
+
+
+def size_bucket(days: int) -> int:
+    """Smallest power of two holding days, so ranges of similar size share latencies"""
+    return 1 << max(0, math.ceil(math.log2(max(days, 1))))
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LatencyTracker:
+    """Latencies of recent requests per endpoint and range size, and the timeouts they call for
+
+    The read timeout of a request is factor times the 95th percentile
+    latency of its endpoint and range size, within minimum and maximum,
+    and the default until min_samples requests were seen. Endpoints timing
+    out split_after times in a row get their ranges halved, and doubled
+    again after restore_after successful requests. A request timing out
+    doubles the read timeout of the next one, until one is answered, so
+    responses far slower than the usual ones still get through.
+    """
+
+    def __init__(
+        self,
+        default: float = 30,
+        connect: float = 5,
+        minimum: float = 5,
+        maximum: float = 120,
+        factor: float = 3,
+        samples: int = 50,
+        min_samples: int = 5,
+        split_after: int = 2,
+        restore_after: int = 10,
+    ):
+        self.default = default
+        self.connect = connect
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.samples = samples
+        self.min_samples = min_samples
+        self.split_after = split_after
+        self.restore_after = restore_after
+        self.latencies: Dict[Tuple[str, int], Deque[float]] = {}
+        self.sizes: Dict[Tuple[str, int], Deque[int]] = {}
+        self.timeouts: Dict[str, int] = {}
+        self.successes: Dict[str, int] = {}
+        self.divisors: Dict[str, int] = {}
+        self.timed_out: Dict[Tuple[str, int], float] = {}
+
+    @staticmethod
+    def key(url: str) -> Tuple[str, int]:
+        return endpoint_key(url), size_bucket(range_days(url))
+
+    def timeout(self, url: str) -> Tuple[float, float]:
+        """Connect and read timeout in seconds for a request of url"""
+        key = self.key(url)
+        latencies = self.latencies.get(key)
+        if not latencies or len(latencies) < self.min_samples:
+            read = self.default
+        else:
+            read = max(self.minimum, self.factor * percentile(latencies, 0.95))
+        if key in self.timed_out:
+            read = max(read, 2 * self.timed_out[key])
+        return self.connect, min(self.maximum, read)
+
+    def record(self, url: str, seconds: float, size: int = 0) -> None:
+        """A request of url answered in seconds, with a body of size bytes"""
+        key = self.key(url)
+        self.timed_out.pop(key, None)
+        self.latencies.setdefault(key, deque(maxlen=self.samples)).append(seconds)
+        self.sizes.setdefault(key, deque(maxlen=self.samples)).append(size)
+
+        endpoint = key[0]
+        self.timeouts[endpoint] = 0
+        self.successes[endpoint] = self.successes.get(endpoint, 0) + 1
+        divisor = self.divisors.get(endpoint, 1)
+        if divisor > 1 and self.successes[endpoint] >= self.restore_after:
+            self.divisors[endpoint] = divisor // 2
+            self.successes[endpoint] = 0
+
+    def record_timeout(self, url: str) -> None:
+        self.timed_out[self.key(url)] = self.timeout(url)[1]
+        endpoint = endpoint_key(url)
+        self.successes[endpoint] = 0
+        self.timeouts[endpoint] = self.timeouts.get(endpoint, 0) + 1
+        if self.timeouts[endpoint] >= self.split_after:
+            self.divisors[endpoint] = self.divisors.get(endpoint, 1) * 2
+            self.timeouts[endpoint] = 0
+
+    def max_days(self, url: str, max_days: int) -> int:
+        """Days to ask for at once from the endpoint of url, max_days unless it keeps timing out"""
+        return max(1, max_days // self.divisors.get(endpoint_key(url), 1))
+
+    def summary(self) -> Dict[str, dict]:
+        """Median and 95th percentile latency, median size and count per endpoint and range size"""
+        return {
+            f"{endpoint} {days}d": {
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "bytes": percentile(self.sizes[(endpoint, days)], 0.5),
+                "count": len(latencies),
+            }
+            for (endpoint, days), latencies in self.latencies.items()
+        }
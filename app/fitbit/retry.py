@@ -0,0 +1,216 @@
+import heapq, itertools, logging, random, re, time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+TIME_PATTERN = re.compile(r"\d{2}:\d{2}")
+
+
+class RequestDeferred(Exception):
+    """Request could not be completed now and should be retried later
+
+    url: url of the deferred request
+    reason: why the request was deferred
+    retry_after: seconds to wait before the request is worth retrying
+    """
+
+    def __init__(self, url: str, reason: str, retry_after: float = 0):
+        super().__init__(f"{reason}: {url}")
+        self.url = url
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def endpoint_key(url: str) -> str:
+    """Return the endpoint a url belongs to, with dates and times replaced by placeholders"""
+    path = url.split("://", 1)[-1].split("/", 1)[-1].split("?", 1)[0]
+    path = DATE_PATTERN.sub("{date}", path)
+    return TIME_PATTERN.sub("{time}", path)
+
+
+def backoff_delay(
+    attempt: int, base: float = 60, cap: float = 3600, rng=random
+) -> float:
+    """Exponential backoff with full jitter, in seconds"""
+    return rng.uniform(0, min(cap, base * 2**attempt))
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint that keeps failing
+
+    closed: requests pass through
+    open: requests are rejected until reset_timeout has passed
+    half_open: one trial request is let through to probe the endpoint
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        reset_timeout: float = 300,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0
+        return max(0, self.reset_timeout - (self.clock() - self.opened_at))
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+
+
+@dataclass(order=True)
+class DeferredCall:
+    due: float
+    seq: int
+    name: str = field(compare=False)
+    func: Callable[..., Any] = field(compare=False)
+    kwargs: Dict[str, Any] = field(compare=False)
+    attempt: int = field(compare=False, default=0)
+    deferred_at: float = field(compare=False, default=0)
+
+
+class RetryQueue:
+    """Queue of deferred calls, retried with jittered exponential backoff
+
+    Calls are run from run_due(), which is meant to be scheduled next to the
+    regular sync jobs, so nothing blocks while waiting for a retry.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 8,
+        base_delay: float = 60,
+        max_delay: float = 3600,
+        clock: Callable[[], float] = time.monotonic,
+        rng=random,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.rng = rng
+        self._heap: List[DeferredCall] = []
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, name: str) -> bool:
+        """Whether a call deferred under name is waiting"""
+        return any(call.name == name for call in self._heap)
+
+    def push(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        kwargs: Optional[Dict[str, Any]] = None,
+        attempt: int = 0,
+        retry_after: float = 0,
+        deferred_at: Optional[float] = None,
+    ) -> DeferredCall:
+        """Defer func(**kwargs), not earlier than retry_after seconds from now
+
+        A call already waiting with the same name and kwargs is replaced,
+        so a step deferred on every cycle is queued once.
+        """
+        now = self.clock()
+        kwargs = kwargs or {}
+        waiting = [
+            call for call in self._heap if call.name == name and call.kwargs == kwargs
+        ]
+        if waiting:
+            deferred_at = min(
+                [call.deferred_at for call in waiting]
+                + ([] if deferred_at is None else [deferred_at])
+            )
+            self._heap = [call for call in self._heap if call not in waiting]
+            heapq.heapify(self._heap)
+        delay = max(
+            retry_after,
+            backoff_delay(attempt, self.base_delay, self.max_delay, self.rng),
+        )
+        call = DeferredCall(
+            due=now + delay,
+            seq=next(self._seq),
+            name=name,
+            func=func,
+            kwargs=kwargs,
+            attempt=attempt,
+            deferred_at=now if deferred_at is None else deferred_at,
+        )
+        heapq.heappush(self._heap, call)
+        logging.info(f"Deferred {name} (attempt {attempt + 1}) for {delay:.0f} seconds")
+        return call
+
+    def next_due(self) -> Optional[float]:
+        """Seconds until the next call is due, 0 when one is due now, None when the queue is empty"""
+        if not self._heap:
+            return None
+        return max(0, self._heap[0].due - self.clock())
+
+    def oldest_age(self) -> float:
+        """Seconds since the oldest call in the queue was first deferred"""
+        if not self._heap:
+            return 0
+        return self.clock() - min(call.deferred_at for call in self._heap)
+
+    def run_due(self) -> int:
+        """Run every call that is due, re-deferring the ones that are deferred again
+
+        Other exceptions of a call are logged, and the rest of the due calls still run.
+        """
+        due = []
+        now = self.clock()
+        while self._heap and self._heap[0].due <= now:
+            due.append(heapq.heappop(self._heap))
+
+        for call in due:
+            try:
+                call.func(**call.kwargs)
+            except RequestDeferred as err:
+                if call.attempt + 1 >= self.max_attempts:
+                    logging.error(
+                        f"Giving up on {call.name} after {call.attempt + 1} attempts: {err}"
+                    )
+                    continue
+                self.push(
+                    call.name,
+                    call.func,
+                    call.kwargs,
+                    attempt=call.attempt + 1,
+                    retry_after=err.retry_after,
+                    deferred_at=call.deferred_at,
+                )
+            except Exception:
+                logging.exception(f"Retry of {call.name} failed")
+
+        self.log_stats()
+        return len(due)
+
+    def log_stats(self) -> None:
+        logging.info(
+            f"Deferred retry queue depth: {len(self)}, oldest deferred request age: {self.oldest_age():.0f} seconds"
+        )
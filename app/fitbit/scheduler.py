@@ -0,0 +1,118 @@
+import logging, time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Callable, Dict, Optional
+from .retry import RequestDeferred
+
+
+class Priority(IntEnum):
+    """Request priority classes, lower value is served first"""
+
+    LIVE = 0
+    DAILY = 1
+    BACKFILL = 2
+
+
+# Part of the hourly quota kept free for the classes above, over the rest of
+# the window. The default live and daily syncs take 126 of 150 requests an
+# hour, the backfill leaves them that much, daily syncs leave a little for
+# live data.
+DEFAULT_RESERVE = {Priority.LIVE: 0, Priority.DAILY: 0.1, Priority.BACKFILL: 0.85}
+
+# Largest part of the hourly quota a class may use on its own
+DEFAULT_SHARE = {Priority.LIVE: 1.0, Priority.DAILY: 0.7, Priority.BACKFILL: 0.5}
+
+
+class RequestScheduler:
+    """Shares the hourly Fitbit request quota between priority classes
+
+    The quota window is tracked from the fitbit-rate-limit-* response headers.
+    A class may only send a request while the remaining quota is above the
+    headroom reserved for the classes above it, and while it has used less
+    than its share of the window. Reserves and shares are parts of the
+    limit, so they follow the limit Fitbit reports, and reserves shrink as
+    the window passes, leaving what the classes above no longer need to the
+    classes below. Denied requests raise
+    RequestDeferred, so they end up in the retry queue instead of delaying
+    higher priority work.
+    """
+
+    def __init__(
+        self,
+        limit: int = 150,
+        reserve: Optional[Dict[Priority, float]] = None,
+        share: Optional[Dict[Priority, float]] = None,
+        window: float = 3600,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limit = limit
+        self.reserve = reserve or DEFAULT_RESERVE
+        self.share = share or DEFAULT_SHARE
+        self.window = window
+        self.clock = clock
+        self.current = Priority.LIVE
+        self.remaining: Optional[int] = None
+        self.reset_at = self.clock() + window
+        self.used = {priority: 0 for priority in Priority}
+
+    @contextmanager
+    def use(self, priority: Priority):
+        """Send requests made inside the block with the given priority"""
+        previous, self.current = self.current, priority
+        try:
+            yield
+        finally:
+            self.current = previous
+
+    def _roll_window(self) -> None:
+        now = self.clock()
+        if now >= self.reset_at:
+            self.reset_at = now + self.window
+            self.remaining = None
+            self.used = {priority: 0 for priority in Priority}
+
+    def _remaining(self) -> int:
+        if self.remaining is None:
+            return self.limit - sum(self.used.values())
+        return self.remaining
+
+    def _reserve(self, priority: Priority) -> float:
+        """Requests kept free for the classes above priority, for the rest of the window"""
+        left = min(1, self.retry_after() / self.window)
+        return self.reserve[priority] * self.limit * left
+
+    def retry_after(self) -> float:
+        return max(0, self.reset_at - self.clock())
+
+    def available(self, priority: Optional[Priority] = None) -> bool:
+        """Whether a request of the given priority may be sent now"""
+        priority = self.current if priority is None else priority
+        self._roll_window()
+        return (
+            self._remaining() > self._reserve(priority)
+            and self.used[priority] < self.share[priority] * self.limit
+        )
+
+    def acquire(self, url: str) -> None:
+        """Admit a request with the current priority or raise RequestDeferred"""
+        if not self.available():
+            logging.info(
+                f"{self.current.name} quota exhausted, remaining: {self._remaining()}, used: {self.used[self.current]}"
+            )
+            raise RequestDeferred(
+                url,
+                f"{self.current.name} quota exhausted",
+                retry_after=self.retry_after(),
+            )
+        self.used[self.current] += 1
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    def update(self, headers) -> None:
+        """Sync the quota window with the rate limit headers of a response"""
+        if "fitbit-rate-limit-limit" in headers:
+            self.limit = int(headers.get("fitbit-rate-limit-limit"))
+        if "fitbit-rate-limit-remaining" in headers:
+            self.remaining = int(headers.get("fitbit-rate-limit-remaining"))
+        if "fitbit-rate-limit-reset" in headers:
+            self.reset_at = self.clock() + int(headers.get("fitbit-rate-limit-reset"))
@@ -0,0 +1,127 @@
+import atexit, contextvars, itertools, json, logging, logging.handlers, os, queue, re
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional
+
+_context = contextvars.ContextVar("log_context", default={})
+_cycles = itertools.count(1)
+
+# Credentials in headers, urls or token responses
+REDACT = re.compile(
+    r"((?:Bearer|Basic)\s+|(?:access_token|refresh_token)['\"]?\s*[:=]\s*['\"]?)"
+    r"[^\s'\",&]+"
+)
+
+
+@contextmanager
+def context(**fields):
+    """Add fields to every record logged within the block"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def in_cycle(job, name: Optional[str] = None):
+    """job running as a new cycle, with the cycle number and job name in its records"""
+    name = name or getattr(job, "__name__", str(job))
+
+    @wraps(job)
+    def run(*args, **kwargs):
+        with context(cycle=next(_cycles), job=name):
+            return job(*args, **kwargs)
+
+    return run
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = _context.get()
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records unformatted, messages are built on the listener thread
+
+    Arguments of a record are formatted after the call returned, objects
+    passed as arguments should not be changed afterwards.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(context_text)s%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = getattr(record, "context", None) or {}
+        record.context_text = "".join(
+            f"{key}={value} " for key, value in context.items()
+        )
+        return REDACT.sub(r"\1***", super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, context fields at the top level"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            **(getattr(record, "context", None) or {}),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return REDACT.sub(r"\1***", json.dumps(entry, default=str))
+
+
+def _stop(listener: logging.handlers.QueueListener) -> None:
+    if listener._thread is not None:
+        listener.stop()
+
+
+def setup(
+    level: Optional[str] = None,
+    log_file: Optional[str] = None,
+    overwrite: Optional[bool] = None,
+    log_format: Optional[str] = None,
+) -> logging.handlers.QueueListener:
+    """Log through a queue, with handlers writing on a background thread
+
+    level: LOG_LEVEL, default INFO
+    log_file: FITBIT_LOG_FILE_PATH, only the console is written to when not set
+    overwrite: OVERWRITE_LOG_FILE, start a new log file instead of appending
+    log_format: LOG_FORMAT, "text" or "json", default text
+    """
+    level = (level or os.getenv(key="LOG_LEVEL", default="INFO")).upper()
+    log_file = log_file or os.getenv(key="FITBIT_LOG_FILE_PATH")
+    if overwrite is None:
+        overwrite = (
+            os.getenv(key="OVERWRITE_LOG_FILE", default="False").lower() == "true"
+        )
+    log_format = log_format or os.getenv(key="LOG_FORMAT", default="text")
+
+    formatter = JsonFormatter() if log_format == "json" else TextFormatter()
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, mode="w" if overwrite else "a"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    queueHandler = DeferredQueueHandler(records)
+    queueHandler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.handlers[:] = [queueHandler]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, *handlers)
+    listener.start()
+    # Write out what is still queued when the process exits
+    atexit.register(_stop, listener)
+    return listener
@@ -1,23 +1,53 @@
-import os, schedule, time, logging
+import time
+
+STARTED = time.perf_counter()
+
+import argparse, importlib, os, schedule, logging, sys, threading
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from fitbit import fitbit
+from logs import logs
+from archive import archive
 from db import db
-from syncronizer import syncronizer
+from subscriber import receiver
+from syncronizer import syncronizer, state
+
+IMPORTED = time.perf_counter()
 
 # Load environment variables
 load_dotenv()
 
 
-def main() -> None:
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s %(levelname)s %(message)s",
-        handlers=[
-            logging.FileHandler(os.getenv(key="FITBIT_LOG_FILE_PATH")),
-            logging.StreamHandler(),
-        ],
-    )
+def make_sink(names: list, dbClient: db.InfluxDBClient):
+    """Sink writing to the sinks named in SYNC_SINKS"""
+    sinks = []
+    for name in names:
+        if name == "influxdb":
+            sinks.append(dbClient)
+        elif name == "sqlite":
+            from db import sqlite
+
+            sinks.append(sqlite.SQLiteSink(os.getenv(key="SQLITE_SINK_PATH")))
+        elif name == "parquet":
+            from db import parquet
+
+            sinks.append(parquet.ParquetSink(os.getenv(key="PARQUET_SINK_PATH")))
+        elif name == "none":
+            from db import sink
+
+            sinks.append(sink.NullSink())
+        else:
+            raise ValueError(f"Unknown sink {name} in SYNC_SINKS")
+    if len(sinks) == 1:
+        return sinks[0]
+
+    from db import sink
+
+    return sink.FanOutSink(sinks)
+
+
+def setup() -> syncronizer.Syncronizer:
+    logs.setup()
 
     fitbitClient = fitbit.FitbitClient(
         os.getenv(key="FITBIT_CLIENT_ID"),
@@ -27,34 +57,275 @@ def main() -> None:
         initial_refresh_token=os.getenv(key="FITBIT_INITIAL_REFRESH_TOKEN"),
         device_name=os.getenv(key="FITBIT_DEVICE_NAME"),
         local_timezone=os.getenv(key="FITBIT_LOCAL_TIMEZONE"),
+        archive=(
+            archive.Archive(os.getenv(key="FITBIT_ARCHIVE_PATH"))
+            if os.getenv(key="FITBIT_ARCHIVE_PATH")
+            else None
+        ),
     )
 
-    dbClient = db.InfluxDBClient(
-        host=os.getenv(key="INFLUXDB_HOST"),
-        token=os.getenv(key="INFLUXDB_TOKEN"),
-        org=os.getenv(key="INFLUXDB_ORG"),
-        database=os.getenv(key="INFLUXDB_DATABASE"),
-    )
+    syncState = state.SyncState(os.getenv(key="SYNC_STATE_FILE_PATH"))
+    sinks = [
+        name.strip()
+        for name in os.getenv(key="SYNC_SINKS", default="influxdb").split(",")
+    ]
+    dbClient = None
+    if "influxdb" in sinks:
+        dbClient = db.InfluxDBClient(
+            host=os.getenv(key="INFLUXDB_HOST"),
+            token=os.getenv(key="INFLUXDB_TOKEN"),
+            org=os.getenv(key="INFLUXDB_ORG"),
+            database=os.getenv(key="INFLUXDB_DATABASE"),
+            dead_letter_path=os.getenv(key="INFLUXDB_DEAD_LETTER_FILE_PATH"),
+            gzip=os.getenv(key="INFLUXDB_GZIP", default="False").lower() == "true",
+            timeout=int(os.getenv(key="INFLUXDB_TIMEOUT_MS", default=60000)),
+            # Lets read caches of other processes see what was written
+            write_log=db.WriteLog(syncState),
+        )
+
+    sink = make_sink(sinks, dbClient)
 
     # Setup syncronizer
-    syncHelper = syncronizer.Syncronizer(fitbitClient=fitbitClient, dbClient=dbClient)
+    syncHelper = syncronizer.Syncronizer(
+        fitbitClient=fitbitClient,
+        dbClient=dbClient,
+        syncState=syncState,
+        sink=sink,
+    )
+    return syncHelper
 
-    # Schedule syncronizer
+
+def run_once(syncHelper: syncronizer.Syncronizer, args) -> int:
+    """Sync once and exit, 0 when everything synced, 2 when steps are left deferred"""
+    # Load the InfluxDB client while the first Fitbit requests are in flight
+    threading.Thread(
+        target=importlib.import_module, args=("influxdb_client_3",), daemon=True
+    ).start()
+
+    started = time.perf_counter()
+    logging.info(
+        f"Imports took {(IMPORTED - STARTED) * 1000:.0f} ms, "
+        f"startup {(started - STARTED) * 1000:.0f} ms"
+    )
+
+    deferred = logs.in_cycle(syncHelper.SyncOnce)(
+        args.since, args.until, args.resources, args.retry_wait
+    )
+    syncHelper.RecordLatencies()
+    logging.info(
+        f"Sync finished in {time.perf_counter() - started:.1f} seconds, "
+        f"{deferred} steps left deferred"
+    )
+    return 2 if deferred else 0
+
+
+def run_schedule(syncHelper: syncronizer.Syncronizer) -> None:
+    def today() -> str:
+        return datetime.now().strftime("%Y-%m-%d")
+
+    # Schedule syncronizer, the date is worked out on every run
     schedule.every(interval=10).minutes.do(
-        job_func=syncHelper.SyncFitbitActivitiesToInfluxdb,
-        date=datetime.now().strftime("%Y-%m-%d"),
+        job_func=logs.in_cycle(
+            lambda: syncHelper.SyncFitbitActivitiesToInfluxdb(date=today()),
+            name="SyncFitbitActivitiesToInfluxdb",
+        )
     )
 
     schedule.every(interval=10).minutes.do(
-        job_func=syncHelper.SyncFitbitToInfluxdb,
-        start_date=datetime.now().strftime("%Y-%m-%d"),
-        end_date=datetime.now().strftime("%Y-%m-%d"),
+        job_func=logs.in_cycle(
+            lambda: syncHelper.SyncFitbitToInfluxdb(
+                start_date=today(), end_date=today()
+            ),
+            name="SyncFitbitToInfluxdb",
+        )
+    )
+
+    # Backfill history with the quota left over by the jobs above
+    if os.getenv(key="FITBIT_BACKFILL_START_DATE"):
+        schedule.every(interval=10).minutes.do(
+            job_func=logs.in_cycle(syncHelper.SyncFitbitBackfillToInfluxdb),
+            start_date=os.getenv(key="FITBIT_BACKFILL_START_DATE"),
+            end_date=os.getenv(
+                key="FITBIT_BACKFILL_END_DATE",
+                default=(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d"),
+            ),
+        )
+
+    # Refill data missing in InfluxDB, through the retry queue below
+    if os.getenv(key="FITBIT_GAP_SCAN_DAYS"):
+        schedule.every(interval=1).days.do(
+            job_func=logs.in_cycle(syncHelper.RefillGaps),
+            days=int(os.getenv(key="FITBIT_GAP_SCAN_DAYS")),
+        )
+
+    # Sync what Fitbit notifies about, instead of waiting for the next poll
+    if os.getenv(key="FITBIT_SUBSCRIBER_PORT"):
+        subscriber = receiver.SubscriberServer(
+            ("", int(os.getenv(key="FITBIT_SUBSCRIBER_PORT"))),
+            client_secret=os.getenv(key="FITBIT_CLIENT_SECRET"),
+            verification_code=os.getenv(key="FITBIT_SUBSCRIBER_VERIFICATION_CODE"),
+        ).start()
+        schedule.every(interval=1).minutes.do(
+            job_func=logs.in_cycle(
+                lambda: syncHelper.SyncNotifications(subscriber.queue.drain()),
+                name="SyncNotifications",
+            )
+        )
+
+    # Retry steps deferred by rate limits or failing endpoints
+    schedule.every(interval=1).minutes.do(
+        job_func=logs.in_cycle(syncHelper.RunDeferredRetries)
     )
 
+    # Latencies and response sizes the capacity planner projects with
+    schedule.every(interval=1).hours.do(job_func=syncHelper.RecordLatencies)
+
     while True:
         schedule.run_pending()
         time.sleep(30)
 
 
+def run_plan(args) -> int:
+    """Print the projected Fitbit load of the configuration, 1 when it won't fit the quota"""
+    from fitbit import capacity
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    detail = os.getenv(key="FITBIT_HEART_RATE_DETAIL_LEVEL", default="1min")
+    incremental = (
+        os.getenv(key="FITBIT_INTRADAY_INCREMENTAL", default="True").lower() == "true"
+    )
+    backfill = []
+    if args.backfill_start:
+        backfill = syncronizer.backfill_urls(
+            args.backfill_start, args.backfill_end, detail
+        )
+
+    recorded = state.SyncState(os.getenv(key="SYNC_STATE_FILE_PATH")).section("latency")
+    projection = capacity.project(
+        live_steps=syncronizer.intraday_urls(today, detail, incremental),
+        daily_steps=syncronizer.interval_steps(
+            today,
+            today,
+            os.getenv(key="FITBIT_SLEEP_INCREMENTAL", default="True").lower() == "true",
+        ),
+        backfill_urls=backfill,
+        cadence_minutes=args.cadence_minutes,
+        limit=args.limit,
+        accounts=args.accounts,
+        costs=capacity.Costs(recorded),
+    )
+
+    requests = projection.requests_per_hour
+    print(
+        f"Latencies and sizes of {len(recorded)} recorded endpoints and range sizes, defaults for the others"
+    )
+    print(
+        f"Requests per hour and account: {requests['LIVE']:.0f} live, "
+        f"{requests['DAILY']:.0f} daily, {projection.served_per_hour:.0f} served "
+        f"with backfill, limit {args.limit}"
+    )
+    print(
+        f"Requests per hour of {args.accounts} accounts: "
+        f"{args.accounts * projection.served_per_hour:.0f}, "
+        f"{projection.bytes_per_hour / 2**20:.1f} MB of responses"
+    )
+    print(
+        f"Cycle every {args.cadence_minutes} minutes, "
+        f"{projection.cycle_seconds:.1f} seconds in Fitbit requests"
+    )
+    deferred = projection.deferred_per_hour
+    print(
+        f"Steps deferred per hour: {deferred['LIVE']:.1f} live, "
+        f"{deferred['DAILY']:.1f} daily, {projection.deferred} waiting for quota after a day"
+    )
+    if backfill:
+        completion = (
+            f"completes in {projection.backfill_hours / 24:.1f} days"
+            if projection.backfill_hours is not None
+            else "doesn't complete"
+        )
+        print(
+            f"Backfill from {args.backfill_start} to {args.backfill_end}: "
+            f"{projection.backfill_requests} requests, {completion}"
+        )
+    for warning in projection.warnings:
+        print("WARNING: " + warning)
+    return 1 if projection.warnings else 0
+
+
+def resource_names(value: str) -> list:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in syncronizer.RESOURCES]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown resources {', '.join(unknown)}, "
+            f"choose from {', '.join(syncronizer.RESOURCES)}"
+        )
+    return names
+
+
+def main() -> int:
+    """Sync Fitbit to InfluxDB on a schedule, or once with the once command"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    commands = parser.add_subparsers(dest="command")
+    once = commands.add_parser("once", help="sync once and exit, e.g. from a CronJob")
+    once.add_argument("--since", default=today, help="first date, default today")
+    once.add_argument("--until", default=today, help="last date, default today")
+    once.add_argument(
+        "--resources",
+        type=resource_names,
+        help="comma separated resources, default all: "
+        + ", ".join(syncronizer.RESOURCES),
+    )
+    once.add_argument(
+        "--retry-wait",
+        type=float,
+        default=120,
+        help="seconds to wait at most for deferred steps to be retried, default 120",
+    )
+    plan = commands.add_parser(
+        "plan", help="project the Fitbit load of the configuration before deploying it"
+    )
+    plan.add_argument("--accounts", type=int, default=1, help="accounts synced alike")
+    plan.add_argument(
+        "--cadence-minutes", type=int, default=10, help="minutes between sync cycles"
+    )
+    plan.add_argument(
+        "--limit",
+        type=int,
+        default=int(os.getenv(key="FITBIT_RATE_LIMIT_PER_HOUR", default=150)),
+        help="hourly request quota, default FITBIT_RATE_LIMIT_PER_HOUR",
+    )
+    plan.add_argument(
+        "--backfill-start",
+        default=os.getenv(key="FITBIT_BACKFILL_START_DATE"),
+        help="first date to backfill, default FITBIT_BACKFILL_START_DATE",
+    )
+    plan.add_argument(
+        "--backfill-end",
+        default=os.getenv(
+            key="FITBIT_BACKFILL_END_DATE",
+            default=(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d"),
+        ),
+        help="last date to backfill, default FITBIT_BACKFILL_END_DATE or yesterday",
+    )
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        return run_plan(args)
+
+    syncHelper = setup()
+    if args.command == "once":
+        try:
+            return run_once(syncHelper, args)
+        except Exception:
+            logging.exception("Sync failed")
+            return 1
+
+    run_schedule(syncHelper)
+    return 0
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
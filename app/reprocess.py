@@ -0,0 +1,120 @@
+import argparse, logging, os, sys, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+from archive import archive, replay
+from db import db
+from syncronizer import syncronizer
+
+# Load environment variables
+load_dotenv()
+
+
+def write_results(dbClient: db.InfluxDBClient, results: list) -> bool:
+    """Write what replay.replay_day returned, False when some of it wasn't written"""
+    written = True
+    for result in results:
+        if not len(result):
+            continue
+        if isinstance(result, list):
+            written &= dbClient.write_points_to_influxdb(points=result)
+        else:
+            written &= dbClient.write_dataframe_to_influxdb(
+                result, measurement="HeartRate_Intraday", tag_columns=["Device"]
+            )
+    return written
+
+
+def main() -> int:
+    """Rebuild InfluxDB points from archived Fitbit responses, without calling Fitbit"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "--archive",
+        default=os.getenv(key="FITBIT_ARCHIVE_PATH"),
+        help="archive directory, default FITBIT_ARCHIVE_PATH",
+    )
+    parser.add_argument("--start", help="first date to reprocess, YYYY-MM-DD")
+    parser.add_argument("--end", help="last date to reprocess, YYYY-MM-DD")
+    parser.add_argument(
+        "--measurement",
+        action="append",
+        default=[],
+        help="measurement to rebuild, can be repeated, default all",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="days processed in parallel"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="transform without writing to InfluxDB"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    if not args.archive:
+        parser.error("no archive, set --archive or FITBIT_ARCHIVE_PATH")
+
+    resources = {resource[0]: resource for resource in syncronizer.resource_list}
+    days = replay.plan_replay(
+        archive.Archive(args.archive),
+        resources,
+        start_date=args.start,
+        end_date=args.end,
+        measurements=args.measurement,
+    )
+    logging.info(f"Reprocessing {len(days)} days from {args.archive}")
+
+    dbClient = None
+    if not args.dry_run:
+        dbClient = db.InfluxDBClient(
+            host=os.getenv(key="INFLUXDB_HOST"),
+            token=os.getenv(key="INFLUXDB_TOKEN"),
+            org=os.getenv(key="INFLUXDB_ORG"),
+            database=os.getenv(key="INFLUXDB_DATABASE"),
+            dead_letter_path=os.getenv(key="INFLUXDB_DEAD_LETTER_FILE_PATH"),
+            gzip=os.getenv(key="INFLUXDB_GZIP", default="False").lower() == "true",
+            timeout=int(os.getenv(key="INFLUXDB_TIMEOUT_MS", default=60000)),
+        )
+
+    started = time.monotonic()
+    total_points = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(
+                replay.replay_day,
+                args.archive,
+                calls,
+                os.getenv(key="FITBIT_DEVICE_NAME"),
+                args.measurement,
+            ): day
+            for day, calls in days.items()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            day = futures[future]
+            try:
+                results = future.result()
+            except Exception as err:
+                logging.error(f"Reprocessing {day} failed: {err}")
+                failed += 1
+                continue
+
+            points = sum(len(result) for result in results)
+            if dbClient is not None and not write_results(dbClient, results):
+                logging.error(f"Reprocessing {day} failed: not all points were written")
+                failed += 1
+            total_points += points
+
+            elapsed = time.monotonic() - started
+            logging.info(
+                f"Reprocessed {day} ({done}/{len(days)}): {points} points, {total_points} total, {elapsed:.0f} seconds elapsed"
+            )
+
+    logging.info(
+        f"Reprocessed {len(days) - failed} days, {total_points} points in {time.monotonic() - started:.0f} seconds"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
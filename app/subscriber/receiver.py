@@ -0,0 +1,134 @@
+import base64, hashlib, hmac, json, logging, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+COLLECTIONS = ("activities", "body", "sleep", "userRevokedAccess")
+
+
+def sign(body: bytes, client_secret: str) -> str:
+    """X-Fitbit-Signature of a notification body"""
+    digest = hmac.new((client_secret + "&").encode(), body, hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+def verify_signature(body: bytes, signature: Optional[str], client_secret: str) -> bool:
+    return signature is not None and hmac.compare_digest(
+        sign(body, client_secret), signature
+    )
+
+
+class NotificationQueue:
+    """Collections and dates Fitbit notified about, each pending once until drained
+
+    Fitbit sends a notification for every device sync, often several for the
+    same collection and date within minutes. They are folded into one sync.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, notifications: List[dict]) -> int:
+        """Queue notifications, returns how many were not pending yet"""
+        added = 0
+        with self._lock:
+            for notification in notifications:
+                collection = (
+                    notification.get("collectionType")
+                    if isinstance(notification, dict)
+                    else None
+                )
+                if collection not in COLLECTIONS:
+                    logging.warning(f"Ignoring notification: {notification}")
+                    continue
+                key = (collection, notification.get("date"))
+                if key not in self._pending:
+                    self._pending[key] = notification
+                    added += 1
+        return added
+
+    def drain(self) -> List[Tuple[str, str]]:
+        """Pending (collection, date) pairs in the order they arrived"""
+        with self._lock:
+            pending, self._pending = list(self._pending), {}
+        return pending
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class SubscriberHandler(BaseHTTPRequestHandler):
+    """Endpoint of a Fitbit subscriber
+
+    GET answers the verification handshake, POST takes notifications. Both
+    answer 204 or 404 as Fitbit expects, notifications are only queued so
+    the answer comes well within Fitbit's 5 second limit.
+    """
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        code = self.server.verification_code
+        if code and query.get("verify") == [code]:
+            self._answer(204)
+        else:
+            self._answer(404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not verify_signature(
+            body, self.headers.get("X-Fitbit-Signature"), self.server.client_secret
+        ):
+            logging.error("Dropping notification with an invalid signature")
+            self._answer(404)
+            return
+
+        try:
+            notifications = json.loads(body)
+            if not isinstance(notifications, list):
+                raise ValueError("not a list")
+        except ValueError:
+            logging.error(f"Dropping malformed notification: {body!r}")
+            self._answer(400)
+            return
+
+        added = self.server.queue.add(notifications)
+        logging.info(f"Received {len(notifications)} notifications, {added} new")
+        self._answer(204)
+
+    def _answer(self, status: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logging.debug("Subscriber: " + format % args)
+
+
+class SubscriberServer(ThreadingHTTPServer):
+    """HTTP receiver for the Fitbit Subscription API, serving on a background thread"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        client_secret: str,
+        verification_code: Optional[str],
+        queue: Optional[NotificationQueue] = None,
+    ):
+        super().__init__(address, SubscriberHandler)
+        self.client_secret = client_secret
+        self.verification_code = verification_code
+        self.queue = queue or NotificationQueue()
+        self._thread = None
+
+    def start(self) -> "SubscriberServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Fitbit subscriber listening on port {self.server_address[1]}")
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,172 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, NamedTuple, Optional
+import pandas as pd
+
+
+class GapRule(NamedTuple):
+    """How completeness of a measurement is checked
+
+    measurement: measurement written by the sync
+    per_hour: points expected in every local hour, None when any point makes a day complete
+    max_days: longest range of missing days refilled with one request
+    """
+
+    measurement: str
+    per_hour: Optional[int] = None
+    max_days: int = 1
+
+
+# Intraday activity has a point for every minute of a past day, zeros included
+GAP_RULES = [
+    GapRule("Calories_Intraday", per_hour=60),
+    GapRule("Distance_Intraday", per_hour=60),
+    GapRule("Steps_Intraday", per_hour=60),
+    GapRule("HeartRate_Intraday"),
+    GapRule("RestingHR"),
+    GapRule("HRV_Intraday", max_days=30),
+    GapRule("TempSkin", max_days=30),
+    GapRule("BreathingRate", max_days=30),
+    GapRule("SPO2", max_days=30),
+    GapRule("Total Steps", max_days=30),
+]
+
+
+class Gap(NamedTuple):
+    """Missing data of a measurement, from start_date to end_date
+
+    start_time and end_time narrow a single day down to HH:MM minutes, both
+    are None when whole days are missing.
+    """
+
+    measurement: str
+    start_date: str
+    end_date: str
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+
+
+def hour_origin(timezone, day: date) -> str:
+    """Origin aligning hour bins with local hours, for zones with a half hour offset"""
+    offset = timezone.localize(datetime.combine(day, datetime.min.time())).utcoffset()
+    minutes = int(offset.total_seconds() // 60) % 60
+    return f"1970-01-01T00:{minutes:02d}:00Z"
+
+
+def local_hours(timezone, day: date) -> pd.DatetimeIndex:
+    """UTC start of every local hour of day, 23 or 25 of them on DST changes"""
+    start = timezone.localize(datetime.combine(day, datetime.min.time()))
+    end = timezone.localize(
+        datetime.combine(day + timedelta(days=1), datetime.min.time())
+    )
+    return pd.date_range(start, end, freq="h", inclusive="left").tz_convert("UTC")
+
+
+def find_gaps(
+    rule: GapRule, counts: pd.Series, start_date: str, end_date: str, timezone
+) -> List[Gap]:
+    """Gaps of one measurement from hourly point counts
+
+    counts: number of points per hour, indexed by the UTC start of local hours
+    """
+    counts = counts[counts > 0]
+    counts.index = pd.to_datetime(counts.index, utc=True)
+    present_days = set(counts.index.tz_convert(timezone).strftime("%Y-%m-%d"))
+
+    gaps = []
+    missing = []
+    day = date.fromisoformat(start_date)
+    while day <= date.fromisoformat(end_date):
+        day_str = day.isoformat()
+        if day_str not in present_days:
+            missing.append(day_str)
+        elif rule.per_hour:
+            gaps += _missing_hours(rule, counts, day, timezone)
+        day += timedelta(days=1)
+
+    # Consecutive missing days are refilled together, up to max_days at once
+    run = []
+    for day_str in missing + [None]:
+        if run and (
+            day_str is None
+            or len(run) == rule.max_days
+            or date.fromisoformat(day_str) - date.fromisoformat(run[-1])
+            != timedelta(days=1)
+        ):
+            gaps.append(Gap(rule.measurement, run[0], run[-1]))
+            run = []
+        if day_str:
+            run.append(day_str)
+    return sorted(gaps, key=lambda gap: (gap.start_date, gap.start_time or ""))
+
+
+def _missing_hours(rule: GapRule, counts: pd.Series, day: date, timezone) -> List[Gap]:
+    hours = local_hours(timezone, day)
+    incomplete = hours[~hours.isin(counts.index[counts >= rule.per_hour])]
+    if not len(incomplete):
+        return []
+
+    # One window from the first to the last incomplete hour, a request costs
+    # more quota than the complete minutes it fetches again
+    last = incomplete[-1] + pd.Timedelta(minutes=59)
+    return [
+        Gap(
+            rule.measurement,
+            day.isoformat(),
+            day.isoformat(),
+            incomplete[0].tz_convert(timezone).strftime("%H:%M"),
+            last.tz_convert(timezone).strftime("%H:%M"),
+        )
+    ]
+
+
+class GapScanner:
+    """Finds missing data in InfluxDB with hourly count queries instead of reading points"""
+
+    def __init__(self, dbClient, timezone, rules: Iterable[GapRule] = GAP_RULES):
+        """
+        dbClient: influxdb client with a query method
+        timezone: local timezone of the Fitbit account
+        rules: measurements to scan
+        """
+        self.dbClient = dbClient
+        self.timezone = timezone
+        self.rules = list(rules)
+
+    def hourly_counts(self, measurement: str, start_date: str, end_date: str):
+        """Points per local hour of measurement from start_date to end_date"""
+        first = date.fromisoformat(start_date)
+        start = local_hours(self.timezone, first)[0]
+        end = local_hours(self.timezone, date.fromisoformat(end_date))[-1]
+        frame = self.dbClient.query(
+            f"SELECT date_bin(INTERVAL '1 hour', time, "
+            f"TIMESTAMP '{hour_origin(self.timezone, first)}') AS hour, "
+            f"count(*) AS points "
+            f'FROM "{measurement}" '
+            f"WHERE time >= '{start.isoformat()}' "
+            f"AND time < '{(end + pd.Timedelta(hours=1)).isoformat()}' "
+            f"GROUP BY hour"
+        )
+        if frame is None or not len(frame):
+            return pd.Series(dtype="int64", index=pd.DatetimeIndex([], tz="UTC"))
+        return frame.set_index(pd.to_datetime(frame["hour"], utc=True))["points"]
+
+    def scan(self, start_date: str, end_date: str) -> List[Gap]:
+        """Gaps of every measurement from start_date to end_date"""
+        gaps = []
+        for rule in self.rules:
+            try:
+                counts = self.hourly_counts(rule.measurement, start_date, end_date)
+            except Exception as err:
+                # Without counts every day would look missing, skip the measurement instead
+                logging.error(f"Unable to scan {rule.measurement} for gaps: {err}")
+                continue
+
+            found = find_gaps(rule, counts, start_date, end_date, self.timezone)
+            if found:
+                logging.info(
+                    f"Found {len(found)} gaps in {rule.measurement} "
+                    f"from {start_date} to {end_date}"
+                )
+            gaps += found
+        return gaps
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import pandas as pd
+
+ROLLUP_MEASUREMENTS = (
+    "Steps_Intraday",
+    "HeartRate_Intraday",
+    "Calories_Intraday",
+    "SPO2_Intraday",
+)
+AGGREGATES = ["sum", "mean", "min", "max", "count"]
+
+
+class Rollup:
+    """Hourly and daily aggregates of intraday measurements, kept up to date as points arrive
+
+    Readings are kept per series (measurement and tags) for the latest local
+    days. When points arrive, only the hours and days they fall in are
+    aggregated again, from all readings kept for those days, so late minutes
+    update the aggregates instead of replacing them.
+
+    Syncs only fetch the minutes after a watermark, so a day that isn't kept,
+    after a restart or for an older day, is first seeded with the readings
+    read already holds for it. Without read, or when reading fails, only
+    hours from the first reading of the day on are aggregated, and the day
+    only when its readings start at local midnight, so partial aggregates
+    never replace complete ones.
+
+    Aggregates are written to <measurement>_1h and <measurement>_1d, with
+    sum, mean, min, max and count fields and the tags of the series.
+    """
+
+    def __init__(
+        self,
+        timezone,
+        measurements: Iterable[str] = ROLLUP_MEASUREMENTS,
+        max_days: int = 7,
+        read: Optional[Callable[..., pd.DataFrame]] = None,
+    ):
+        """read: reads readings written before, like InfluxDBClient.read"""
+        self.timezone = timezone
+        self.measurements = set(measurements)
+        self.max_days = max_days
+        self.read = read
+        self.days: Dict[Tuple, "OrderedDict[str, pd.Series]"] = {}
+        # Start of the complete buckets of days kept without being seeded
+        self.complete_from: Dict[Tuple, pd.Timestamp] = {}
+
+    def update(self, points: list) -> list:
+        """Rollup points for the buckets touched by points"""
+        series = {}
+        for point in points:
+            if point["measurement"] not in self.measurements:
+                continue
+            key = (
+                point["measurement"],
+                tuple(sorted((point.get("tags") or {}).items())),
+            )
+            times, values = series.setdefault(key, ([], []))
+            times.append(point["time"])
+            values.append(point["fields"]["value"])
+
+        rollups = []
+        for (measurement, tags), (times, values) in series.items():
+            rollups += self.update_series(
+                measurement, tags, pd.to_datetime(times, utc=True), values
+            )
+        return rollups
+
+    def update_series(self, measurement: str, tags: Tuple, times, values) -> list:
+        """Rollup points for the buckets touched by readings of one series
+
+        times: UTC timestamps of the readings
+        values: values of the readings
+        """
+        if measurement not in self.measurements or not len(times):
+            return []
+
+        new = pd.Series(
+            pd.to_numeric(values, errors="coerce"), index=pd.DatetimeIndex(times)
+        ).dropna()
+        local_days = new.index.tz_convert(self.timezone).strftime("%Y-%m-%d")
+
+        kept = self.days.setdefault((measurement, tags), OrderedDict())
+        rollups = []
+        for day, readings in new.groupby(local_days):
+            start = self._day_start(day)
+            if day in kept:
+                merged = pd.concat([kept[day], readings])
+            else:
+                seeded = self._seed(measurement, tags, day)
+                merged = readings
+                if seeded is not None and len(seeded):
+                    merged = pd.concat([seeded, readings])
+                if seeded is None and readings.index[0] > start:
+                    self.complete_from[(measurement, tags, day)] = readings.index[0]
+            merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+            kept[day] = merged
+            complete_from = self.complete_from.get((measurement, tags, day), start)
+
+            hour_starts = self._hour_starts(merged.index)
+            hourly = merged.groupby(hour_starts).agg(AGGREGATES)
+            hours = self._hour_starts(readings.index).unique()
+            hourly = hourly[hourly.index.isin(hours) & (hourly.index >= complete_from)]
+            rollups += self._points(measurement + "_1h", tags, hourly)
+
+            if complete_from <= start:
+                daily = merged.agg(AGGREGATES).to_frame().T
+                daily.index = pd.DatetimeIndex([start])
+                rollups += self._points(measurement + "_1d", tags, daily)
+
+        # The oldest days go first, so backfilled days don't push out today
+        while len(kept) > self.max_days:
+            day = min(kept)
+            del kept[day]
+            self.complete_from.pop((measurement, tags, day), None)
+        return rollups
+
+    def _day_start(self, day: str) -> pd.Timestamp:
+        return pd.Timestamp(day).tz_localize(self.timezone).tz_convert("UTC")
+
+    def _seed(self, measurement: str, tags: Tuple, day: str) -> Optional[pd.Series]:
+        """Readings read holds for a local day, None when they can't be read"""
+        if self.read is None:
+            return None
+        next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+        try:
+            frame = self.read(
+                measurement,
+                self._day_start(day).isoformat(),
+                self._day_start(next_day).isoformat(),
+                fields=["value"],
+                tags=dict(tags),
+            )
+        except Exception as err:
+            logging.warning(
+                "Unable to read %s of %s for rollups, only complete hours are rolled up: %s",
+                measurement,
+                day,
+                err,
+            )
+            return None
+        return pd.Series(
+            pd.to_numeric(frame["value"], errors="coerce").values,
+            index=pd.DatetimeIndex(pd.to_datetime(frame["time"], utc=True)),
+        ).dropna()
+
+    def _hour_starts(self, index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+        # Local hours, which differ from UTC hours in zones with a half hour offset
+        local = index.tz_convert(self.timezone)
+        return index - pd.to_timedelta(local.minute * 60 + local.second, unit="s")
+
+    def _points(self, measurement: str, tags: Tuple, frame: pd.DataFrame) -> List[dict]:
+        return [
+            {
+                "measurement": measurement,
+                "time": time.isoformat(),
+                "tags": dict(tags),
+                "fields": {
+                    "sum": float(row["sum"]),
+                    "mean": float(row["mean"]),
+                    "min": float(row["min"]),
+                    "max": float(row["max"]),
+                    "count": int(row["count"]),
+                },
+            }
+            for time, row in frame.iterrows()
+        ]
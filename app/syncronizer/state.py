@@ -0,0 +1,56 @@
+import json, logging, os
+from typing import Any, Optional
+
+
+class SyncState:
+    """Sync progress, such as watermarks and cursors, kept between runs
+
+    State is stored as sections of key/value pairs in a json file. Without a
+    path the state only lives in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.data = {}
+        self.mtime = None
+        self.reload()
+
+    def reload(self) -> None:
+        """Read the state again if another process saved it since"""
+        if not (self.path and os.path.exists(self.path)):
+            return
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+
+        try:
+            with open(self.path, "r") as file:
+                self.data = json.load(file)
+            self.mtime = mtime
+        except ValueError as err:
+            logging.error(f"Unable to read sync state {self.path}: {err}")
+
+    def get(self, section: str, key: str, default: Any = None) -> Any:
+        return self.data.get(section, {}).get(key, default)
+
+    def set(self, section: str, key: str, value: Any) -> None:
+        self.data.setdefault(section, {})[key] = value
+        self.save()
+
+    def delete(self, section: str, key: str) -> None:
+        self.data.get(section, {}).pop(key, None)
+        self.save()
+
+    def section(self, section: str) -> dict:
+        return self.data.setdefault(section, {})
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        # Write to a temporary file first, so a crash never leaves half a file
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.data, file)
+        os.replace(tmp_path, self.path)
+        self.mtime = os.path.getmtime(self.path)
@@ -1,6 +1,12 @@
-from fitbit import fitbit
+from fitbit import endpoints, fitbit, retry
+from fitbit.scheduler import Priority
 from db import db
-import logging
+from logs import logs
+from syncronizer import state
+from datetime import date as Date, datetime, timedelta
+from functools import partial
+from typing import Any, Callable, List, NamedTuple
+import logging, os, time
 
 resource_list = [
     ("calories", "Calories_Intraday", "1min", 1),
@@ -9,21 +15,316 @@ resource_list = [
     ("heart", "HeartRate_Intraday", "1min", 1),
 ]
 
+# Interval steps synced for each collection of Fitbit subscription notifications,
+# values computed from sleep come with the sleep notification
+COLLECTION_STEPS = {
+    "activities": ["Activity Summary"],
+    "body": ["Body data"],
+    "sleep": [
+        "Sleep",
+        "HRV",
+        "Breathing",
+        "Temperature - Skin",
+        "SP02 Intraday",
+        "SP02 Summary",
+    ],
+}
+
+# Steps of the one-shot sync, by the resource name given on the command line
+RESOURCES = {
+    "calories": "Calories_Intraday",
+    "distance": "Distance_Intraday",
+    "steps": "Steps_Intraday",
+    "heart": "HeartRate_Intraday",
+    "hr-zones": "HR zones",
+    "battery": "Battery level",
+    "hrv": "HRV",
+    "body": "Body data",
+    "temperature": "Temperature - Skin",
+    "cardio-score": "CardioScore - VO2Max",
+    "sleep": "Sleep",
+    "breathing": "Breathing",
+    "spo2-intraday": "SP02 Intraday",
+    "spo2": "SP02 Summary",
+    "activity-summary": "Activity Summary",
+}
+
+# Intraday steps backfilled for past days, the battery level is only ever the current one
+BACKFILL_INTRADAY_STEPS = [resource[1] for resource in resource_list] + ["HR zones"]
+
+# Steps synced for a date range, by name, with the FitbitClient method serving them
+INTERVAL_STEPS = [
+    ("HRV", "get_intraday_hrv_by_interval"),
+    ("Body data", "get_body_data_by_interval"),
+    ("Temperature - Skin", "get_temperature_skin_by_interval"),
+    ("CardioScore - VO2Max", "get_vo2max_cardio_score_by_interval"),
+    ("Sleep", "get_sleep_log_by_interval"),
+    ("Breathing", "get_breathing_rate_by_interval"),
+    ("SP02 Intraday", "get_spo2_by_interval"),
+    ("SP02 Summary", "get_spo2_summary_by_interval"),
+    ("Activity Summary", "get_activity_summary_by_interval"),
+]
+
+
+def intraday_urls(
+    date: str,
+    heart_rate_detail: str = "1min",
+    incremental: bool = False,
+    battery: bool = True,
+) -> List[str]:
+    """Urls the intraday steps of a day request, windows after a watermark when incremental"""
+    start_time = "00:00" if incremental else None
+    resources = [
+        resource
+        for resource in resource_list
+        if resource[0] != "heart" or heart_rate_detail == "1min"
+    ]
+    if heart_rate_detail != "1min":
+        resources.append(("heart", "HeartRate_Intraday", heart_rate_detail, 1))
+    urls = fitbit.intraday_activity_urls(date, resources, start_time)
+    urls.append(fitbit.heart_rate_zones_url(date))
+    if battery:
+        urls.append(fitbit.DEVICES_URL)
+    return urls
+
+
+def interval_steps(
+    start_date: str, end_date: str, incremental_sleep: bool = False
+) -> List[List[str]]:
+    """Urls of every interval step for a date range, sleep listed from start_date when incremental"""
+    steps = []
+    for name, method in INTERVAL_STEPS:
+        if name == "Sleep" and incremental_sleep:
+            steps.append([fitbit.sleep_log_list_url(start_date)])
+        else:
+            steps.append(fitbit.REQUEST_URLS[method](start_date, end_date))
+    return steps
+
+
+def interval_urls(
+    start_date: str, end_date: str, incremental_sleep: bool = False
+) -> List[str]:
+    """Urls the interval steps request for a date range, sleep listed from start_date when incremental"""
+    return [
+        url
+        for step in interval_steps(start_date, end_date, incremental_sleep)
+        for url in step
+    ]
+
+
+def backfill_urls(
+    start_date: str, end_date: str, heart_rate_detail: str = "1min", chunk_days=30
+) -> List[str]:
+    """Urls SyncFitbitBackfillToInfluxdb requests, in order"""
+    first = Date.fromisoformat(start_date)
+    last = Date.fromisoformat(end_date)
+    urls = []
+    day = first
+    while day <= last:
+        if (day - first).days % chunk_days == 0:
+            chunk_end = min(day + timedelta(days=chunk_days - 1), last)
+            urls += interval_urls(day.isoformat(), chunk_end.isoformat())
+        urls += intraday_urls(day.isoformat(), heart_rate_detail, battery=False)
+        day += timedelta(days=1)
+    return urls
+
+
+class Fetched(NamedTuple):
+    """What a fetch returns when it moves sync progress, such as a watermark
+
+    points: points, or a frame, to write
+    commit: keeps the progress, called only once points are written
+    """
+
+    points: Any
+    commit: Callable[[], None]
+
 
 class Syncronizer:
     """Methods to syncronize data between Fitbit and InfluxDB"""
 
-    def __init__(self, fitbitClient: fitbit.FitbitClient, dbClient: db.InfluxDBClient):
+    def __init__(
+        self,
+        fitbitClient: fitbit.FitbitClient,
+        dbClient: db.InfluxDBClient = None,
+        syncState: state.SyncState = None,
+        sink=None,
+    ):
         """Initialize Syncronizer object
 
         fitbitClient: authenticated fitbit client
-        dbClient: authenticated influxdb client
+        dbClient: authenticated influxdb client, gaps are only found with one
+        syncState: sync progress kept between runs, in memory when not given
+        sink: where points are written, see db.sink.Sink, dbClient when not given
         """
         self.fitbitClient = fitbitClient
         self.dbClient = dbClient
+        self.sink = sink or dbClient
+        self.syncState = syncState or state.SyncState()
+        self.retryQueue = retry.RetryQueue()
+        self.scheduler = fitbitClient.client.scheduler
+        self.incrementalIntraday = (
+            os.getenv(key="FITBIT_INTRADAY_INCREMENTAL", default="True").lower()
+            == "true"
+        )
+        self.intradayOverlap = timedelta(
+            minutes=int(os.getenv(key="FITBIT_INTRADAY_OVERLAP_MINUTES", default=15))
+        )
+        self.incrementalSleep = (
+            os.getenv(key="FITBIT_SLEEP_INCREMENTAL", default="True").lower() == "true"
+        )
+        self.sleepOverlap = timedelta(
+            days=int(os.getenv(key="FITBIT_SLEEP_OVERLAP_DAYS", default=2))
+        )
+        self.heartRateDetailLevel = os.getenv(
+            key="FITBIT_HEART_RATE_DETAIL_LEVEL", default="1min"
+        )
+        self.compactHeartRate = (
+            os.getenv(key="FITBIT_HEART_RATE_COMPACTION", default="False").lower()
+            == "true"
+        )
+        self.rollup = None
+        if os.getenv(key="SYNC_ROLLUPS", default="False").lower() == "true":
+            from syncronizer import rollup
+
+            # Days rolled up are seeded with what InfluxDB has of them
+            self.rollup = rollup.Rollup(
+                fitbit.LOCAL_TIMEZONE, read=dbClient.read if dbClient else None
+            )
+        self.transformPool = None
+        workers = int(os.getenv(key="SYNC_BACKFILL_WORKERS", default=0))
+        if workers and self.rollup is not None:
+            # Rollups are built from points, which never reach this process
+            logging.warning("SYNC_BACKFILL_WORKERS is not used with SYNC_ROLLUPS")
+        elif workers and self.sink is not dbClient:
+            # Workers encode line protocol, which only InfluxDB takes
+            logging.warning("SYNC_BACKFILL_WORKERS is only used with InfluxDB alone")
+        elif workers:
+            from syncronizer import transform
+
+            self.transformPool = transform.TransformPool(
+                workers,
+                fitbitClient.device_name,
+                write=dbClient.write_line_protocol,
+            )
 
         logging.info("Syncronizer initialized")
 
+    def _sync(self, name: str, fetch, write=None, **kwargs) -> bool:
+        """Fetch points and write them to InfluxDB, deferring the step if Fitbit can't serve it now
+
+        Backfill steps aren't deferred, the backfill fetches them again from its cursor.
+
+        name: name of the step, used in logs
+        fetch: FitbitClient method returning points, or a Fetched
+        write: writes what fetch returned, returning False when it didn't all get written,
+            points are written to InfluxDB when not given
+        kwargs: arguments for fetch
+        Returns whether the points were written, or handed to the transform pool
+        """
+        if write is None and self._transforming(fetch):
+            return self._transform(name, fetch, **kwargs)
+
+        # Retries keep the priority of the job that deferred them
+        step = dict(
+            fetch=fetch,
+            write=write or self._write_points,
+            priority=self.scheduler.current,
+            **kwargs,
+        )
+        try:
+            with logs.context(step=name):
+                return self._fetch_and_write(**step)
+        except retry.RequestDeferred as err:
+            logging.warning("%s deferred: %s", name, err)
+            if step["priority"] != Priority.BACKFILL:
+                self.retryQueue.push(
+                    name, self._fetch_and_write, step, retry_after=err.retry_after
+                )
+            return False
+
+    def _transforming(self, fetch=None) -> bool:
+        """Whether fetch is left to the transform pool, any FitbitClient method it can parse when not given"""
+        if self.transformPool is None or self.scheduler.current != Priority.BACKFILL:
+            return False
+        return fetch is None or (
+            getattr(fetch, "__self__", None) is self.fitbitClient
+            and fetch.__name__ in fitbit.REQUEST_URLS
+        )
+
+    def _transform(self, name: str, fetch, **kwargs) -> bool:
+        """Request the responses fetch needs here, and leave parsing them to the transform pool"""
+        try:
+            with logs.context(step=name):
+                responses = {
+                    url: self.fitbitClient.client.make_raw_request(url)
+                    for url in fitbit.REQUEST_URLS[fetch.__name__](**kwargs)
+                }
+        except retry.RequestDeferred as err:
+            # Only backfill steps are transformed, which are fetched again from the cursor
+            logging.warning("%s deferred: %s", name, err)
+            return False
+        self.transformPool.submit(
+            name, fetch.__name__, kwargs, responses, self.dbClient.schema.types
+        )
+        return True
+
+    def _fetch_and_write(self, fetch, write, priority: Priority, **kwargs) -> bool:
+        with self.scheduler.use(priority):
+            fetched = fetch(**kwargs)
+        if not isinstance(fetched, Fetched):
+            written = write(fetched) is not False
+        elif write(fetched.points) is not False:
+            fetched.commit()
+            written = True
+        else:
+            # Progress stays where it was, so the next sync fetches these points again
+            logging.warning("Not all points were written, keeping the sync progress")
+            written = False
+        self.sink.flush()
+        return written
+
+    def _write_points(self, points: list) -> bool:
+        written = self.sink.write_points(points)
+        if self.rollup is not None:
+            self._write_rollups(self.rollup.update(points))
+        return written
+
+    def _write_rollups(self, points: list) -> None:
+        if points:
+            self.sink.write_points(points)
+
+    def _write_heart_rate_frame(self, frame) -> bool:
+        if self.rollup is not None:
+            for device, readings in frame.groupby("Device"):
+                self._write_rollups(
+                    self.rollup.update_series(
+                        "HeartRate_Intraday",
+                        (("Device", device),),
+                        readings["time"],
+                        readings["value"],
+                    )
+                )
+        if self.compactHeartRate:
+            from fitbit import heart_rate
+
+            frame = heart_rate.compact_runs(frame)
+        return self.sink.write_frame(
+            frame, measurement="HeartRate_Intraday", tag_columns=["Device"]
+        )
+
+    def RecordLatencies(self) -> None:
+        """Keep the latencies and response sizes seen per Fitbit endpoint, for the capacity planner"""
+        tracker = getattr(self.fitbitClient.client, "latency", None)
+        if tracker is None:
+            return
+        self.syncState.section("latency").update(tracker.summary())
+        self.syncState.save()
+
+    def RunDeferredRetries(self) -> None:
+        """Retry deferred steps that are due"""
+        self.retryQueue.run_due()
+
     def SyncFitbitActivitiesToInfluxdb(self, date: str) -> None:
         """Syncronize intradata for all resources/activities with 24 hours limit from Fitbit to InfluxDB
 
@@ -32,17 +333,120 @@ class Syncronizer:
         """
         logging.info(f"Syncing Fitbit activities for date: {date}")
 
-        fitbit_data = self.fitbitClient.get_intraday_activity_by_date(
-            date, resource_list
-        )
-        self.dbClient.write_points_to_influxdb(points=fitbit_data)
+        with self.scheduler.use(Priority.LIVE):
+            self._sync_intraday(date)
+
+    def _sync_intraday(self, date: str, names=None) -> bool:
+        """Sync the intraday steps of a date, returns whether all of them were written"""
+
+        def wanted(name: str) -> bool:
+            return names is None or name in names
+
+        written = []
+
+        # One step per resource, so a deferred resource doesn't drop the others
+        for resource in resource_list:
+            if resource[0] == "heart" and self.heartRateDetailLevel != "1min":
+                continue
+            if not wanted(resource[1]):
+                continue
+            if self._transforming():
+                # Backfilled days are complete, there's no watermark to keep
+                written.append(
+                    self._sync(
+                        resource[1],
+                        self.fitbitClient.get_intraday_activity_by_date,
+                        date_str=date,
+                        measurement_list=[resource],
+                    )
+                )
+            else:
+                written.append(
+                    self._sync(
+                        resource[1],
+                        self._fetch_intraday_activity,
+                        date_str=date,
+                        resource=resource,
+                    )
+                )
 
-        fitbit_data = self.fitbitClient.get_intraday_heart_rate_by_date(date)
-        self.dbClient.write_points_to_influxdb(points=fitbit_data)
+        # Seconds level heart rate goes through the columnar pipeline
+        if self.heartRateDetailLevel != "1min" and wanted("HeartRate_Intraday"):
+            written.append(
+                self._sync(
+                    "HeartRate_Intraday",
+                    self._fetch_heart_rate_series,
+                    write=self._write_heart_rate_frame,
+                    date_str=date,
+                )
+            )
+
+        if wanted("HR zones"):
+            written.append(
+                self._sync(
+                    "HR zones",
+                    self.fitbitClient.get_intraday_heart_rate_by_date,
+                    date_str=date,
+                )
+            )
 
         # Battery level
-        fitbit_data = self.fitbitClient.get_battery_level()
-        self.dbClient.write_points_to_influxdb(points=fitbit_data)
+        if wanted("Battery level"):
+            written.append(
+                self._sync("Battery level", self.fitbitClient.get_battery_level)
+            )
+        return all(written)
+
+    def _intraday_start_time(self, key: str, date_str: str):
+        """Start of the window after the watermark, or None to fetch the whole day"""
+        watermark = self.syncState.get("intraday", key)
+        if not (self.incrementalIntraday and watermark):
+            return None
+
+        start = (
+            datetime.fromisoformat(watermark).astimezone(fitbit.LOCAL_TIMEZONE)
+            - self.intradayOverlap
+        )
+        if start.date().isoformat() != date_str:
+            return None
+        return start.strftime("%H:%M")
+
+    def _update_intraday_watermark(self, key: str, synced: list) -> None:
+        if not synced:
+            return
+
+        watermarks = self.syncState.section("intraday")
+        oldest = (Date.today() - timedelta(days=2)).isoformat()
+        for old_key in [k for k in watermarks if k.split("/")[0] < oldest]:
+            del watermarks[old_key]
+        self.syncState.set("intraday", key, max(synced))
+
+    def _fetch_intraday_activity(self, date_str: str, resource: tuple) -> Fetched:
+        """Fetch intraday activity for one resource, only the minutes after the last synced minute
+
+        The last minute with a non zero value is kept as watermark per date and
+        resource, once the points are written. The next fetch starts an overlap
+        before it, so minutes that arrive late from the tracker are picked up as
+        well.
+        """
+        key = date_str + "/" + resource[0]
+        points = self.fitbitClient.get_intraday_activity_by_date(
+            date_str, [resource], start_time=self._intraday_start_time(key, date_str)
+        )
+
+        synced = [point["time"] for point in points if point["fields"]["value"]]
+        return Fetched(points, partial(self._update_intraday_watermark, key, synced))
+
+    def _fetch_heart_rate_series(self, date_str: str) -> Fetched:
+        key = date_str + "/heart-" + self.heartRateDetailLevel
+        frame = self.fitbitClient.get_intraday_heart_rate_series_by_date(
+            date_str,
+            detail_level=self.heartRateDetailLevel,
+            start_time=self._intraday_start_time(key, date_str),
+        )
+
+        synced = [frame["time"].max().isoformat()] if len(frame) else []
+        return Fetched(frame, partial(self._update_intraday_watermark, key, synced))
 
     def SyncFitbitToInfluxdb(
         self, start_date: str, end_date: str, start_time=None, end_time=None
@@ -56,56 +460,298 @@ class Syncronizer:
         """
         logging.info(f"Syncing Fitbit data from {start_date} to {end_date}")
 
-        # HRV
-        results = self.fitbitClient.get_intraday_hrv_by_interval(
-            start_date=start_date, end_date=end_date
-        )
-        self.dbClient.write_points_to_influxdb(points=results)
+        with self.scheduler.use(Priority.DAILY):
+            self._sync_intervals(start_date, end_date)
 
-        # Body data
-        results = self.fitbitClient.get_body_data_by_interval(
-            start_date=start_date, end_date=end_date
-        )
-        self.dbClient.write_points_to_influxdb(points=results)
+    def SyncNotifications(self, notifications) -> None:
+        """Syncronize the collections and dates Fitbit notified about
 
-        # Temperature - Skin
-        results = self.fitbitClient.get_temperature_skin_by_interval(
-            start_date=start_date, end_date=end_date
-        )
-        self.dbClient.write_points_to_influxdb(points=results)
+        notifications: (collection, date) pairs from the subscriber
+        """
+        with self.scheduler.use(Priority.LIVE):
+            for collection, date in notifications:
+                if collection == "userRevokedAccess":
+                    logging.error("Fitbit access was revoked by the user")
+                    continue
 
-        # CardioScore - VO2Max
-        results = self.fitbitClient.get_vo2max_cardio_score_by_interval(
-            start_date=start_date, end_date=end_date
-        )
-        self.dbClient.write_points_to_influxdb(points=results)
+                logging.info(f"Syncing Fitbit {collection} for date: {date}")
+                if collection == "activities":
+                    self._sync_intraday(date)
+                self._sync_intervals(date, date, names=COLLECTION_STEPS[collection])
+
+    def _sync_intervals(self, start_date: str, end_date: str, names=None) -> bool:
+        """Sync the interval steps of a date range, returns whether all of them were written"""
+        written = []
+        for name, method in INTERVAL_STEPS:
+            if names is None or name in names:
+                fetch = getattr(self.fitbitClient, method)
+                # Backfilled ranges are fetched whole, there's no cursor to keep
+                if (
+                    name == "Sleep"
+                    and self.incrementalSleep
+                    and self.scheduler.current != Priority.BACKFILL
+                ):
+                    fetch = self._fetch_sleep_logs
+                written.append(
+                    self._sync(name, fetch, start_date=start_date, end_date=end_date)
+                )
+        return all(written)
+
+    def _fetch_sleep_logs(self, start_date: str, end_date: str) -> Fetched:
+        """Fetch the sleep logs that are new or changed since they were last synced
 
-        # Sleep
-        results = self.fitbitClient.get_sleep_log_by_interval(
-            start_date=start_date, end_date=end_date
+        Sleep logs are listed from a cursor, the latest date of sleep seen,
+        less an overlap, so logs Fitbit adds or edits late are listed again.
+        Only when start_date is before the first date ever listed from, the
+        logs are listed from start_date instead. A fingerprint of every
+        written log within the overlap is kept, and logs listed again with
+        the same fingerprint are skipped. Cursor and fingerprints are kept
+        once the points are written. Logs of nights after end_date are
+        synced as well, since they were fetched anyway.
+        """
+        cursor = self.syncState.get("sleep", "cursor")
+        listed_from = self.syncState.get("sleep", "listed_from")
+        since = start_date
+        if cursor and listed_from and start_date >= listed_from:
+            since = cursor
+        after = (Date.fromisoformat(since) - self.sleepOverlap).isoformat()
+        sleep_logs = self.fitbitClient.get_sleep_logs_after(after)
+
+        seen = self.syncState.section("sleep_logs")
+        changed = {}
+        for sleep_log in sleep_logs:
+            fingerprint = fitbit.sleep_log_fingerprint(sleep_log)
+            key = str(sleep_log["logId"])
+            if seen.get(key, [None, None])[1] != fingerprint:
+                changed[key] = sleep_log, fingerprint
+        logging.info(
+            f"{len(changed)} of {len(sleep_logs)} sleep logs are new or changed"
         )
-        self.dbClient.write_points_to_influxdb(points=results)
 
-        # Breathing
-        results = self.fitbitClient.get_breathing_rate_by_interval(
-            start_date=start_date, end_date=end_date
+        def synced() -> None:
+            seen = self.syncState.section("sleep_logs")
+            for key, (sleep_log, fingerprint) in changed.items():
+                seen[key] = [sleep_log["dateOfSleep"], fingerprint]
+            nights = [sleep_log["dateOfSleep"] for sleep_log in sleep_logs]
+            sleep = self.syncState.section("sleep")
+            if nights:
+                sleep["cursor"] = max(nights + [cursor or ""])
+            sleep["listed_from"] = min(listed_from or start_date, start_date)
+            # Logs of nights before the next listing are never listed again
+            if sleep.get("cursor"):
+                oldest = (
+                    Date.fromisoformat(sleep["cursor"]) - self.sleepOverlap
+                ).isoformat()
+                for key in [key for key, (night, _) in seen.items() if night <= oldest]:
+                    del seen[key]
+            self.syncState.save()
+
+        points = self.fitbitClient.sleep_log_points(
+            [sleep_log for sleep_log, _ in changed.values()]
         )
-        self.dbClient.write_points_to_influxdb(points=results)
+        return Fetched(points, synced)
 
-        # SP02 Intraday
-        results = self.fitbitClient.get_spo2_by_interval(
-            start_date=start_date, end_date=end_date
+    def RefillGaps(self, days: int) -> None:
+        """Find data missing in InfluxDB over the last days and defer refetches of just the gaps
+
+        A gap is kept as refilled once its refetch is written, gaps Fitbit
+        has no data for are not requested again on later scans. Refetches
+        lost to a restart, or given up on, are found again by the next scan.
+
+        days: number of complete days before today to scan
+        """
+        from syncronizer import gaps
+
+        if self.dbClient is None:
+            logging.warning("Gaps are only found in InfluxDB, not refilling gaps")
+            return
+
+        end = Date.today() - timedelta(days=1)
+        start = end - timedelta(days=days - 1)
+        found = gaps.GapScanner(self.dbClient, fitbit.LOCAL_TIMEZONE).scan(
+            start.isoformat(), end.isoformat()
         )
-        self.dbClient.write_points_to_influxdb(points=results)
 
-        # SP02 Summary
-        results = self.fitbitClient.get_spo2_summary_by_interval(
-            start_date=start_date, end_date=end_date
+        refilled = self.syncState.section("gaps")
+        for key in [k for k in refilled if refilled[k] < start.isoformat()]:
+            del refilled[key]
+
+        for gap in found:
+            key = "/".join(value for value in gap if value)
+            if key in refilled:
+                continue
+            name, fetch, kwargs = self._refill_step(gap)
+            if "Refill " + name in self.retryQueue:
+                continue
+            self.retryQueue.push(
+                "Refill " + name,
+                self._fetch_and_write,
+                dict(
+                    fetch=self._refetch_gap,
+                    write=(
+                        self._write_heart_rate_frame
+                        if fetch == self._fetch_heart_rate_series
+                        else self._write_points
+                    ),
+                    priority=Priority.BACKFILL,
+                    gap_fetch=fetch,
+                    gap_key=key,
+                    gap_end_date=gap.end_date,
+                    **kwargs,
+                ),
+            )
+
+    def _refetch_gap(self, gap_fetch, gap_key: str, gap_end_date: str, **kwargs):
+        """Fetch a gap with gap_fetch, keeping it as refilled once the points are written"""
+        fetched = gap_fetch(**kwargs)
+        if not isinstance(fetched, Fetched):
+            fetched = Fetched(fetched, lambda: None)
+
+        def refilled() -> None:
+            fetched.commit()
+            self.syncState.set("gaps", gap_key, gap_end_date)
+
+        return Fetched(fetched.points, refilled)
+
+    def _refill_step(self, gap):
+        """Name, fetch and arguments of the smallest request covering gap"""
+        if (
+            gap.measurement == "HeartRate_Intraday"
+            and self.heartRateDetailLevel != "1min"
+        ):
+            return (
+                f"{gap.measurement} {gap.start_date}",
+                self._fetch_heart_rate_series,
+                dict(date_str=gap.start_date),
+            )
+        for resource in resource_list:
+            if resource[1] == gap.measurement:
+                return (
+                    f"{gap.measurement} {gap.start_date} {gap.start_time or ''}",
+                    self.fitbitClient.get_intraday_activity_by_date,
+                    dict(
+                        date_str=gap.start_date,
+                        measurement_list=[resource],
+                        start_time=gap.start_time,
+                        end_time=gap.end_time,
+                    ),
+                )
+        if gap.measurement == "RestingHR":
+            return (
+                f"{gap.measurement} {gap.start_date}",
+                self.fitbitClient.get_intraday_heart_rate_by_date,
+                dict(date_str=gap.start_date),
+            )
+
+        fetch = {
+            "HRV_Intraday": self.fitbitClient.get_intraday_hrv_by_interval,
+            "TempSkin": self.fitbitClient.get_temperature_skin_by_interval,
+            "BreathingRate": self.fitbitClient.get_breathing_rate_by_interval,
+            "SPO2": self.fitbitClient.get_spo2_summary_by_interval,
+            "Total Steps": self.fitbitClient.get_activity_summary_by_interval,
+        }[gap.measurement]
+        return (
+            f"{gap.measurement} {gap.start_date} to {gap.end_date}",
+            fetch,
+            dict(start_date=gap.start_date, end_date=gap.end_date),
         )
-        self.dbClient.write_points_to_influxdb(points=results)
 
-        # Activity Summary
-        results = self.fitbitClient.get_activity_summary_by_interval(
-            start_date=start_date, end_date=end_date
+    def SyncOnce(
+        self, start_date: str, end_date: str, resources=None, retry_wait: float = 120
+    ) -> int:
+        """Syncronize resources from start_date to end_date once, for runs outside the schedule loop
+
+        Today is synced with live priority, earlier days with daily priority,
+        and the battery level only with today. Steps deferred by rate limits
+        or failing endpoints are retried once due, as long as that is within
+        retry_wait seconds. The retry queue is kept in memory, so steps still
+        deferred are dropped when the run exits, the caller reports them and
+        the range is synced again by running again.
+
+        resources: names from RESOURCES, all of them when not given
+        retry_wait: seconds the run waits at most for deferred steps to be due
+        Returns the number of steps still deferred
+        """
+        names = [RESOURCES[resource] for resource in resources or RESOURCES]
+        logging.info(
+            f"Syncing Fitbit {', '.join(resources or RESOURCES)} "
+            f"from {start_date} to {end_date}"
         )
-        self.dbClient.write_points_to_influxdb(points=results)
+
+        today = Date.today()
+        day = Date.fromisoformat(start_date)
+        while day <= Date.fromisoformat(end_date):
+            if day == today:
+                with self.scheduler.use(Priority.LIVE):
+                    self._sync_intraday(day.isoformat(), names)
+            else:
+                # The battery level is only ever the current one
+                with self.scheduler.use(Priority.DAILY):
+                    self._sync_intraday(
+                        day.isoformat(),
+                        [name for name in names if name != "Battery level"],
+                    )
+            day += timedelta(days=1)
+        with self.scheduler.use(Priority.DAILY):
+            for start, end in endpoints.date_ranges(start_date, end_date, 30):
+                self._sync_intervals(start, end, names)
+
+        deadline = time.monotonic() + retry_wait
+        while self.retryQueue:
+            wait = self.retryQueue.next_due()
+            if time.monotonic() + wait > deadline:
+                break
+            time.sleep(wait)
+            self.retryQueue.run_due()
+        return len(self.retryQueue)
+
+    def SyncFitbitBackfillToInfluxdb(
+        self, start_date: str, end_date: str, chunk_days: int = 30
+    ) -> None:
+        """Syncronize history from Fitbit to InfluxDB with the quota left over by live and daily syncs
+
+        Backfill moves forward one day at a time and stops as soon as the
+        backfill share of the quota is used up, continuing on the next run.
+        It also stops at a day with a step that was deferred or not written,
+        which the next run starts with, so the cursor only moves past days
+        that are written.
+
+        start_date: first date of the history to syncronize
+        end_date: last date of the history to syncronize
+        chunk_days: number of days fetched at once from interval endpoints
+        """
+        first = Date.fromisoformat(start_date)
+        last = Date.fromisoformat(end_date)
+        cursor = self.syncState.get("backfill", start_date)
+        started = day = Date.fromisoformat(cursor) if cursor else first
+
+        with self.scheduler.use(Priority.BACKFILL):
+            while day <= last and self.scheduler.available():
+                logging.info(f"Backfilling Fitbit data for date: {day}")
+                written = True
+                if (day - first).days % chunk_days == 0:
+                    chunk_end = min(day + timedelta(days=chunk_days - 1), last)
+                    written = self._sync_intervals(
+                        day.isoformat(), chunk_end.isoformat()
+                    )
+                if not (
+                    self._sync_intraday(day.isoformat(), BACKFILL_INTRADAY_STEPS)
+                    and written
+                ):
+                    logging.warning(
+                        f"Backfill of {day} is incomplete, continuing from it next run"
+                    )
+                    break
+                day += timedelta(days=1)
+
+            # Points left to the pool are only written once it is drained, the
+            # cursor stays where the run started when some of them weren't
+            if self.transformPool is not None and self.transformPool.drain():
+                logging.warning(
+                    "Not all backfilled points were written, keeping the backfill cursor"
+                )
+                day = started
+
+        self.syncState.set("backfill", start_date, day.isoformat())
+        if day > last:
+            logging.info(f"Backfill from {start_date} to {end_date} completed")
@@ -0,0 +1,137 @@
+"""Parsing of Fitbit responses in worker processes, for backfills
+
+Building points from responses is pure Python, so one process parses one
+response at a time however many cores there are. During backfills the
+Syncronizer keeps requesting in its own process, hands the raw response
+bodies to a TransformPool and writes the line protocol the workers return.
+"""
+
+import json, logging, multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from archive import replay
+from db import db, schema
+from fitbit import fitbit
+
+
+@lru_cache(maxsize=None)
+def _worker_client(device_name: str) -> Tuple[replay.ReplayClient, fitbit.FitbitClient]:
+    # One client per worker, so extractors are only built once
+    client = replay.ReplayClient()
+    return client, fitbit.FitbitClient(device_name=device_name, client=client)
+
+
+def _init_worker(level: int) -> None:
+    # Records of the parent's queue handler would never be written from here
+    logging.basicConfig(
+        level=level, format="%(asctime)s %(levelname)s %(message)s", force=True
+    )
+
+
+def transform(
+    method: str,
+    kwargs: dict,
+    responses: Dict[str, bytes],
+    device_name: str,
+    types: Dict[str, Dict[str, str]],
+) -> Tuple[bytes, list, int]:
+    """Line protocol of what a FitbitClient method returns for raw responses
+
+    responses: response body by url, as fetched with make_raw_request
+    types: field types InfluxDB has, points conflicting with them are rejected
+    Returns the line protocol, (point, reason) of rejected points and the number of points
+    """
+    client, fitbitClient = _worker_client(device_name)
+    client.responses = {url: json.loads(body) for url, body in responses.items()}
+    points = getattr(fitbitClient, method)(**kwargs)
+    body, rejected = db.encode_points(points, schema.SchemaCache(types))
+    return body, rejected, len(points)
+
+
+class TransformPool:
+    """Runs transform in worker processes and writes the results in submission order
+
+    Results are written once more than max_pending transforms are waiting,
+    and on drain, so a backfill doesn't hold all its responses in memory.
+    Transforms a worker fails on, or that a broken pool can't take, are
+    run in this process instead. Steps whose points weren't all written are
+    returned by drain, so callers can keep their sync progress.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        device_name: str,
+        write: Callable[[bytes, list], bool],
+        max_pending: int = None,
+    ):
+        """workers: number of worker processes
+        device_name: Device tag of the points
+        write: writes line protocol and rejected points, returning False when it didn't all get written,
+            e.g. InfluxDBClient.write_line_protocol
+        max_pending: transforms waiting to be written, default twice the workers
+        """
+        self.device_name = device_name
+        self.write = write
+        self.max_pending = max_pending or 2 * workers
+        self.pending: Deque[Tuple[str, tuple, Future]] = deque()
+        self.failed: List[str] = []
+        # Workers are spawned, forking would copy locks held by the logging
+        # and subscriber threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(logging.getLogger().getEffectiveLevel(),),
+        )
+
+    def submit(
+        self, name: str, method: str, kwargs: dict, responses: dict, types: dict
+    ) -> None:
+        """Transform responses of a FitbitClient method call, see transform
+
+        name: name of the step, used in logs
+        """
+        args = (method, kwargs, responses, self.device_name, types)
+        try:
+            future = self.executor.submit(transform, *args)
+        except BrokenProcessPool:
+            future = None
+        self.pending.append((name, args, future))
+        while len(self.pending) > self.max_pending:
+            self._write(*self.pending.popleft())
+
+    def drain(self) -> List[str]:
+        """Write every pending result
+
+        Returns names of the steps whose points weren't all written since the last drain
+        """
+        while self.pending:
+            self._write(*self.pending.popleft())
+        failed, self.failed = self.failed, []
+        return failed
+
+    def close(self) -> None:
+        self.drain()
+        self.executor.shutdown()
+
+    def _write(self, name: str, args: tuple, future: Optional[Future]) -> None:
+        try:
+            if future is None:
+                raise BrokenProcessPool("process pool is broken")
+            body, rejected, points = future.result()
+        except Exception as err:
+            logging.warning("Transforming %s in a worker failed: %r", name, err)
+            try:
+                body, rejected, points = transform(*args)
+            except Exception as err:
+                logging.error("Transforming %s failed: %s", name, err)
+                self.failed.append(name)
+                return
+        logging.info("Transformed %s: %d points", name, points)
+        if self.write(body, rejected) is False:
+            logging.warning("Not all points of %s were written", name)
+            self.failed.append(name)
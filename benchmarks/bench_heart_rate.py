@@ -0,0 +1,103 @@
+"""Benchmark the 1sec heart rate pipeline against the per record path
+
+Run from the repository root:
+
+    python -m benchmarks.bench_heart_rate --days 7
+"""
+
+import argparse, random, time
+from datetime import date, datetime, timedelta
+import pytz
+from influxdb_client_3.write_client.client.write.dataframe_serializer import (
+    DataframeSerializer,
+)
+from influxdb_client_3.write_client.client.write_api import PointSettings
+from app.fitbit import heart_rate
+
+TIMEZONE = pytz.timezone("Europe/Stockholm")
+
+
+def synthetic_day(seed: int) -> list:
+    rng = random.Random(seed)
+    value = 60
+    dataset = []
+    for second in range(86_400):
+        if rng.random() < 0.2:
+            value = max(40, min(190, value + rng.randint(-2, 2)))
+        dataset.append(
+            {
+                "time": f"{second // 3600:02}:{second // 60 % 60:02}:{second % 60:02}",
+                "value": value,
+            }
+        )
+    return dataset
+
+
+def per_record(date_str: str, dataset: list) -> list:
+    """The record at a time path used by get_intraday_activity_by_date"""
+    records = []
+    for value in dataset:
+        log_time = datetime.fromisoformat(date_str + "T" + value["time"])
+        utc_time = TIMEZONE.localize(log_time).astimezone(pytz.utc).isoformat()
+        records.append(
+            {
+                "measurement": "HeartRate_Intraday",
+                "time": utc_time,
+                "tags": {"Device": "bench"},
+                "fields": {"value": int(value["value"])},
+            }
+        )
+    return records
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+
+    days = [
+        ((date(2024, 3, 25) + timedelta(days=n)).isoformat(), synthetic_day(n))
+        for n in range(args.days)
+    ]
+    points = 86_400 * args.days
+    totals = {"per record": 0.0, "vectorized": 0.0, "compaction": 0.0, "serialize": 0.0}
+    rows = 0
+
+    for date_str, dataset in days:
+        _, elapsed = timed(per_record, date_str, dataset)
+        totals["per record"] += elapsed
+
+        frame, elapsed = timed(heart_rate.parse_dataset, date_str, dataset, TIMEZONE)
+        totals["vectorized"] += elapsed
+        frame["Device"] = "bench"
+
+        frame, elapsed = timed(heart_rate.compact_runs, frame)
+        totals["compaction"] += elapsed
+        rows += len(frame)
+
+        serializer = DataframeSerializer(
+            frame,
+            PointSettings(),
+            precision="s",
+            data_frame_measurement_name="HeartRate_Intraday",
+            data_frame_tag_columns=["Device"],
+            data_frame_timestamp_column="time",
+        )
+        _, elapsed = timed(serializer.serialize)
+        totals["serialize"] += elapsed
+
+    print(f"{args.days} days, {points} readings, {rows} rows after compaction")
+    for stage, elapsed in totals.items():
+        print(
+            f"{stage:>12}: {elapsed:8.3f} s  {points / elapsed:12,.0f} readings/s  {elapsed / args.days:6.3f} s/day"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark the line protocol encoder against the client's dict serialization
+
+Run from the repository root:
+
+    python -m benchmarks.bench_line_protocol --points 100000
+"""
+
+import argparse, time, tracemalloc
+from datetime import datetime, timedelta, timezone
+from influxdb_client_3 import Point
+from app.db.line_protocol import LineProtocolEncoder
+
+
+def synthetic_points(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "measurement": "Steps_Intraday",
+            "time": (start + timedelta(minutes=n)).isoformat(),
+            "tags": {"Device": "Charge 6"},
+            "fields": {"value": n % 120},
+        }
+        for n in range(count)
+    ]
+
+
+def client_path(points: list) -> bytes:
+    """What InfluxDBClient3.write does with a list of dicts"""
+    return "\n".join(
+        Point.from_dict(point, write_precision="s").to_line_protocol()
+        for point in points
+    ).encode()
+
+
+def measure(func, *args):
+    """Time func without tracing, then trace its peak allocation in a second run"""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=100_000)
+    args = parser.parse_args()
+
+    points = synthetic_points(args.points)
+    encoder = LineProtocolEncoder()
+
+    runs = [
+        ("client dicts", client_path, points),
+        ("encoder dicts", encoder.encode, points),
+        ("encoder dicts, warm", encoder.encode, points),
+    ]
+    expected = None
+    for name, func, data in runs:
+        body, elapsed, peak = measure(func, data)
+        expected = expected or body
+        assert body == expected, f"{name} output differs"
+        print(
+            f"{name:>20}: {args.points / elapsed:12,.0f} points/s  {peak / args.points:8.0f} bytes/point peak  {len(body) / args.points:5.1f} bytes/line"
+        )
+
+
+if __name__ == "__main__":
+    main()
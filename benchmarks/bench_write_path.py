@@ -0,0 +1,94 @@
+"""Benchmark write_points_to_influxdb against a local InfluxDB stand-in
+
+Run from the repository root:
+
+    python -m benchmarks.bench_write_path --points 100000 --batch-size 1000 --batch-size 10000
+    python -m benchmarks.bench_write_path --latency 0.05 --gzip
+    python -m benchmarks.bench_write_path --poison-rate 0.0001
+"""
+
+import argparse, logging, os, tempfile, time
+from datetime import datetime, timedelta, timezone
+from app.db.db import InfluxDBClient
+from tests.standins.influxdb import InfluxDBStandIn
+
+
+def synthetic_points(count: int, poison_rate: float) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    poison_every = int(1 / poison_rate) if poison_rate else 0
+    return [
+        {
+            "measurement": "Steps_Intraday",
+            "time": (start + timedelta(minutes=n)).isoformat(),
+            "tags": {
+                "Device": (
+                    "poison"
+                    if poison_every and n % poison_every == poison_every - 1
+                    else "Charge 6"
+                )
+            },
+            "fields": {"value": n % 120},
+        }
+        for n in range(count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, action="append")
+    parser.add_argument("--latency", type=float, default=0, help="seconds per request")
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="share of writes failing with 500"
+    )
+    parser.add_argument(
+        "--poison-rate", type=float, default=0, help="share of points rejected with 400"
+    )
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    # Rejected points are expected here, keep their logs out of the results
+    logging.disable(logging.ERROR)
+
+    points = synthetic_points(args.points, args.poison_rate)
+    standin = InfluxDBStandIn(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        reject=lambda point: point.tags.get("Device") == "poison",
+    ).start()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for batch_size in args.batch_size or [1_000, 10_000, 50_000]:
+                dead_letter_path = os.path.join(directory, f"{batch_size}.jsonl")
+                client = InfluxDBClient(
+                    standin.url,
+                    "token",
+                    "org",
+                    "database",
+                    dead_letter_path=dead_letter_path,
+                    gzip=args.gzip,
+                )
+                standin.reset()
+
+                start = time.perf_counter()
+                for n in range(0, len(points), batch_size):
+                    client.write_points_to_influxdb(points[n : n + batch_size])
+                elapsed = time.perf_counter() - start
+
+                rejected = 0
+                if os.path.exists(dead_letter_path):
+                    with open(dead_letter_path) as file:
+                        rejected = sum(1 for _ in file)
+                print(
+                    f"batch {batch_size:>7,}: {len(standin.points) / elapsed:10,.0f} points/s  "
+                    f"{standin.requests:6,} requests  "
+                    f"{standin.bytes_received / len(points):5.1f} bytes/point sent  "
+                    f"{len(standin.points):8,} written  {rejected:6,} dead lettered"
+                )
+    finally:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Soak test sync cycles against local Fitbit and InfluxDB stand-ins at accelerated time
+
+Runs the jobs of the schedule loop back to back, each cycle moving a virtual
+clock forward by the schedule interval, for one or many accounts. RSS, open
+file descriptors, threads, cycle latency and throughput are sampled after
+every cycle, and the run fails when one of them trends upward (or downward,
+for throughput) beyond its tolerance.
+
+Run from the repository root:
+
+    python -m benchmarks.soak --cycles 2000
+    python -m benchmarks.soak --cycles 500 --accounts 5 --backfill-days 60
+    python -m benchmarks.soak --cycles 300 --heart-rate-detail 1sec --tracemalloc
+"""
+
+import argparse, csv, gc, logging, os, resource, statistics, sys, tempfile, threading
+import json, time, tracemalloc
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# The syncronizer imports its packages like main.py does, from within app/
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+os.environ.setdefault("FITBIT_LOCAL_TIMEZONE", "UTC")
+
+from fitbit import fitbit, retry, scheduler
+from db import db
+from syncronizer import syncronizer, state
+from tests.standins.fitbit_api import FitbitAPIStandIn
+from tests.standins.influxdb import InfluxDBStandIn
+
+
+class VirtualClock:
+    """Seconds since the start of the run, moved forward by advance"""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self) -> float:
+        return self.seconds
+
+    def advance(self, seconds: float) -> None:
+        self.seconds += seconds
+
+
+def rss_mb() -> float:
+    """Resident set size of this process, the peak where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def open_fds() -> Optional[int]:
+    for directory in ("/proc/self/fd", "/dev/fd"):
+        if os.path.isdir(directory):
+            return len(os.listdir(directory))
+    return None
+
+
+def growth(values: List[float]) -> float:
+    """Median of the last third of values minus the median of the first third"""
+    third = max(1, len(values) // 3)
+    return statistics.median(values[-third:]) - statistics.median(values[:third])
+
+
+def account(
+    n: int,
+    directory: str,
+    clock: VirtualClock,
+    rate_limit: int,
+    influxdb_url: str,
+) -> syncronizer.Syncronizer:
+    """Syncronizer of the nth account, with its tokens and sync state in directory"""
+    token_path = os.path.join(directory, f"tokens-{n}.json")
+    with open(token_path, "w") as file:
+        json.dump({"access_token": f"access-{n}", "refresh_token": "refresh"}, file)
+
+    fitbitClient = fitbit.FitbitClient(
+        client_id="soak",
+        client_secret="soak",
+        token_path=token_path,
+        device_name=f"Soak {n}",
+    )
+    # Quota windows and retries follow the virtual clock
+    fitbitClient.client.scheduler = scheduler.RequestScheduler(
+        limit=rate_limit, clock=clock
+    )
+
+    syncState = state.SyncState(os.path.join(directory, f"state-{n}.json"))
+    dbClient = db.InfluxDBClient(
+        influxdb_url,
+        "token",
+        "org",
+        "database",
+        dead_letter_path=os.path.join(directory, f"dead-letter-{n}.jsonl"),
+        write_log=db.WriteLog(syncState),
+    )
+    syncHelper = syncronizer.Syncronizer(
+        fitbitClient=fitbitClient, dbClient=dbClient, syncState=syncState
+    )
+    syncHelper.retryQueue = retry.RetryQueue(clock=clock)
+    return syncHelper
+
+
+def run_cycle(
+    accounts: List[syncronizer.Syncronizer], now: datetime, backfill: Optional[tuple]
+) -> int:
+    """Run the jobs of one schedule interval for every account, returning how many failed"""
+    today = now.strftime("%Y-%m-%d")
+    jobs = []
+    for syncHelper in accounts:
+        jobs += [
+            (syncHelper.SyncFitbitActivitiesToInfluxdb, dict(date=today)),
+            (
+                syncHelper.SyncFitbitToInfluxdb,
+                dict(start_date=today, end_date=today),
+            ),
+        ]
+        if backfill:
+            jobs.append(
+                (
+                    syncHelper.SyncFitbitBackfillToInfluxdb,
+                    dict(start_date=backfill[0], end_date=backfill[1]),
+                )
+            )
+        jobs.append((syncHelper.RunDeferredRetries, {}))
+
+    failed = 0
+    for job, kwargs in jobs:
+        try:
+            job(**kwargs)
+        except Exception:
+            # The schedule loop would stop here, so this fails the run
+            logging.exception("%s failed", job.__name__)
+            failed += 1
+    return failed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=1000)
+    parser.add_argument("--accounts", type=int, default=1)
+    parser.add_argument(
+        "--cycle-minutes", type=int, default=10, help="virtual minutes per cycle"
+    )
+    parser.add_argument(
+        "--backfill-days", type=int, default=0, help="days of history to backfill"
+    )
+    parser.add_argument("--rate-limit", type=int, default=150, help="requests per hour")
+    parser.add_argument("--heart-rate-detail", default="1min", choices=["1min", "1sec"])
+    parser.add_argument(
+        "--warmup", type=float, default=0.1, help="share of cycles left out of trends"
+    )
+    parser.add_argument("--max-rss-growth-mb", type=float, default=20)
+    parser.add_argument("--max-fd-growth", type=int, default=4)
+    parser.add_argument("--max-thread-growth", type=int, default=2)
+    parser.add_argument(
+        "--max-latency-growth",
+        type=float,
+        default=0.5,
+        help="share the cycle duration may grow by",
+    )
+    parser.add_argument(
+        "--max-throughput-drop",
+        type=float,
+        default=0.5,
+        help="share the points written per second may drop by",
+    )
+    parser.add_argument("--report-every", type=int, default=100)
+    parser.add_argument("--csv", help="file the samples of every cycle are written to")
+    parser.add_argument(
+        "--tracemalloc", action="store_true", help="show where memory grew"
+    )
+    parser.add_argument("--log-level", default="CRITICAL")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    os.environ["FITBIT_HEART_RATE_DETAIL_LEVEL"] = args.heart_rate_detail
+
+    # Cycles end about now, so watermarks of past days are pruned like in production
+    clock = VirtualClock()
+    started_at = datetime.now().replace(second=0, microsecond=0) - timedelta(
+        minutes=args.cycles * args.cycle_minutes
+    )
+    backfill = None
+    if args.backfill_days:
+        backfill = (
+            (started_at - timedelta(days=args.backfill_days)).strftime("%Y-%m-%d"),
+            (started_at - timedelta(days=1)).strftime("%Y-%m-%d"),
+        )
+
+    fitbitAPI = FitbitAPIStandIn(
+        now=lambda: started_at + timedelta(seconds=clock()),
+        clock=clock,
+        limit=args.rate_limit,
+    ).start()
+    influxdb = InfluxDBStandIn(keep_points=False).start()
+    os.environ["FITBIT_API_BASE"] = fitbitAPI.url
+
+    samples: List[Dict[str, float]] = []
+    failed = 0
+    warmup = int(args.cycles * args.warmup)
+    snapshot = None
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            accounts = [
+                account(n, directory, clock, args.rate_limit, influxdb.url)
+                for n in range(args.accounts)
+            ]
+            for cycle in range(args.cycles):
+                clock.advance(args.cycle_minutes * 60)
+                requests, written = fitbitAPI.requests, influxdb.written
+
+                start = time.perf_counter()
+                failed += run_cycle(
+                    accounts, started_at + timedelta(seconds=clock()), backfill
+                )
+                elapsed = time.perf_counter() - start
+
+                gc.collect()
+                samples.append(
+                    {
+                        "cycle": cycle,
+                        "seconds": elapsed,
+                        "requests": fitbitAPI.requests - requests,
+                        "points": influxdb.written - written,
+                        "points_per_second": (influxdb.written - written) / elapsed,
+                        "rss_mb": rss_mb(),
+                        "fds": open_fds() or 0,
+                        "threads": threading.active_count(),
+                        "deferred": sum(len(a.retryQueue) for a in accounts),
+                    }
+                )
+                if cycle == warmup and args.tracemalloc:
+                    tracemalloc.start(25)
+                    snapshot = tracemalloc.take_snapshot()
+                if (cycle + 1) % args.report_every == 0:
+                    sample = samples[-1]
+                    print(
+                        f"cycle {cycle + 1:>6,}  {sample['seconds'] * 1000:7.1f} ms  "
+                        f"{sample['requests']:4} requests  {sample['points']:7,} points  "
+                        f"rss {sample['rss_mb']:7.1f} MB  fds {sample['fds']:4}  "
+                        f"threads {sample['threads']:3}  deferred {sample['deferred']:4}"
+                    )
+
+            if snapshot is not None:
+                print("Largest memory growth since the end of the warmup:")
+                for stat in tracemalloc.take_snapshot().compare_to(
+                    snapshot, "traceback"
+                )[:10]:
+                    print(stat)
+                    print("\n".join(stat.traceback.format()[-4:]))
+            for syncHelper in accounts:
+                syncHelper.dbClient.close()
+    finally:
+        fitbitAPI.stop()
+        influxdb.stop()
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(samples[0]))
+            writer.writeheader()
+            writer.writerows(samples)
+
+    measured = samples[warmup:]
+    series = {name: [sample[name] for sample in measured] for name in measured[0]}
+    seconds = statistics.median(series["seconds"][: max(1, len(measured) // 3)])
+    throughput = statistics.median(
+        series["points_per_second"][: max(1, len(measured) // 3)]
+    )
+    checks = [
+        ("RSS", growth(series["rss_mb"]), args.max_rss_growth_mb, "MB"),
+        ("Open file descriptors", growth(series["fds"]), args.max_fd_growth, ""),
+        ("Threads", growth(series["threads"]), args.max_thread_growth, ""),
+        (
+            "Cycle duration",
+            growth(series["seconds"]) * 1000,
+            args.max_latency_growth * seconds * 1000,
+            "ms",
+        ),
+        (
+            "Throughput drop",
+            -growth(series["points_per_second"]),
+            args.max_throughput_drop * throughput,
+            "points/s",
+        ),
+    ]
+
+    print(
+        f"{args.cycles:,} cycles of {args.cycle_minutes} minutes for {args.accounts} accounts: "
+        f"{sum(series['requests']):,} Fitbit requests, {sum(series['points']):,} points, "
+        f"{failed} failed jobs"
+    )
+    trending = failed > 0
+    for name, grew, tolerance, unit in checks:
+        verdict = "FAIL" if grew > tolerance else "ok"
+        trending |= grew > tolerance
+        print(
+            f"{name:>22}: {grew:+10.2f} {unit:<8} tolerance {tolerance:.2f}  {verdict}"
+        )
+    return 1 if trending else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+"""Stand-in for the Fitbit Web API endpoints FitbitClient requests
+
+Serves synthetic but well formed responses for every date, derived from the
+date so repeated requests get the same data, with the fitbit-rate-limit-*
+headers of a per token hourly quota. Data of the current day ends at now(),
+so a clock moved forward by a test makes new minutes appear.
+"""
+
+import json, random, re, threading, time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+DATE = r"(\d{4}-\d{2}-\d{2})"
+TIME = r"(\d{2}:\d{2})"
+
+ACTIVITY_METRICS = {
+    "minutesSedentary": 700,
+    "minutesLightlyActive": 200,
+    "minutesFairlyActive": 30,
+    "minutesVeryActive": 20,
+    "distance": 6,
+    "calories": 2400,
+    "steps": 9000,
+}
+
+
+def _days(start: str, end: str) -> List[str]:
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    return [
+        (first + timedelta(days=n)).isoformat() for n in range((last - first).days + 1)
+    ]
+
+
+def _rng(*key) -> random.Random:
+    return random.Random("/".join(map(str, key)))
+
+
+class FitbitAPIHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        token = self.headers.get("Authorization", "")
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        remaining, reset = server.take(token)
+        headers = {
+            "fitbit-rate-limit-limit": str(server.limit),
+            "fitbit-rate-limit-remaining": str(max(remaining, 0)),
+            "fitbit-rate-limit-reset": str(reset),
+        }
+        if remaining < 0:
+            self._answer(429, {"errors": [{"errorType": "request"}]}, headers)
+            return
+        with server.lock:
+            status = server.failures.pop(0) if server.failures else None
+        if status is not None:
+            self._answer(status, {"errors": [{"errorType": "system"}]}, headers)
+            return
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        for pattern, respond in server.routes:
+            match = pattern.fullmatch(url.path)
+            if match:
+                self._answer(200, respond(*match.groups(), **params), headers)
+                return
+        self._answer(404, {"errors": [{"errorType": "not_found"}]}, headers)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlparse(self.path).path != "/oauth2/token":
+            self._answer(404, {"errors": [{"errorType": "not_found"}]})
+            return
+        self._answer(200, {"access_token": "access", "refresh_token": "refresh"})
+
+    def _answer(self, status: int, body, headers: Optional[dict] = None) -> None:
+        data = json.dumps(body).encode()
+        with self.server.lock:
+            self.server.bytes_sent += len(data)
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FitbitAPIStandIn(ThreadingHTTPServer):
+    """Local Fitbit Web API serving on a background thread
+
+    now: local time of the account, data of later minutes and days is left out
+    clock: seconds the hourly quota is tracked with
+    limit: requests per hour and token, answered with 429 once used up
+    latency: seconds every request is delayed
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ("127.0.0.1", 0),
+        now: Callable[[], datetime] = datetime.now,
+        clock: Callable[[], float] = time.monotonic,
+        limit: int = 150,
+        latency: float = 0,
+    ):
+        super().__init__(address, FitbitAPIHandler)
+        self.now = now
+        self.clock = clock
+        self.limit = limit
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.quota: Dict[str, Tuple[float, int]] = {}
+        self.edited: Dict[str, dict] = {}
+        self.failures: List[int] = []
+        self.requests = 0
+        self.bytes_sent = 0
+        self.routes = [
+            (re.compile(pattern), respond)
+            for pattern, respond in [
+                (
+                    rf"/1/user/-/activities/(\w+)/date/{DATE}/1d/(\w+)(?:/time/{TIME}/{TIME})?\.json",
+                    self.intraday,
+                ),
+                (rf"/1/user/-/activities/heart/date/{DATE}/1d\.json", self.heart_zones),
+                (
+                    rf"/1/user/-/activities/tracker/(\w+)/date/{DATE}/{DATE}\.json",
+                    self.activity_series,
+                ),
+                (r"/1/user/-/devices\.json", self.devices),
+                (rf"/1\.2/user/-/sleep/date/{DATE}/{DATE}\.json", self.sleep),
+                (r"/1\.2/user/-/sleep/list\.json", self.sleep_list),
+                (rf"/1/user/-/hrv/date/{DATE}/{DATE}\.json", self.hrv),
+                (rf"/1/user/-/body/log/weight/date/{DATE}/{DATE}\.json", self.weight),
+                (
+                    rf"/1/user/-/temp/skin/date/{DATE}/{DATE}\.json",
+                    self.skin_temperature,
+                ),
+                (rf"/1/user/-/cardioscore/date/{DATE}/{DATE}\.json", self.cardio_score),
+                (rf"/1/user/-/br/date/{DATE}/{DATE}\.json", self.breathing_rate),
+                (rf"/1/user/-/spo2/date/{DATE}/{DATE}/all\.json", self.spo2_intraday),
+                (rf"/1/user/-/spo2/date/{DATE}/{DATE}\.json", self.spo2_summary),
+            ]
+        ]
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on slow responses are expected, e.g. when testing timeouts
+        pass
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def fail_next(self, count: int = 1, status: int = 500) -> None:
+        """Fail the next count requests with status"""
+        with self.lock:
+            self.failures += [status] * count
+
+    def take(self, token: str) -> Tuple[int, int]:
+        """Count a request of token, returning the remaining quota, negative once exceeded, and seconds to reset"""
+        with self.lock:
+            now = self.clock()
+            reset_at, used = self.quota.get(token, (now + 3600, 0))
+            if now >= reset_at:
+                reset_at, used = now + 3600, 0
+            self.quota[token] = (reset_at, used + 1)
+        return self.limit - used - 1, int(reset_at - now)
+
+    def _past(self, days: List[str]) -> List[str]:
+        today = self.now().date().isoformat()
+        return [day for day in days if day <= today]
+
+    def intraday(self, resource, day, detail, start=None, end=None):
+        step = 1 if detail == "1sec" else 60 * int(re.sub(r"\D", "", detail) or 1)
+        first = datetime.fromisoformat(f"{day}T{start or '00:00'}")
+        last = min(datetime.fromisoformat(f"{day}T{end or '23:59'}:59"), self.now())
+        rng = _rng(resource, day, detail)
+        dataset = []
+        moment = first
+        while moment <= last:
+            value = rng.randint(50, 150) if resource == "heart" else rng.randint(0, 30)
+            if resource == "distance":
+                value /= 1000
+            dataset.append({"time": moment.strftime("%H:%M:%S"), "value": value})
+            moment += timedelta(seconds=step)
+        return {
+            f"activities-{resource}": [{"dateTime": day, "value": "0"}],
+            f"activities-{resource}-intraday": {
+                "dataset": dataset,
+                "datasetInterval": 1,
+                "datasetType": "second" if detail == "1sec" else "minute",
+            },
+        }
+
+    def heart_zones(self, day):
+        rng = _rng("heart", day)
+        zones = [
+            {"name": name, "minutes": rng.randint(0, 600)}
+            for name in ("Out of Range", "Fat Burn", "Cardio", "Peak")
+        ]
+        return {
+            "activities-heart": [
+                {
+                    "dateTime": day,
+                    "value": {
+                        "heartRateZones": zones,
+                        "restingHeartRate": rng.randint(50, 70),
+                    },
+                }
+                for day in self._past([day])
+            ]
+        }
+
+    def activity_series(self, metric, start, end):
+        typical = ACTIVITY_METRICS.get(metric, 100)
+        return {
+            f"activities-tracker-{metric}": [
+                {
+                    "dateTime": day,
+                    "value": str(_rng(metric, day).randint(0, 2 * typical)),
+                }
+                for day in self._past(_days(start, end))
+            ]
+        }
+
+    def devices(self):
+        return [
+            {
+                "batteryLevel": 80,
+                "deviceVersion": "Charge 6",
+                "lastSyncTime": self.now().strftime("%Y-%m-%dT%H:%M:%S.000"),
+                "type": "TRACKER",
+            }
+        ]
+
+    def sleep_log(self, day: str) -> dict:
+        """Sleep log of the night before day, with the changes in edited[day]"""
+        rng = _rng("sleep", day)
+        asleep = datetime.fromisoformat(day) - timedelta(minutes=rng.randint(60, 120))
+        stages, moment = [], asleep
+        for _ in range(rng.randint(20, 40)):
+            seconds = 30 * rng.randint(2, 40)
+            stages.append(
+                {
+                    "dateTime": moment.strftime("%Y-%m-%dT%H:%M:%S.000"),
+                    "level": rng.choice(["wake", "light", "deep", "rem"]),
+                    "seconds": seconds,
+                }
+            )
+            moment += timedelta(seconds=seconds)
+        minutes = int((moment - asleep).total_seconds() // 60)
+        return {
+            "dateOfSleep": day,
+            "logId": int(day.replace("-", "")),
+            "startTime": asleep.strftime("%Y-%m-%dT%H:%M:%S.000"),
+            "endTime": moment.strftime("%Y-%m-%dT%H:%M:%S.000"),
+            "efficiency": rng.randint(80, 99),
+            "isMainSleep": True,
+            "minutesAfterWakeup": 0,
+            "minutesAsleep": minutes - 30,
+            "minutesAwake": 30,
+            "minutesToFallAsleep": 0,
+            "timeInBed": minutes,
+            "type": "stages",
+            "levels": {
+                "data": stages,
+                "summary": {
+                    stage: {"minutes": minutes // 4}
+                    for stage in ("deep", "light", "rem", "wake")
+                },
+            },
+            **self.edited.get(day, {}),
+        }
+
+    def sleep(self, start, end):
+        return {"sleep": [self.sleep_log(day) for day in self._past(_days(start, end))]}
+
+    def sleep_list(self, afterDate, sort="asc", offset="0", limit="100"):
+        first = (date.fromisoformat(afterDate[:10]) + timedelta(days=1)).isoformat()
+        days = self._past(_days(first, self.now().date().isoformat()))
+        offset, limit = int(offset), min(int(limit), 100)
+        page = days[offset : offset + limit]
+        next_url = ""
+        if offset + limit < len(days):
+            next_url = (
+                "https://api.fitbit.com/1.2/user/-/sleep/list.json?afterDate="
+                + afterDate
+                + f"&sort={sort}&offset={offset + limit}&limit={limit}"
+            )
+        return {
+            "sleep": [self.sleep_log(day) for day in page],
+            "pagination": {
+                "afterDate": afterDate,
+                "limit": limit,
+                "next": next_url,
+                "offset": offset,
+                "previous": "",
+                "sort": sort,
+            },
+        }
+
+    def _daily(self, key: str, start: str, end: str, value: Callable) -> dict:
+        return {
+            key: [
+                {"dateTime": day, "value": value(_rng(key, day))}
+                for day in self._past(_days(start, end))
+            ]
+        }
+
+    def hrv(self, start, end):
+        return self._daily(
+            "hrv",
+            start,
+            end,
+            lambda rng: {
+                "dailyRmssd": round(rng.uniform(20, 60), 3),
+                "deepRmssd": round(rng.uniform(20, 60), 3),
+            },
+        )
+
+    def skin_temperature(self, start, end):
+        return self._daily(
+            "tempSkin",
+            start,
+            end,
+            lambda rng: {"nightlyRelative": round(rng.uniform(-1, 1), 1)},
+        )
+
+    def cardio_score(self, start, end):
+        return self._daily("cardioScore", start, end, lambda rng: {"vo2Max": "44-48"})
+
+    def breathing_rate(self, start, end):
+        return self._daily(
+            "br",
+            start,
+            end,
+            lambda rng: {"breathingRate": round(rng.uniform(12, 18), 1)},
+        )
+
+    def weight(self, start, end):
+        return {
+            "weight": [
+                {
+                    "date": day,
+                    "time": "07:00:00",
+                    "weight": round(_rng("weight", day).uniform(70, 72), 1),
+                    "bmi": 22.5,
+                    "logId": int(day.replace("-", "")),
+                    "source": "Aria",
+                }
+                for day in self._past(_days(start, end))
+            ]
+        }
+
+    def spo2_intraday(self, start, end):
+        return [
+            {
+                "dateTime": day,
+                "minutes": [
+                    {
+                        "minute": f"{day}T{hour:02d}:{minute:02d}:00",
+                        "value": round(
+                            _rng("spo2", day, hour, minute).uniform(93, 99), 1
+                        ),
+                    }
+                    for hour in range(1, 6)
+                    for minute in range(0, 60, 5)
+                ],
+            }
+            for day in self._past(_days(start, end))
+        ]
+
+    def spo2_summary(self, start, end):
+        return [
+            {"dateTime": day, "value": {"avg": 96.1, "min": 93.2, "max": 99.0}}
+            for day in self._past(_days(start, end))
+        ]
+
+    def start(self) -> "FitbitAPIStandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
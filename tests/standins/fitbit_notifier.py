@@ -0,0 +1,44 @@
+"""Stand-in for Fitbit posting subscription notifications to a subscriber"""
+
+import json
+import urllib.error
+import urllib.request
+from app.subscriber.receiver import sign
+
+
+def notification(collection: str, date: str) -> dict:
+    return {
+        "collectionType": collection,
+        "date": date,
+        "ownerId": "228S74",
+        "ownerType": "user",
+        "subscriptionId": "1",
+    }
+
+
+def request(url: str, body: bytes = None, headers: dict = None) -> int:
+    """Status of a GET, or a POST when body is given"""
+    try:
+        with urllib.request.urlopen(
+            urllib.request.Request(url, data=body, headers=headers or {}), timeout=5
+        ) as response:
+            return response.status
+    except urllib.error.HTTPError as err:
+        return err.code
+
+
+def verify(url: str, code: str) -> int:
+    return request(url + "?verify=" + code)
+
+
+def post(url: str, notifications: list, client_secret: str, signature=None) -> int:
+    """Post notifications signed like Fitbit does, or with signature instead"""
+    body = json.dumps(notifications).encode()
+    return request(
+        url,
+        body,
+        {
+            "Content-Type": "application/json",
+            "X-Fitbit-Signature": signature or sign(body, client_secret),
+        },
+    )
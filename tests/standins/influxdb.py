@@ -0,0 +1,209 @@
+"""Stand-in for the InfluxDB v3 write endpoints used by InfluxDBClient3
+
+Parses line protocol, accepts gzip bodies, can delay or fail requests and
+records every point it accepted.
+"""
+
+import gzip, json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+WRITE_PATHS = ("/api/v2/write", "/api/v3/write_lp")
+PRECISION = {"s": 1_000_000_000, "ms": 1_000_000, "us": 1_000, "ns": 1}
+
+
+class WrittenPoint(NamedTuple):
+    measurement: str
+    tags: dict
+    fields: dict
+    timestamp: Optional[int]
+
+
+def _split(text: str, separator: str, quotes: bool = False) -> List[str]:
+    """Split on separator, skipping escaped separators and, with quotes, quoted strings"""
+    parts, current, quoted, n = [], [], False, 0
+    while n < len(text):
+        char = text[n]
+        if char == "\\" and n + 1 < len(text):
+            current.append(text[n : n + 2])
+            n += 2
+            continue
+        if quotes and char == '"':
+            quoted = not quoted
+        if char == separator and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+        n += 1
+    parts.append("".join(current))
+    return parts
+
+
+def _unescape(text: str) -> str:
+    for escaped, char in ((r"\ ", " "), (r"\,", ","), (r"\=", "="), (r"\"", '"')):
+        text = text.replace(escaped, char)
+    return text.replace("\\\\", "\\")
+
+
+def _field_value(text: str):
+    if text.startswith('"'):
+        return _unescape(text[1:-1])
+    if text.endswith("i"):
+        return int(text[:-1])
+    if text.endswith("u"):
+        return int(text[:-1])
+    if text in ("t", "T", "true", "True", "TRUE"):
+        return True
+    if text in ("f", "F", "false", "False", "FALSE"):
+        return False
+    return float(text)
+
+
+def parse_line(line: str) -> WrittenPoint:
+    """Parse one line of line protocol, raising ValueError when it is malformed"""
+    sections = _split(line, " ", quotes=True)
+    if len(sections) not in (2, 3) or not sections[1]:
+        raise ValueError(f"malformed line: {line!r}")
+
+    series = _split(sections[0], ",")
+    tags = {}
+    for tag in series[1:]:
+        key, value = _split(tag, "=")
+        tags[_unescape(key)] = _unescape(value)
+
+    fields = {}
+    for field in _split(sections[1], ",", quotes=True):
+        key, value = _split(field, "=", quotes=True)
+        fields[_unescape(key)] = _field_value(value)
+
+    timestamp = int(sections[2]) if len(sections) == 3 else None
+    return WrittenPoint(_unescape(series[0]), tags, fields, timestamp)
+
+
+class InfluxDBHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        with server.lock:
+            server.requests += 1
+            server.bytes_received += len(body)
+        if server.latency:
+            time.sleep(server.latency)
+
+        if url.path not in WRITE_PATHS:
+            self._answer(404, "not found")
+            return
+        error = server.next_error()
+        if error is not None:
+            self._answer(*error)
+            return
+
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        scale = PRECISION[params.get("precision", "ns")]
+        points = []
+        for line in body.decode().splitlines():
+            if not line.strip() or line.startswith("#"):
+                continue
+            try:
+                point = parse_line(line)
+            except ValueError as err:
+                self._answer(400, str(err))
+                return
+            if server.reject and server.reject(point):
+                self._answer(400, f"rejected point: {line}")
+                return
+            if point.timestamp is not None:
+                point = point._replace(timestamp=point.timestamp * scale)
+            points.append(point)
+
+        with server.lock:
+            server.written += len(points)
+            if server.keep_points:
+                server.writes.append((params, len(points)))
+                server.points += points
+        self._answer(204)
+
+    def _answer(self, status: int, message: Optional[str] = None) -> None:
+        body = json.dumps({"message": message}).encode() if message else b""
+        self.send_response(status)
+        if body:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class InfluxDBStandIn(ThreadingHTTPServer):
+    """Local InfluxDB that only takes writes, serving on a background thread
+
+    latency: seconds every request is delayed
+    error_rate: share of writes failing with error_status
+    reject: predicate on parsed points, a write holding a matching point fails with 400
+    keep_points: keep writes and accepted points, only count points in written otherwise
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ("127.0.0.1", 0),
+        latency: float = 0,
+        error_rate: float = 0,
+        error_status: int = 500,
+        reject: Optional[Callable[[WrittenPoint], bool]] = None,
+        seed: int = 0,
+        keep_points: bool = True,
+    ):
+        super().__init__(address, InfluxDBHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reject = reject
+        self.keep_points = keep_points
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.failures: List[Tuple[int, str]] = []
+        self.reset()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def reset(self) -> None:
+        """Forget what was written"""
+        self.requests = 0
+        self.bytes_received = 0
+        self.writes = []
+        self.written = 0
+        self.points: List[WrittenPoint] = []
+
+    def fail_next(self, count: int = 1, status: int = 500, message: str = "boom"):
+        """Fail the next count writes with status"""
+        with self.lock:
+            self.failures += [(status, message)] * count
+
+    def next_error(self) -> Optional[Tuple[int, str]]:
+        with self.lock:
+            if self.failures:
+                return self.failures.pop(0)
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return self.error_status, "injected error"
+        return None
+
+    def start(self) -> "InfluxDBStandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,62 @@
+import json
+import tempfile
+import unittest
+from app.archive.archive import Archive
+
+STEPS = "1/user/-/activities/steps/date/{date}/1d/1min.json"
+SLEEP = "1.2/user/-/sleep/date/{date}/{date}.json"
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.archive = Archive(self.path)
+
+    def tearDown(self):
+        self.archive.close()
+
+    def test_round_trip_and_reopen(self):
+        body = json.dumps({"activities-steps": [{"value": 1}] * 100}).encode()
+        entry = self.archive.append(
+            STEPS,
+            "https://api.fitbit.com/1/user/-/activities/steps/date/2024-01-02/1d/1min.json",
+            body,
+        )
+        self.assertEqual(entry.start_date, "2024-01-02")
+        self.assertLess(entry.length, len(body))
+        self.assertEqual(self.archive.read(entry), body)
+
+        # Appending after a read maps the grown segment again
+        second = self.archive.append(
+            STEPS,
+            "https://api.fitbit.com/1/user/-/activities/steps/date/2024-01-03/1d/1min.json",
+            b"{}",
+        )
+        self.assertEqual(self.archive.read_json(second), {})
+
+        reopened = Archive(self.path)
+        self.assertEqual(reopened.entries(), [entry, second])
+        self.assertEqual(reopened.read(entry), body)
+        reopened.close()
+
+    def test_find_by_endpoint_and_overlapping_range(self):
+        self.archive.append(
+            SLEEP,
+            "https://api.fitbit.com/1.2/user/-/sleep/date/2024-01-01/2024-03-31.json",
+            b"{}",
+        )
+        self.archive.append(
+            STEPS,
+            "https://api.fitbit.com/1/user/-/activities/steps/date/2024-02-01/1d/1min.json",
+            b"{}",
+        )
+
+        found = list(self.archive.find(start_date="2024-02-01", end_date="2024-02-01"))
+        self.assertEqual(len(found), 2)
+        found = list(self.archive.find(endpoint=SLEEP, start_date="2024-04-01"))
+        self.assertEqual(found, [])
+        self.assertEqual(len(list(self.archive.scan(endpoint=STEPS))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
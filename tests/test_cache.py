@@ -0,0 +1,143 @@
+import os, tempfile, unittest
+from unittest.mock import MagicMock
+import pandas as pd
+import pyarrow as pa
+from app.db.analytics import daily, rolling
+from app.db.cache import WriteLog, months
+from app.db.db import InfluxDBClient, select_sql
+from app.syncronizer.state import SyncState
+
+
+def hrv(time, value):
+    return {
+        "measurement": "HRV_Intraday",
+        "time": time,
+        "tags": {"Device": "Charge6"},
+        "fields": {"dailyRmssd": value},
+    }
+
+
+class TestReadCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.dir.name, "state.json")
+        self.cache_path = os.path.join(self.dir.name, "cache")
+        self.table = pa.table({"time": [1, 2], "dailyRmssd": [30.0, 31.0]})
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def client(self):
+        client = InfluxDBClient(
+            "host",
+            "token",
+            "org",
+            "database",
+            write_log=WriteLog(SyncState(self.state_path)),
+            query_cache_path=self.cache_path,
+        )
+        client.client = MagicMock()
+        client.client.query.return_value = self.table
+        return client
+
+    def test_repeated_reads_are_served_from_the_cache(self):
+        client = self.client()
+
+        first = client.read("HRV_Intraday", "2024-01-01", "2024-03-01")
+        second = client.read("HRV_Intraday", "2024-01-01", "2024-03-01")
+
+        self.assertEqual(client.client.query.call_count, 1)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertTrue(
+            client.read("HRV_Intraday", "2024-01-01", "2024-03-01", arrow=True).equals(
+                self.table
+            )
+        )
+
+    def test_writes_to_the_range_invalidate_it(self):
+        reader = self.client()
+        writer = self.client()
+        reader.read("HRV_Intraday", "2024-01-01", "2024-03-01")
+
+        writer.write_points_to_influxdb([hrv("2024-05-01T00:00:00+00:00", 30)])
+        writer.flush()
+        reader.read("HRV_Intraday", "2024-01-01", "2024-03-01")
+        self.assertEqual(reader.client.query.call_count, 1)
+
+        writer.write_points_to_influxdb([hrv("2024-02-10T00:00:00+00:00", 30)])
+        writer.flush()
+        reader.read("HRV_Intraday", "2024-01-01", "2024-03-01")
+        self.assertEqual(reader.client.query.call_count, 2)
+
+    def test_write_log_is_saved_on_flush_only(self):
+        writer = self.client()
+        writer.write_points_to_influxdb([hrv("2024-02-10T00:00:00+00:00", 30)])
+        self.assertFalse(os.path.exists(self.state_path))
+
+        writer.flush()
+        self.assertIn(
+            "HRV_Intraday/2024-02", SyncState(self.state_path).section("written")
+        )
+
+    def test_cache_outlives_the_process(self):
+        self.client().read("HRV_Intraday", "2024-01-01", "2024-03-01")
+
+        client = self.client()
+        client.read("HRV_Intraday", "2024-01-01", "2024-03-01")
+
+        client.client.query.assert_not_called()
+
+    def test_select_sql_quotes_names_and_values(self):
+        self.assertEqual(
+            select_sql(
+                "Sleep Summary",
+                "2024-01-01",
+                "2024-02-01",
+                fields=["efficiency"],
+                tags={"Device": "Charge'6"},
+            ),
+            'SELECT time, "efficiency" FROM "Sleep Summary" WHERE '
+            "time >= '2024-01-01' AND time < '2024-02-01' AND \"Device\" = 'Charge''6' "
+            "ORDER BY time",
+        )
+
+    def test_months_span_years(self):
+        self.assertEqual(
+            list(months("2023-11-15", "2024-02-01")),
+            ["2023-11", "2023-12", "2024-01", "2024-02"],
+        )
+
+
+class TestRolling(unittest.TestCase):
+    def test_daily_values_are_taken_per_local_day(self):
+        frame = pd.DataFrame(
+            {
+                "time": pd.to_datetime(
+                    ["2024-01-01T23:00:00Z", "2024-01-02T23:00:00Z"], utc=True
+                ),
+                "dailyRmssd": [30, 40],
+            }
+        )
+
+        series = daily(frame, "dailyRmssd", "Europe/Berlin")
+
+        self.assertEqual(
+            list(series.index.strftime("%Y-%m-%d")), ["2024-01-02", "2024-01-03"]
+        )
+
+    def test_days_are_compared_with_the_days_before(self):
+        days = pd.date_range("2024-01-01", periods=10, freq="D")
+        series = pd.Series([10.0, 12.0] * 4 + [11.0, 20.0], index=days)
+
+        result = rolling(series, windows=(7,))
+
+        self.assertTrue(pd.isna(result["mean_7d"].iloc[2]))
+        self.assertAlmostEqual(result["mean_7d"].iloc[3], 32 / 3)
+        self.assertAlmostEqual(
+            result["mean_7d"].iloc[9], (10 + 12 * 3 + 10 * 2 + 11) / 7
+        )
+        self.assertGreater(result["zscore_7d"].iloc[9], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
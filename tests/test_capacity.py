@@ -0,0 +1,65 @@
+import unittest
+from app.fitbit.capacity import Costs, project
+
+DAY = "https://api.fitbit.com/1/user/-/hrv/date/2024-01-01/2024-01-01.json"
+MONTH = "https://api.fitbit.com/1/user/-/hrv/date/2024-01-01/2024-01-30.json"
+LIVE = [f"https://api.fitbit.com/1/user/-/live/{n}.json" for n in range(6)]
+DAILY = [f"https://api.fitbit.com/1/user/-/daily/{n}.json" for n in range(9)]
+
+
+class TestCosts(unittest.TestCase):
+    def test_recorded_or_closest_range_size_or_defaults(self):
+        costs = Costs(
+            {"1/user/-/hrv/date/{date}/{date}.json 32d": {"p50": 2.5, "bytes": 4000}},
+            seconds=1.0,
+            size=100,
+        )
+        self.assertEqual(costs(MONTH), (2.5, 4000))
+        self.assertEqual(costs(DAY), (2.5, 4000))
+        self.assertEqual(costs(LIVE[0]), (1.0, 100))
+
+
+class TestProject(unittest.TestCase):
+    def test_cycles_within_quota(self):
+        projection = project(LIVE, DAILY, cadence_minutes=10, limit=150)
+        self.assertEqual(projection.requests_per_hour, {"LIVE": 36, "DAILY": 54})
+        self.assertEqual(projection.served_per_hour, 90)
+        self.assertEqual(projection.cycle_seconds, 15)
+        self.assertEqual(projection.warnings, [])
+
+    def test_backfill_uses_the_quota_left(self):
+        projection = project(LIVE, DAILY, [MONTH] * 500, cadence_minutes=10)
+        self.assertFalse(projection.falling_behind)
+        # The backfill leaves what live and daily syncs need for the rest of the window
+        self.assertGreater(projection.backfill_hours, 500 / 50)
+        self.assertLess(projection.backfill_hours, 500 / 20)
+
+    def test_flags_configurations_over_quota(self):
+        projection = project(LIVE, DAILY, [MONTH] * 1000, cadence_minutes=5)
+        self.assertTrue(projection.falling_behind)
+        self.assertIsNone(projection.backfill_hours)
+        self.assertEqual(len(projection.warnings), 2)
+
+        projection = project(LIVE, DAILY, limit=200)
+        self.assertIn("429", projection.warnings[0])
+
+    def test_steps_are_retried_whole_and_queued_once(self):
+        # Steps of several urls, like the intraday heart rate and the sleep list
+        steps = DAILY[:8] + [[f"{DAILY[8]}?offset={n}" for n in range(7)]]
+        projection = project(LIVE, steps, limit=150)
+        self.assertEqual(projection.requests_per_hour, {"LIVE": 36, "DAILY": 90})
+        self.assertEqual(projection.deferred, 0)
+        self.assertFalse(projection.falling_behind)
+        self.assertEqual(projection.warnings, [])
+
+    def test_warns_when_live_and_daily_steps_are_deferred(self):
+        projection = project(LIVE, DAILY, limit=80)
+        self.assertTrue(projection.falling_behind)
+        self.assertGreater(projection.deferred_per_hour["DAILY"], 0)
+        # Each deferred step waits once, however often it is deferred again
+        self.assertLessEqual(projection.deferred, len(LIVE) + len(DAILY))
+        self.assertIn("deferred an hour", projection.warnings[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from app.db.coalesce import coalesce_points
+
+
+def minutes(activity_type, value, time="2024-01-01T00:00:00+00:00", device="Charge6"):
+    return {
+        "measurement": "Activity Minutes",
+        "time": time,
+        "tags": {"Device": device},
+        "fields": {activity_type: value},
+    }
+
+
+class TestCoalescePoints(unittest.TestCase):
+    def test_merges_fields_of_the_same_series_and_time(self):
+        points = [
+            minutes("minutesSedentary", 600),
+            minutes("minutesLightlyActive", 200),
+            minutes("minutesSedentary", 610, time="2024-01-02T00:00:00+00:00"),
+            minutes("minutesVeryActive", 30),
+        ]
+
+        self.assertEqual(
+            coalesce_points(points),
+            [
+                {
+                    "measurement": "Activity Minutes",
+                    "time": "2024-01-01T00:00:00+00:00",
+                    "tags": {"Device": "Charge6"},
+                    "fields": {
+                        "minutesSedentary": 600,
+                        "minutesLightlyActive": 200,
+                        "minutesVeryActive": 30,
+                    },
+                },
+                points[2],
+            ],
+        )
+        # Inputs are left as they were
+        self.assertEqual(points[0]["fields"], {"minutesSedentary": 600})
+
+    def test_keeps_other_series_apart_and_later_values_win(self):
+        points = [
+            minutes("minutesSedentary", 600),
+            minutes("minutesSedentary", 500, device="Versa"),
+            minutes("minutesSedentary", 601),
+        ]
+
+        coalesced = coalesce_points(points)
+        self.assertEqual(len(coalesced), 2)
+        self.assertEqual(coalesced[0]["fields"], {"minutesSedentary": 601})
+        self.assertIs(coalesced[1], points[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,21 @@
-import unittest
+import json, os, tempfile, unittest
 from unittest.mock import patch, MagicMock
-from app.db.db import InfluxDBClient
+from app.db.db import InfluxDBClient, encode_points
+from app.db.schema import SchemaCache
+from tests.standins.influxdb import InfluxDBStandIn
+
+
+class Rejected(Exception):
+    status = 400
+
+
+def steps(value, minute=0):
+    return {
+        "measurement": "Steps_Intraday",
+        "time": f"2024-01-01T00:{minute:02d}:00+00:00",
+        "tags": {"Device": "Charge6"},
+        "fields": {"value": value},
+    }
 
 
 class TestInfluxDBClient(unittest.TestCase):
@@ -25,5 +40,129 @@ class TestInfluxDBClient(unittest.TestCase):
     #     self.mock_client.write.assert_called_with(MockPoint.return_value)
 
 
+class TestBisectingWrite(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.dead_letter_path = os.path.join(self.dir.name, "dead_letter.jsonl")
+        self.influxdb_client = InfluxDBClient(
+            "host", "token", "org", "database", dead_letter_path=self.dead_letter_path
+        )
+        self.influxdb_client.client = MagicMock()
+        self.written = []
+
+        def write(record, write_precision):
+            if b"poison" in record:
+                raise Rejected("invalid field value")
+            self.written += record.split(b"\n")
+
+        self.influxdb_client.client.write.side_effect = write
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def dead_letters(self):
+        with open(self.dead_letter_path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_isolates_rejected_point(self):
+        points = [steps(n, minute=n) for n in range(8)]
+        points[5] = dict(points[5], tags={"Device": "poison"})
+
+        self.influxdb_client.write_points_to_influxdb(points)
+
+        self.assertEqual(len(self.written), 7)
+        letters = self.dead_letters()
+        self.assertEqual(len(letters), 1)
+        self.assertEqual(letters[0]["point"], points[5])
+        self.assertEqual(letters[0]["reason"], "invalid field value")
+
+    def test_type_conflicts_are_rejected_before_writing(self):
+        self.influxdb_client.write_points_to_influxdb([steps(1)])
+        self.influxdb_client.write_points_to_influxdb([steps("many", minute=1)])
+
+        self.assertEqual(self.influxdb_client.client.write.call_count, 1)
+        self.assertIn("has it as integer", self.dead_letters()[0]["reason"])
+
+    def test_unreachable_database_is_not_bisected(self):
+        self.influxdb_client.client.write.side_effect = ConnectionError("refused")
+
+        self.influxdb_client.write_points_to_influxdb([steps(n, n) for n in range(8)])
+
+        self.assertEqual(self.influxdb_client.client.write.call_count, 1)
+        # The points are written again later, they aren't refused
+        self.assertFalse(os.path.exists(self.dead_letter_path))
+
+
+class TestWriteThroughStandIn(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.dead_letter_path = os.path.join(self.dir.name, "dead_letter.jsonl")
+        self.standin = InfluxDBStandIn(
+            reject=lambda point: point.tags.get("Device") == "poison"
+        ).start()
+
+    def tearDown(self):
+        self.standin.stop()
+        self.dir.cleanup()
+
+    def client(self, **kwargs):
+        return InfluxDBClient(
+            self.standin.url,
+            "token",
+            "org",
+            "database",
+            dead_letter_path=self.dead_letter_path,
+            **kwargs,
+        )
+
+    def test_writes_points_as_line_protocol(self):
+        self.client(gzip=True).write_points_to_influxdb([steps(n, n) for n in range(3)])
+
+        self.assertEqual(self.standin.writes[0][0]["precision"], "s")
+        self.assertEqual(
+            [(p.measurement, p.tags, p.fields) for p in self.standin.points],
+            [("Steps_Intraday", {"Device": "Charge6"}, {"value": n}) for n in range(3)],
+        )
+        self.assertEqual(self.standin.points[1].timestamp, 1704067260 * 10**9)
+
+    def test_rejected_point_is_isolated(self):
+        points = [steps(n, n) for n in range(6)]
+        points[2] = dict(points[2], tags={"Device": "poison"})
+
+        # Writing the rejected point again wouldn't help, it counts as written
+        self.assertTrue(self.client().write_points_to_influxdb(points))
+
+        self.assertEqual(len(self.standin.points), 5)
+        with open(self.dead_letter_path) as file:
+            self.assertEqual(json.loads(file.readline())["point"], points[2])
+
+    def test_server_errors_are_not_bisected(self):
+        self.standin.fail_next(status=503)
+
+        self.assertFalse(
+            self.client().write_points_to_influxdb([steps(n, n) for n in range(6)])
+        )
+
+        self.assertEqual(self.standin.requests, 1)
+        self.assertEqual(self.standin.points, [])
+        self.assertFalse(os.path.exists(self.dead_letter_path))
+
+    def test_writes_line_protocol_encoded_elsewhere(self):
+        points = [steps(n, n) for n in range(6)] + [steps(None, 7)]
+        points[2] = dict(points[2], tags={"Device": "poison"})
+        body, rejected = encode_points(points, SchemaCache())
+
+        self.client().write_line_protocol(body, rejected)
+
+        self.assertEqual(len(self.standin.points), 5)
+        with open(self.dead_letter_path) as file:
+            letters = [json.loads(line) for line in file]
+        self.assertEqual(
+            [letter["point"] for letter in letters],
+            [points[6], "Steps_Intraday,Device=poison value=2i 1704067320"],
+        )
+        self.assertEqual(letters[0]["reason"], "no writable fields")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import pytz
+from app.fitbit.endpoints import ENDPOINTS, Extractor, date_ranges, getter
+
+TIMEZONE = pytz.timezone("Europe/Stockholm")
+
+
+class TestEndpoints(unittest.TestCase):
+    def test_getter_walks_nested_keys(self):
+        self.assertEqual(getter(("value", "avg"))({"value": {"avg": 95}}), 95)
+        self.assertEqual(getter(())([1]), [1])
+
+    def test_date_ranges_respect_max_days(self):
+        self.assertEqual(
+            list(date_ranges("2024-01-01", "2024-03-01", 30)),
+            [
+                ("2024-01-01", "2024-01-30"),
+                ("2024-01-31", "2024-02-29"),
+                ("2024-03-01", "2024-03-01"),
+            ],
+        )
+
+    def test_extracts_daily_records_at_local_midnight(self):
+        extract = Extractor(
+            ENDPOINTS["get_vo2max_cardio_score_by_interval"], "Charge6", TIMEZONE
+        )
+        points = extract(
+            {
+                "cardioScore": [
+                    {"dateTime": "2024-01-01", "value": {"vo2Max": "40-44"}},
+                    {"dateTime": "2024-01-02", "value": {"vo2Max": "45"}},
+                ]
+            }
+        )
+        self.assertEqual(
+            points[0],
+            {
+                "measurement": "CardioScore",
+                "time": "2023-12-31T23:00:00+00:00",
+                "tags": {"Device": "Charge6"},
+                "fields": {"vo2Low": 40, "vo2High": 44},
+            },
+        )
+        self.assertEqual(points[1]["fields"], {"vo2Low": 45, "vo2High": 45})
+
+    def test_extracts_nested_records_and_skips_broken_ones(self):
+        extract = Extractor(ENDPOINTS["get_spo2_by_interval"], "Charge6", TIMEZONE)
+        points = extract(
+            [
+                {
+                    "dateTime": "2024-01-01",
+                    "minutes": [
+                        {"minute": "2024-01-01T01:00:00", "value": 95},
+                        {"minute": "2024-01-01T01:01:00"},
+                    ],
+                },
+                {"minutes": [{"minute": "2024-01-02T02:30:00", "value": 96.5}]},
+            ]
+        )
+        self.assertEqual(
+            [(p["time"], p["fields"]["value"]) for p in points],
+            [("2024-01-01T00:00:00+00:00", 95.0), ("2024-01-02T01:30:00+00:00", 96.5)],
+        )
+
+    def test_tags_from_records(self):
+        extract = Extractor(ENDPOINTS["get_body_data_by_interval"], "Charge6", TIMEZONE)
+        [point] = extract(
+            {
+                "weight": [
+                    {
+                        "date": "2024-01-01",
+                        "time": "07:15:00",
+                        "bmi": 22.1,
+                        "weight": 70.2,
+                        "source": "Aria",
+                    }
+                ]
+            }
+        )
+        self.assertEqual(point["tags"], {"Device": "Aria"})
+        self.assertEqual(point["time"], "2024-01-01T06:15:00+00:00")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json, os, tempfile, unittest
+from datetime import datetime
+from unittest import mock
+from app.fitbit.fitbit import FitbitClient, sleep_log_fingerprint
+from app.fitbit.retry import RequestDeferred
+from tests.standins.fitbit_api import FitbitAPIStandIn
+
+os.environ.setdefault("FITBIT_LOCAL_TIMEZONE", "Europe/Berlin")
+
+
+class TestFitbitAPIStandIn(unittest.TestCase):
+    def setUp(self):
+        self.api = FitbitAPIStandIn(
+            now=lambda: datetime(2024, 1, 10, 12, 30), limit=3
+        ).start()
+        self.addCleanup(self.api.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        token_path = os.path.join(directory.name, "tokens.json")
+        with open(token_path, "w") as file:
+            json.dump({"access_token": "access", "refresh_token": "refresh"}, file)
+
+        with mock.patch.dict(os.environ, {"FITBIT_API_BASE": self.api.url}):
+            self.client = FitbitClient(
+                client_id="id",
+                client_secret="secret",
+                token_path=token_path,
+                device_name="Charge6",
+            )
+
+    def test_requests_go_to_the_api_base(self):
+        points = self.client.get_intraday_hrv_by_interval("2024-01-01", "2024-01-20")
+        self.assertEqual(len(points), 10)
+        self.assertEqual(self.api.requests, 1)
+
+        steps = self.client.get_intraday_activity_by_date(
+            "2024-01-10", [("steps", "Steps_Intraday", "1min", 1)], start_time="12:00"
+        )
+        self.assertEqual(len(steps), 31)
+
+    def test_sleep_logs_are_listed_page_by_page(self):
+        sleep_logs = self.client.get_sleep_logs_after("2023-09-01")
+        self.assertEqual(self.api.requests, 2)
+        self.assertEqual(len(sleep_logs), 131)
+        self.assertEqual(sleep_logs[0]["dateOfSleep"], "2023-09-02")
+        self.assertEqual(sleep_logs[-1]["dateOfSleep"], "2024-01-10")
+        self.assertTrue(self.client.sleep_log_points(sleep_logs[:1]))
+
+    def test_edited_sleep_logs_change_fingerprint(self):
+        before = self.client.get_sleep_logs_after("2024-01-08")
+        self.api.edited["2024-01-09"] = {"efficiency": 50}
+        after = self.client.get_sleep_logs_after("2024-01-08")
+        self.assertEqual(
+            [
+                sleep_log_fingerprint(log) == sleep_log_fingerprint(log_after)
+                for log, log_after in zip(before, after)
+            ],
+            [False, True],
+        )
+
+    def test_quota_runs_out(self):
+        for _ in range(3):
+            self.client.get_battery_level()
+        with self.assertRaises(RequestDeferred):
+            self.client.get_battery_level()
+
+    def test_only_successful_responses_are_timed(self):
+        self.api.fail_next(status=404)
+        self.client.get_battery_level()
+        self.assertEqual(self.client.client.latency.summary(), {})
+
+        self.client.get_battery_level()
+        [timed] = self.client.client.latency.summary().values()
+        self.assertEqual(timed["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import pandas as pd
+import pytz
+from app.syncronizer.gaps import Gap, GapRule, GapScanner, find_gaps, local_hours
+from datetime import date
+
+TIMEZONE = pytz.timezone("Europe/Stockholm")
+
+
+def full_day(day: str, per_hour: int = 60) -> pd.Series:
+    hours = local_hours(TIMEZONE, date.fromisoformat(day))
+    return pd.Series(per_hour, index=hours)
+
+
+class FakeDB:
+    def __init__(self, counts: pd.Series):
+        self.counts = counts
+        self.queries = []
+
+    def query(self, sql):
+        self.queries.append(sql)
+        return pd.DataFrame({"hour": self.counts.index, "points": self.counts.values})
+
+
+class TestFindGaps(unittest.TestCase):
+    def test_missing_days_are_merged_up_to_max_days(self):
+        rule = GapRule("SPO2", max_days=2)
+        counts = pd.concat([full_day("2024-01-01", 1), full_day("2024-01-05", 1)])
+
+        gaps = find_gaps(rule, counts, "2024-01-01", "2024-01-07", TIMEZONE)
+        self.assertEqual(
+            gaps,
+            [
+                Gap("SPO2", "2024-01-02", "2024-01-03"),
+                Gap("SPO2", "2024-01-04", "2024-01-04"),
+                Gap("SPO2", "2024-01-06", "2024-01-07"),
+            ],
+        )
+
+    def test_incomplete_hours_become_one_time_window(self):
+        rule = GapRule("Steps_Intraday", per_hour=60)
+        counts = full_day("2024-01-01")
+        counts.iloc[3:5] = 0
+        counts.iloc[10] = 59
+
+        gaps = find_gaps(rule, counts, "2024-01-01", "2024-01-01", TIMEZONE)
+        self.assertEqual(
+            gaps,
+            [Gap("Steps_Intraday", "2024-01-01", "2024-01-01", "03:00", "10:59")],
+        )
+
+    def test_complete_dst_day_has_no_gaps(self):
+        rule = GapRule("Steps_Intraday", per_hour=60)
+        counts = full_day("2024-03-31")
+        self.assertEqual(len(counts), 23)
+        self.assertEqual(
+            find_gaps(rule, counts, "2024-03-31", "2024-03-31", TIMEZONE), []
+        )
+
+
+class TestGapScanner(unittest.TestCase):
+    def test_scan_queries_counts_per_measurement(self):
+        db = FakeDB(full_day("2024-01-01"))
+        rules = [GapRule("Steps_Intraday", per_hour=60), GapRule("RestingHR")]
+
+        gaps = GapScanner(db, TIMEZONE, rules).scan("2024-01-01", "2024-01-02")
+        self.assertEqual(
+            gaps,
+            [
+                Gap("Steps_Intraday", "2024-01-02", "2024-01-02"),
+                Gap("RestingHR", "2024-01-02", "2024-01-02"),
+            ],
+        )
+        self.assertEqual(len(db.queries), 2)
+        self.assertIn("date_bin(INTERVAL '1 hour'", db.queries[0])
+        self.assertIn('FROM "Steps_Intraday"', db.queries[0])
+
+    def test_failed_query_skips_measurement(self):
+        class FailingDB:
+            def query(self, sql):
+                raise RuntimeError("table not found")
+
+        rules = [GapRule("Steps_Intraday", per_hour=60)]
+        self.assertEqual(
+            GapScanner(FailingDB(), TIMEZONE, rules).scan("2024-01-01", "2024-01-02"),
+            [],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
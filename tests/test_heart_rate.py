@@ -0,0 +1,49 @@
+import unittest
+from datetime import datetime
+import pytz
+from app.fitbit.heart_rate import compact_runs, parse_dataset
+
+TIMEZONE = pytz.timezone("Europe/Stockholm")
+
+
+class TestParseDataset(unittest.TestCase):
+    def test_matches_pytz_localize(self):
+        dataset = [
+            {"time": "00:00:00", "value": 60},
+            {"time": "12:34:56", "value": 61},
+            {"time": "23:59:59", "value": 62},
+        ]
+        frame = parse_dataset("2024-03-31", dataset, TIMEZONE)
+
+        expected = [
+            TIMEZONE.localize(datetime.fromisoformat("2024-03-31T" + entry["time"]))
+            .astimezone(pytz.utc)
+            .isoformat()
+            for entry in dataset
+        ]
+        self.assertEqual([t.isoformat() for t in frame["time"]], expected)
+        self.assertEqual(list(frame["value"]), [60, 61, 62])
+
+    def test_empty_dataset(self):
+        self.assertEqual(len(parse_dataset("2024-01-01", [], TIMEZONE)), 0)
+
+
+class TestCompactRuns(unittest.TestCase):
+    def test_keeps_first_of_each_run_and_readings_after_gaps(self):
+        dataset = [
+            {"time": "10:00:00", "value": 60},
+            {"time": "10:00:01", "value": 60},
+            {"time": "10:00:02", "value": 61},
+            {"time": "10:00:03", "value": 61},
+            {"time": "10:00:10", "value": 61},
+        ]
+        frame = compact_runs(parse_dataset("2024-01-01", dataset, TIMEZONE))
+
+        self.assertEqual(
+            [t.strftime("%H:%M:%S") for t in frame["time"]],
+            ["09:00:00", "09:00:02", "09:00:10"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from app.fitbit.latency import LatencyTracker, range_days, size_bucket
+
+URL = "https://api.fitbit.com/1/user/-/hrv/date/{}/{}.json"
+
+
+class TestRangeSize(unittest.TestCase):
+    def test_days_of_a_range_and_their_bucket(self):
+        self.assertEqual(range_days(URL.format("2024-01-01", "2024-01-30")), 30)
+        self.assertEqual(range_days("https://api.fitbit.com/1/user/-/devices.json"), 1)
+        self.assertEqual([size_bucket(days) for days in (1, 2, 5, 30)], [1, 2, 8, 32])
+
+
+class TestLatencyTracker(unittest.TestCase):
+    def test_default_until_enough_samples(self):
+        tracker = LatencyTracker(default=30, connect=5, min_samples=3)
+        url = URL.format("2024-01-01", "2024-01-30")
+        tracker.record(url, 1.0)
+        self.assertEqual(tracker.timeout(url), (5, 30))
+
+    def test_read_timeout_follows_percentile_within_bounds(self):
+        tracker = LatencyTracker(minimum=5, maximum=120, factor=3, min_samples=3)
+        month = URL.format("2024-01-01", "2024-01-30")
+        for seconds in (2.0, 3.0, 4.0):
+            tracker.record(month, seconds)
+        self.assertEqual(tracker.timeout(month)[1], 12.0)
+
+        # Other months of the same size share the latencies, single days don't
+        self.assertEqual(tracker.timeout(URL.format("2024-02-01", "2024-02-29"))[1], 12)
+        self.assertEqual(tracker.timeout(URL.format("2024-02-01", "2024-02-01"))[1], 30)
+
+        for _ in range(3):
+            tracker.record(month, 100.0)
+        self.assertEqual(tracker.timeout(month)[1], 120)
+
+    def test_timeouts_double_until_answered(self):
+        tracker = LatencyTracker(minimum=5, maximum=120, factor=3, min_samples=3)
+        day = URL.format("2024-01-01", "2024-01-01")
+        for _ in range(3):
+            tracker.record(day, 0.1)
+        self.assertEqual(tracker.timeout(day)[1], 5)
+
+        tracker.record_timeout(day)
+        self.assertEqual(tracker.timeout(day)[1], 10)
+        tracker.record_timeout(day)
+        self.assertEqual(tracker.timeout(day)[1], 20)
+
+        tracker.record(day, 0.1)
+        self.assertEqual(tracker.timeout(day)[1], 5)
+
+    def test_ranges_split_after_timeouts_and_restore_after_successes(self):
+        tracker = LatencyTracker(split_after=2, restore_after=3)
+        url = URL.format("2024-01-01", "2024-01-30")
+
+        tracker.record_timeout(url)
+        self.assertEqual(tracker.max_days(url, 30), 30)
+        tracker.record_timeout(url)
+        self.assertEqual(tracker.max_days(url, 30), 15)
+        tracker.record_timeout(url)
+        tracker.record_timeout(url)
+        self.assertEqual(tracker.max_days(url, 30), 7)
+
+        for _ in range(3):
+            tracker.record(URL.format("2024-01-01", "2024-01-07"), 1.0)
+        self.assertEqual(tracker.max_days(url, 30), 15)
+        self.assertIn("1/user/-/hrv/date/{date}/{date}.json 8d", tracker.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()
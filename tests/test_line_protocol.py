@@ -0,0 +1,43 @@
+import unittest
+from influxdb_client_3 import Point
+from app.db.line_protocol import LineProtocolEncoder
+
+POINTS = [
+    {
+        "measurement": "Sleep Levels",
+        "time": "2024-01-01T22:15:30+00:00",
+        "tags": {"Device": "Charge 6", "isMainSleep": True},
+        "fields": {"level": 3, "duration_seconds": None},
+    },
+    {
+        "measurement": "SPO2_Intraday",
+        "time": "2024-01-02T03:04:00+00:00",
+        "tags": {"Device": "Charge,6=x"},
+        "fields": {"value": 95.0, "note": 'a "quoted" \\ value'},
+    },
+    {
+        "measurement": "DeviceBatteryLevel",
+        "time": "2024-01-02T03:04:00+00:00",
+        "fields": {"value": 80.5},
+    },
+]
+
+
+class TestLineProtocolEncoder(unittest.TestCase):
+    def test_matches_client_serialization(self):
+        expected = "\n".join(
+            Point.from_dict(point, write_precision="s").to_line_protocol()
+            for point in POINTS
+        )
+        encoder = LineProtocolEncoder()
+        self.assertEqual(encoder.encode(POINTS).decode(), expected)
+        # Second call goes through the caches and the reused buffer
+        self.assertEqual(encoder.encode(POINTS).decode(), expected)
+
+    def test_points_without_fields_are_left_out(self):
+        point = dict(POINTS[0], fields={"duration_seconds": None})
+        self.assertEqual(LineProtocolEncoder().encode([point]), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import json, logging, os, tempfile, unittest
+from app.db.summary import PointSummary
+from app.logs import logs
+
+
+def point(measurement, time):
+    return {
+        "measurement": measurement,
+        "time": time,
+        "tags": {"Device": "Charge6"},
+        "fields": {"value": 1},
+    }
+
+
+class TestSetup(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self.addCleanup(setattr, root, "handlers", root.handlers[:])
+        self.addCleanup(root.setLevel, root.level)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "fitbit.log")
+
+    def written(self, log_format, log):
+        listener = logs.setup("INFO", self.path, overwrite=True, log_format=log_format)
+        listener.handlers = listener.handlers[1:]  # keep the test output clean
+        log()
+        listener.stop()
+        with open(self.path) as file:
+            return file.read()
+
+    def test_records_carry_the_cycle_and_step_context(self):
+        def job():
+            with logs.context(step="Steps"):
+                logging.info("synced %d points", 3)
+
+        text = self.written("text", lambda: logs.in_cycle(job)())
+
+        self.assertRegex(text, r"INFO cycle=\d+ job=job step=Steps synced 3 points\n$")
+
+    def test_json_records_hold_the_context_fields(self):
+        def log():
+            with logs.context(step="Steps"):
+                logging.warning("deferred")
+
+        entry = json.loads(self.written("json", log))
+
+        self.assertEqual(entry["level"], "WARNING")
+        self.assertEqual(entry["step"], "Steps")
+        self.assertEqual(entry["message"], "deferred")
+
+    def test_tokens_are_redacted(self):
+        def log():
+            logging.info("headers: %s", {"Authorization": "Bearer eyJhbGciOi.abc"})
+            logging.info('{"access_token": "abc", "refresh_token": "def"}')
+
+        text = self.written("text", log)
+
+        self.assertNotIn("eyJhbGciOi", text)
+        self.assertNotIn("abc", text)
+        self.assertNotIn("def", text)
+        self.assertIn("Bearer ***", text)
+
+    def test_debug_records_are_dropped_at_info(self):
+        text = self.written("text", lambda: logging.debug("URL to request: %s", "x"))
+
+        self.assertEqual(text, "")
+
+
+class TestPointSummary(unittest.TestCase):
+    def test_counts_points_per_measurement(self):
+        points = [
+            point("Steps", "2024-01-01T00:01:00+00:00"),
+            point("Steps", "2024-01-01T00:00:00+00:00"),
+            point("HeartRate", "2024-01-01T00:02:00+00:00"),
+        ]
+
+        summary = str(PointSummary(points, samples=1))
+
+        self.assertTrue(
+            summary.startswith(
+                "3 points (Steps: 2, HeartRate: 1) "
+                "from 2024-01-01T00:00:00+00:00 to 2024-01-01T00:02:00+00:00, e.g. "
+            )
+        )
+        self.assertEqual(summary.count("'measurement'"), 1)
+
+    def test_summary_is_only_built_when_formatted(self):
+        points = iter([point("Steps", "2024-01-01T00:00:00+00:00")])
+        logging.getLogger("quiet").debug("failing points: %s", PointSummary(points))
+
+        self.assertEqual(len(list(points)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+import json, os, sys, tempfile, unittest
+from unittest import mock
+
+# The replay imports its packages like reprocess.py does, from within app/
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+os.environ.setdefault("FITBIT_LOCAL_TIMEZONE", "Europe/Berlin")
+
+from archive.archive import Archive
+from archive.replay import (
+    ACTIVITY_SUMMARY,
+    ReplayCall,
+    plan_replay,
+    replay_call,
+    replay_day,
+)
+from fitbit.fitbit import ACTIVITY_SUMMARY_METRICS
+from reprocess import write_results
+
+API = "https://api.fitbit.com"
+STEPS = API + "/1/user/-/activities/steps/date/2024-01-01/1d/1min.json"
+STEPS_WINDOW = (
+    API + "/1/user/-/activities/steps/date/2024-01-01/1d/1min/time/10:00/23:59.json"
+)
+SERIES = API + "/1/user/-/activities/tracker/{metric}/date/2024-01-01/2024-01-02.json"
+FOODS = API + "/1/user/-/foods/log/date/2024-01-01.json"
+SLEEP_LIST = API + "/1.2/user/-/sleep/list.json?afterDate=2024-01-01&sort=asc&offset={}"
+
+RESOURCES = {"steps": ("steps", "Steps_Intraday", "1min", 1)}
+
+
+def intraday(*values) -> dict:
+    return {
+        "activities-steps-intraday": {
+            "dataset": [
+                {"time": f"10:{minute:02d}:00", "value": value}
+                for minute, value in enumerate(values)
+            ]
+        }
+    }
+
+
+def series(metric: str, *values) -> dict:
+    return {
+        "activities-tracker-"
+        + metric: [
+            {"dateTime": f"2024-01-0{day}", "value": str(value)}
+            for day, value in enumerate(values, start=1)
+        ]
+    }
+
+
+def sleep_log(day: str) -> dict:
+    return {
+        "dateOfSleep": day,
+        "logId": int(day.replace("-", "")),
+        "startTime": day + "T00:00:00.000",
+        "endTime": day + "T07:00:00.000",
+        "efficiency": 90,
+        "isMainSleep": True,
+        "minutesAfterWakeup": 0,
+        "minutesAsleep": 390,
+        "minutesAwake": 30,
+        "minutesToFallAsleep": 0,
+        "timeInBed": 420,
+        "levels": {
+            "data": [
+                {"dateTime": day + "T00:00:00.000", "level": "light", "seconds": 60}
+            ],
+            "summary": {
+                stage: {"minutes": 100} for stage in ("deep", "light", "rem", "wake")
+            },
+        },
+    }
+
+
+class TestReplayCall(unittest.TestCase):
+    def test_intraday_response(self):
+        call = replay_call(STEPS_WINDOW, RESOURCES)
+
+        self.assertEqual(call.method, "get_intraday_activity_by_date")
+        self.assertEqual(
+            dict(call.kwargs),
+            {
+                "date_str": "2024-01-01",
+                "start_time": "10:00",
+                "end_time": "23:59",
+                "measurement_list": (RESOURCES["steps"],),
+            },
+        )
+        self.assertEqual(call.measurements, ("Steps_Intraday",))
+
+    def test_series_response(self):
+        call = replay_call(SERIES.format(metric="steps") + "?x=1", RESOURCES)
+
+        self.assertEqual(
+            call,
+            ReplayCall(
+                "get_activity_summary_by_interval",
+                (("end_date", "2024-01-02"), ("start_date", "2024-01-01")),
+                ACTIVITY_SUMMARY,
+            ),
+        )
+
+    def test_sleep_log_list_page(self):
+        call = replay_call(SLEEP_LIST.format(100), RESOURCES)
+
+        self.assertEqual(call.method, "sleep_log_points")
+        self.assertEqual(call.kwargs, (("url", SLEEP_LIST.format(100)),))
+        self.assertEqual(call.measurements, ("Sleep Summary", "Sleep Levels"))
+
+    def test_unknown_urls_are_skipped(self):
+        self.assertIsNone(replay_call(FOODS, RESOURCES))
+        # Resources the sync doesn't have aren't replayed either
+        self.assertIsNone(replay_call(STEPS.replace("steps", "calories"), RESOURCES))
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.archive = Archive(self.path)
+        self.addCleanup(self.archive.close)
+
+    def append(self, url: str, body, fetched_at: float) -> None:
+        self.archive.append(url, url, json.dumps(body).encode(), fetched_at)
+
+    def append_series(self, fetched_at: float) -> None:
+        """Series of every activity summary metric, as a sync archives them"""
+        for n, metric in enumerate(ACTIVITY_SUMMARY_METRICS):
+            self.append(
+                SERIES.format(metric=metric), series(metric, n, n + 1), fetched_at
+            )
+
+    def test_plan_and_replay_a_day(self):
+        self.append(STEPS, intraday(1, 2), fetched_at=1)
+        self.append_series(fetched_at=2)
+        self.append(FOODS, {"foods": []}, fetched_at=4)
+        # Later fetches of the same url supersede earlier ones
+        self.append(STEPS, intraday(3, 4, 5), fetched_at=5)
+
+        days = plan_replay(self.archive, RESOURCES)
+
+        self.assertEqual(list(days), ["2024-01-01"])
+        calls = days["2024-01-01"]
+        self.assertEqual(
+            [call.method for call, _ in calls],
+            ["get_activity_summary_by_interval", "get_intraday_activity_by_date"],
+        )
+        self.assertEqual(
+            [len(entries) for _, entries in calls], [len(ACTIVITY_SUMMARY_METRICS), 1]
+        )
+
+        summary, steps = replay_day(self.path, calls, device_name="Charge6")
+
+        self.assertEqual([point["fields"]["value"] for point in steps], [3, 4, 5])
+        self.assertEqual(len(summary), 2 * len(ACTIVITY_SUMMARY_METRICS))
+        self.assertEqual(
+            [
+                p["fields"]["value"]
+                for p in summary
+                if p["measurement"] == "Total Steps"
+            ],
+            [6.0, 7.0],
+        )
+
+    def test_sleep_log_list_pages_are_replayed(self):
+        self.append(SLEEP_LIST.format(0), {"sleep": [sleep_log("2024-01-02")]}, 1)
+        self.append(SLEEP_LIST.format(1), {"sleep": [sleep_log("2024-01-03")]}, 2)
+
+        days = plan_replay(self.archive, RESOURCES)
+        self.assertEqual(len(days["2024-01-01"]), 2)
+        results = replay_day(
+            self.path, days["2024-01-01"], "Charge6", ["Sleep Summary"]
+        )
+
+        self.assertEqual(
+            [[point["time"] for point in result] for result in results],
+            [["2024-01-01T23:00:00+00:00"], ["2024-01-02T23:00:00+00:00"]],
+        )
+
+    def test_only_wanted_measurements_are_replayed(self):
+        self.append(STEPS, intraday(1), fetched_at=1)
+        self.append_series(fetched_at=2)
+
+        days = plan_replay(self.archive, RESOURCES, measurements=["Total Steps"])
+        [[call, entries]] = days["2024-01-01"]
+        [summary] = replay_day(self.path, [(call, entries)], "Charge6", ["Total Steps"])
+
+        self.assertEqual(call.method, "get_activity_summary_by_interval")
+        self.assertEqual(
+            [point["measurement"] for point in summary], ["Total Steps"] * 2
+        )
+
+
+class TestWriteResults(unittest.TestCase):
+    def test_unwritten_results_fail_the_day(self):
+        dbClient = mock.Mock()
+        dbClient.write_points_to_influxdb.side_effect = [False, True]
+        points = [{"measurement": "Steps_Intraday"}]
+
+        self.assertFalse(write_results(dbClient, [points, [], points]))
+        self.assertEqual(dbClient.write_points_to_influxdb.call_count, 2)
+        self.assertTrue(write_results(dbClient, [[]]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os, unittest
+from app.fitbit.fitbit import REQUEST_URLS, FitbitClient
+
+os.environ.setdefault("FITBIT_LOCAL_TIMEZONE", "Europe/Berlin")
+
+
+class RecordingClient:
+    """Answers every request with an empty response, keeping the urls"""
+
+    def __init__(self):
+        self.urls = []
+
+    def make_request(self, url, *args, **kwargs):
+        self.urls.append(url)
+        return {"sleep": [], "activities-heart": [], "summary": {}}
+
+
+class TestRequestUrls(unittest.TestCase):
+    def assertRequests(self, method, **kwargs):
+        client = RecordingClient()
+        getattr(FitbitClient(device_name="Charge6", client=client), method)(**kwargs)
+
+        self.assertEqual(REQUEST_URLS[method](**kwargs), client.urls)
+
+    def test_intraday_activity(self):
+        self.assertRequests(
+            "get_intraday_activity_by_date",
+            date_str="2024-01-02",
+            measurement_list=[
+                ("steps", "Steps_Intraday", "1min", 1),
+                ("distance", "Distance_Intraday", "1min", 1000),
+            ],
+            start_time="10:15",
+        )
+
+    def test_heart_rate_zones(self):
+        self.assertRequests("get_intraday_heart_rate_by_date", date_str="2024-01-02")
+
+    def test_sleep(self):
+        self.assertRequests(
+            "get_sleep_log_by_interval", start_date="2024-01-01", end_date="2024-03-01"
+        )
+
+    def test_registered_endpoints_split_long_ranges(self):
+        self.assertRequests(
+            "get_spo2_by_interval", start_date="2024-01-01", end_date="2024-03-01"
+        )
+        self.assertEqual(
+            len(REQUEST_URLS["get_spo2_by_interval"]("2024-01-01", "2024-03-01")), 3
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
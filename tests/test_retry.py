@@ -0,0 +1,131 @@
+import random
+import unittest
+from app.fitbit.retry import (
+    CircuitBreaker,
+    RequestDeferred,
+    RetryQueue,
+    backoff_delay,
+    endpoint_key,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestEndpointKey(unittest.TestCase):
+    def test_dates_and_times_are_replaced(self):
+        self.assertEqual(
+            endpoint_key(
+                "https://api.fitbit.com/1/user/-/activities/steps/date/2024-01-02/1d/1min/time/10:00/23:59.json"
+            ),
+            "1/user/-/activities/steps/date/{date}/1d/1min/time/{time}/{time}.json",
+        )
+
+
+class TestBackoff(unittest.TestCase):
+    def test_delay_is_bounded(self):
+        rng = random.Random(1)
+        for attempt in range(10):
+            delay = backoff_delay(attempt, base=10, cap=100, rng=rng)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(100, 10 * 2**attempt))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold_and_half_opens_after_timeout(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.retry_after(), 30)
+
+        clock.now = 30
+        self.assertEqual(breaker.state, "half_open")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+        clock.now = 60
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+
+class TestRetryQueue(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.queue = RetryQueue(
+            max_attempts=2, base_delay=10, clock=self.clock, rng=random.Random(1)
+        )
+
+    def test_runs_only_due_calls(self):
+        calls = []
+        self.queue.push(
+            "step", lambda value: calls.append(value), {"value": 1}, retry_after=100
+        )
+
+        self.clock.now = 50
+        self.assertEqual(self.queue.run_due(), 0)
+        self.assertEqual(self.queue.oldest_age(), 50)
+
+        self.clock.now = 100
+        self.assertEqual(self.queue.run_due(), 1)
+        self.assertEqual(calls, [1])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_deferred_again_is_rescheduled_then_dropped(self):
+        def deferred():
+            raise RequestDeferred("url", "Rate limit reached", retry_after=5)
+
+        self.queue.push("step", deferred)
+        self.clock.now = 100
+        self.queue.run_due()
+        self.assertEqual(len(self.queue), 1)
+        self.assertEqual(self.queue.oldest_age(), 100)
+
+        self.clock.now = 200
+        self.queue.run_due()
+        self.assertEqual(len(self.queue), 0)
+
+    def test_contains_waiting_calls_by_name(self):
+        self.queue.push("step", lambda: None)
+        self.assertIn("step", self.queue)
+        self.assertNotIn("other", self.queue)
+
+        self.clock.now = 100
+        self.queue.run_due()
+        self.assertNotIn("step", self.queue)
+
+    def test_same_step_is_queued_once(self):
+        self.queue.push("step", lambda day: None, {"day": "2024-01-01"})
+        self.clock.now = 5
+        self.queue.push("step", lambda day: None, {"day": "2024-01-01"})
+        self.queue.push("step", lambda day: None, {"day": "2024-01-02"})
+
+        self.assertEqual(len(self.queue), 2)
+        # The step has been waiting since it was first deferred
+        self.assertEqual(self.queue.oldest_age(), 5)
+
+    def test_failing_call_does_not_stop_the_others(self):
+        calls = []
+
+        def failing():
+            raise ValueError("boom")
+
+        self.queue.push("failing", failing)
+        self.queue.push("step", lambda: calls.append(1))
+        self.clock.now = 100
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(self.queue.run_due(), 2)
+        self.assertEqual(calls, [1])
+        self.assertEqual(len(self.queue), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
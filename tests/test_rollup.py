@@ -0,0 +1,136 @@
+import unittest
+import pandas as pd
+import pytz
+from app.syncronizer.rollup import Rollup
+
+TIMEZONE = pytz.timezone("Asia/Kolkata")
+
+
+def steps(time, value):
+    return {
+        "measurement": "Steps_Intraday",
+        "time": time,
+        "tags": {"Device": "Charge6"},
+        "fields": {"value": value},
+    }
+
+
+def nothing_written(measurement, start, end, fields=None, tags=None):
+    return pd.DataFrame({"time": [], "value": []})
+
+
+def by_measurement(points, measurement):
+    return {p["time"]: p["fields"] for p in points if p["measurement"] == measurement}
+
+
+class TestRollup(unittest.TestCase):
+    def test_hourly_and_daily_aggregates_in_local_time(self):
+        rollup = Rollup(TIMEZONE, read=nothing_written)
+        points = rollup.update(
+            [
+                # 10:00 and 10:59 local, 11:00 local
+                steps("2024-01-01T04:30:00+00:00", 10),
+                steps("2024-01-01T05:29:00+00:00", 30),
+                steps("2024-01-01T05:30:00+00:00", 5),
+            ]
+        )
+
+        hourly = by_measurement(points, "Steps_Intraday_1h")
+        self.assertEqual(
+            hourly["2024-01-01T04:30:00+00:00"],
+            {"sum": 40.0, "mean": 20.0, "min": 10.0, "max": 30.0, "count": 2},
+        )
+        self.assertEqual(hourly["2024-01-01T05:30:00+00:00"]["sum"], 5.0)
+
+        daily = by_measurement(points, "Steps_Intraday_1d")
+        self.assertEqual(list(daily), ["2023-12-31T18:30:00+00:00"])
+        self.assertEqual(daily["2023-12-31T18:30:00+00:00"]["count"], 3)
+        self.assertTrue(all(p["tags"] == {"Device": "Charge6"} for p in points))
+
+    def test_late_minutes_update_only_their_buckets(self):
+        rollup = Rollup(TIMEZONE, read=nothing_written)
+        rollup.update(
+            [
+                steps("2024-01-01T04:30:00+00:00", 10),
+                steps("2024-01-01T05:30:00+00:00", 5),
+            ]
+        )
+        points = rollup.update(
+            [
+                # a late minute and a minute fetched again with a new value
+                steps("2024-01-01T04:31:00+00:00", 20),
+                steps("2024-01-01T04:30:00+00:00", 15),
+            ]
+        )
+
+        hourly = by_measurement(points, "Steps_Intraday_1h")
+        self.assertEqual(list(hourly), ["2024-01-01T04:30:00+00:00"])
+        self.assertEqual(hourly["2024-01-01T04:30:00+00:00"]["sum"], 35.0)
+        daily = by_measurement(points, "Steps_Intraday_1d")
+        self.assertEqual(daily["2023-12-31T18:30:00+00:00"]["sum"], 40.0)
+
+    def test_other_measurements_are_ignored(self):
+        rollup = Rollup(TIMEZONE, read=nothing_written)
+        point = dict(steps("2024-01-01T04:30:00+00:00", 10), measurement="Body")
+        self.assertEqual(rollup.update([point]), [])
+
+    def test_keeps_readings_of_latest_days_only(self):
+        rollup = Rollup(TIMEZONE, max_days=2, read=nothing_written)
+        for day in (3, 4, 1, 2):
+            rollup.update([steps(f"2024-01-0{day}T04:30:00+00:00", 1)])
+        self.assertEqual(
+            sorted(rollup.days[("Steps_Intraday", (("Device", "Charge6"),))]),
+            ["2024-01-03", "2024-01-04"],
+        )
+
+    def test_day_not_kept_is_seeded_with_what_was_written(self):
+        def read(measurement, start, end, fields=None, tags=None):
+            self.assertEqual(
+                (measurement, start, end, tags),
+                (
+                    "Steps_Intraday",
+                    "2023-12-31T18:30:00+00:00",
+                    "2024-01-01T18:30:00+00:00",
+                    {"Device": "Charge6"},
+                ),
+            )
+            return pd.DataFrame(
+                {
+                    "time": pd.to_datetime(["2024-01-01 04:30", "2024-01-01 04:31"]),
+                    "value": [10, 20],
+                }
+            )
+
+        # After a restart only the minutes after the watermark are fetched
+        points = Rollup(TIMEZONE, read=read).update(
+            [steps("2024-01-01T04:31:00+00:00", 25)]
+        )
+
+        hourly = by_measurement(points, "Steps_Intraday_1h")
+        self.assertEqual(hourly["2024-01-01T04:30:00+00:00"]["sum"], 35.0)
+        daily = by_measurement(points, "Steps_Intraday_1d")
+        self.assertEqual(daily["2023-12-31T18:30:00+00:00"]["count"], 2)
+
+    def test_partial_day_rolls_up_complete_hours_only(self):
+        rollup = Rollup(TIMEZONE)
+        points = rollup.update(
+            [
+                steps("2024-01-01T04:45:00+00:00", 10),
+                steps("2024-01-01T05:30:00+00:00", 5),
+            ]
+        )
+        self.assertEqual(
+            list(by_measurement(points, "Steps_Intraday_1h")),
+            ["2024-01-01T05:30:00+00:00"],
+        )
+        self.assertEqual(by_measurement(points, "Steps_Intraday_1d"), {})
+
+        # A day fetched from local midnight is complete
+        points = rollup.update([steps("2024-01-01T18:30:00+00:00", 1)])
+        self.assertIn(
+            "2024-01-01T18:30:00+00:00", by_measurement(points, "Steps_Intraday_1d")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
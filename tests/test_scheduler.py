@@ -0,0 +1,69 @@
+import unittest
+from app.fitbit.retry import RequestDeferred
+from app.fitbit.scheduler import Priority, RequestScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = RequestScheduler(limit=150, clock=self.clock)
+
+    def test_backfill_leaves_headroom_for_live_and_daily(self):
+        self.scheduler.update({"fitbit-rate-limit-remaining": "128"})
+
+        with self.scheduler.use(Priority.BACKFILL):
+            self.scheduler.acquire("url")
+            with self.assertRaises(RequestDeferred):
+                self.scheduler.acquire("url")
+
+        with self.scheduler.use(Priority.DAILY):
+            self.scheduler.acquire("url")
+        self.scheduler.acquire("url")
+        self.assertEqual(self.scheduler.remaining, 125)
+
+    def test_reserves_follow_the_limit(self):
+        self.scheduler.update(
+            {"fitbit-rate-limit-limit": "300", "fitbit-rate-limit-remaining": "31"}
+        )
+        self.assertTrue(self.scheduler.available(Priority.DAILY))
+        self.scheduler.update({"fitbit-rate-limit-remaining": "30"})
+        self.assertFalse(self.scheduler.available(Priority.DAILY))
+        self.assertTrue(self.scheduler.available(Priority.LIVE))
+
+    def test_reserves_shrink_as_the_window_passes(self):
+        self.scheduler.update({"fitbit-rate-limit-remaining": "64"})
+        self.assertFalse(self.scheduler.available(Priority.BACKFILL))
+
+        # Half the window left, half of the 127.5 requests are kept free
+        self.clock.now = 1800
+        self.assertTrue(self.scheduler.available(Priority.BACKFILL))
+
+    def test_share_caps_a_class(self):
+        with self.scheduler.use(Priority.DAILY):
+            for _ in range(int(0.7 * 150)):
+                self.scheduler.acquire("url")
+            self.assertFalse(self.scheduler.available())
+        self.assertTrue(self.scheduler.available(Priority.LIVE))
+
+    def test_window_resets(self):
+        self.scheduler.update(
+            {"fitbit-rate-limit-remaining": "0", "fitbit-rate-limit-reset": "60"}
+        )
+        with self.assertRaises(RequestDeferred) as err:
+            self.scheduler.acquire("url")
+        self.assertEqual(err.exception.retry_after, 60)
+
+        self.clock.now = 60
+        self.scheduler.acquire("url")
+
+
+if __name__ == "__main__":
+    unittest.main()
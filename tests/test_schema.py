@@ -0,0 +1,54 @@
+import unittest
+from app.db.schema import SchemaCache
+
+
+def point(fields, measurement="TempSkin"):
+    return {
+        "measurement": measurement,
+        "time": "2024-01-01T00:00:00+00:00",
+        "tags": {"Device": "Charge6"},
+        "fields": fields,
+    }
+
+
+class TestSchemaCache(unittest.TestCase):
+    def test_drops_fields_without_value(self):
+        checked, reason = SchemaCache().check(
+            point({"level": 3, "duration_seconds": None})
+        )
+        self.assertIsNone(reason)
+        self.assertEqual(checked["fields"], {"level": 3})
+
+    def test_rejects_points_without_fields(self):
+        checked, reason = SchemaCache().check(point({"value": float("nan")}))
+        self.assertIsNone(checked)
+        self.assertEqual(reason, "no writable fields")
+
+    def test_converts_numbers_to_learnt_type(self):
+        schema = SchemaCache()
+        schema.learn([point({"nightlyRelative": -0.5, "count": 2})])
+
+        checked, _ = schema.check(point({"nightlyRelative": 1, "count": 3.0}))
+        self.assertEqual(checked["fields"], {"nightlyRelative": 1.0, "count": 3})
+        self.assertIsInstance(checked["fields"]["nightlyRelative"], float)
+        self.assertIsInstance(checked["fields"]["count"], int)
+
+    def test_rejects_type_conflicts(self):
+        schema = SchemaCache()
+        schema.learn([point({"count": 2})])
+
+        accepted, rejected = schema.prepare(
+            [point({"count": 2.5}), point({"count": "many"}), point({"count": 4})]
+        )
+        self.assertEqual(accepted, [point({"count": 4})])
+        self.assertEqual(
+            [reason for _, reason in rejected],
+            [
+                'field "count" is float, TempSkin has it as integer',
+                'field "count" is string, TempSkin has it as integer',
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
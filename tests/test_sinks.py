@@ -0,0 +1,172 @@
+import os, sqlite3, tempfile, unittest
+import pandas as pd
+import pyarrow.dataset as ds
+from app.db.parquet import ParquetSink
+from app.db.sink import FanOutSink, NullSink, Sink
+from app.db.sqlite import SQLiteSink
+
+
+def sleep(efficiency, time="2024-01-01T23:00:00+00:00"):
+    return {
+        "measurement": "Sleep Summary",
+        "time": time,
+        "tags": {"Device": "Charge6", "isMainSleep": True},
+        "fields": {"efficiency": efficiency, "minutesAwake": None},
+    }
+
+
+def heart_rate_frame():
+    return pd.DataFrame(
+        {
+            "time": pd.to_datetime(
+                ["2024-01-02T00:00:01Z", "2024-01-02T00:00:02Z"], utc=True
+            ),
+            "value": [60, 61],
+            "Device": ["Charge6", "Charge6"],
+        }
+    )
+
+
+class TestSQLiteSink(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "points.db")
+        self.sink = SQLiteSink(self.path)
+
+    def tearDown(self):
+        self.sink.close()
+        self.dir.cleanup()
+
+    def rows(self):
+        with sqlite3.connect(self.path) as connection:
+            return connection.execute(
+                "SELECT measurement, time, tags, field, value FROM points"
+                " ORDER BY measurement, time"
+            ).fetchall()
+
+    def test_points_written_again_replace_the_old_ones(self):
+        self.sink.write_points([sleep(90)])
+        self.sink.write_points([sleep(91)])
+
+        self.assertEqual(
+            self.rows(),
+            [
+                (
+                    "Sleep Summary",
+                    1704150000,
+                    '{"Device": "Charge6", "isMainSleep": "True"}',
+                    "efficiency",
+                    91,
+                )
+            ],
+        )
+
+    def test_frames_are_written_per_field_and_series(self):
+        self.sink.write_frame(heart_rate_frame(), "HeartRate_Intraday", ["Device"])
+
+        self.assertEqual(
+            self.rows(),
+            [
+                (
+                    "HeartRate_Intraday",
+                    1704153601,
+                    '{"Device": "Charge6"}',
+                    "value",
+                    60,
+                ),
+                (
+                    "HeartRate_Intraday",
+                    1704153602,
+                    '{"Device": "Charge6"}',
+                    "value",
+                    61,
+                ),
+            ],
+        )
+
+    def test_database_is_in_wal_mode(self):
+        with sqlite3.connect(self.path) as connection:
+            mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+
+class TestParquetSink(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.sink = ParquetSink(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def read(self, measurement):
+        table = ds.dataset(
+            os.path.join(self.dir.name, "measurement=" + measurement),
+            partitioning="hive",
+        ).to_table()
+        return table.to_pandas()
+
+    def test_points_are_partitioned_by_measurement_and_date(self):
+        self.sink.write_points([sleep(90), sleep(88, "2024-01-02T22:30:00+00:00")])
+        self.sink.write_frame(heart_rate_frame(), "HeartRate_Intraday", ["Device"])
+
+        self.assertEqual(
+            sorted(
+                os.listdir(os.path.join(self.dir.name, "measurement=Sleep%20Summary"))
+            ),
+            ["date=2024-01-01", "date=2024-01-02"],
+        )
+        frame = self.read("Sleep%20Summary").sort_values("time")
+        self.assertEqual(list(frame["efficiency"]), [90, 88])
+        self.assertNotIn("minutesAwake", frame.columns)
+        self.assertEqual(list(self.read("HeartRate_Intraday")["value"]), [60, 61])
+
+    def test_fields_missing_from_the_first_point_are_kept(self):
+        def body(time, **fields):
+            return {
+                "measurement": "Body",
+                "time": time,
+                "tags": {"Device": "Charge6"},
+                "fields": fields,
+            }
+
+        self.sink.write_points(
+            [
+                body("2024-01-01T07:00:00+00:00", weight=70.5),
+                body("2024-01-02T07:00:00+00:00", weight=70.1, fat=18.2),
+            ]
+        )
+
+        frame = self.read("Body").sort_values("time")
+        self.assertEqual(list(frame["weight"]), [70.5, 70.1])
+        self.assertTrue(pd.isna(frame["fat"].iloc[0]))
+        self.assertEqual(frame["fat"].iloc[1], 18.2)
+
+
+class Failing(Sink):
+    def write_points(self, points):
+        raise OSError("disk full")
+
+    def write_frame(self, frame, measurement, tag_columns):
+        raise OSError("disk full")
+
+
+class TestFanOutSink(unittest.TestCase):
+    def test_a_failing_sink_does_not_stop_the_others(self):
+        counter = NullSink()
+
+        with self.assertLogs(level="ERROR"):
+            FanOutSink([Failing(), counter]).write_points([sleep(90)] * 3)
+
+        self.assertEqual(counter.points, 3)
+
+    def test_sinks_must_write_points_and_frames(self):
+        class PointsOnly(Sink):
+            def write_points(self, points):
+                return True
+
+        with self.assertRaises(TypeError):
+            PointsOnly()
+
+
+if __name__ == "__main__":
+    unittest.main()
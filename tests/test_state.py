@@ -0,0 +1,29 @@
+import os
+import tempfile
+import unittest
+from app.syncronizer.state import SyncState
+
+
+class TestSyncState(unittest.TestCase):
+    def test_state_is_persisted(self):
+        path = os.path.join(tempfile.mkdtemp(), "state.json")
+        sync_state = SyncState(path)
+        sync_state.set("intraday", "2024-01-01/steps", "2024-01-01T10:00:00+00:00")
+        sync_state.set("backfill", "2023-01-01", "2023-02-01")
+        sync_state.delete("backfill", "2023-01-01")
+
+        reloaded = SyncState(path)
+        self.assertEqual(
+            reloaded.get("intraday", "2024-01-01/steps"), "2024-01-01T10:00:00+00:00"
+        )
+        self.assertIsNone(reloaded.get("backfill", "2023-01-01"))
+        self.assertEqual(reloaded.get("missing", "key", "default"), "default")
+
+    def test_in_memory_state(self):
+        sync_state = SyncState()
+        sync_state.set("intraday", "key", "value")
+        self.assertEqual(sync_state.get("intraday", "key"), "value")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from app.subscriber.receiver import SubscriberServer
+from tests.standins import fitbit_notifier
+
+SECRET = "client-secret"
+CODE = "verification-code"
+
+
+class TestSubscriber(unittest.TestCase):
+    def setUp(self):
+        self.server = SubscriberServer(
+            ("127.0.0.1", 0), client_secret=SECRET, verification_code=CODE
+        ).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/fitbit"
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_verification_handshake(self):
+        self.assertEqual(fitbit_notifier.verify(self.url, CODE), 204)
+        self.assertEqual(fitbit_notifier.verify(self.url, "wrong"), 404)
+
+    def test_notifications_are_deduplicated_per_collection_and_date(self):
+        first = [
+            fitbit_notifier.notification("activities", "2024-01-01"),
+            fitbit_notifier.notification("sleep", "2024-01-01"),
+        ]
+        second = [
+            fitbit_notifier.notification("activities", "2024-01-01"),
+            fitbit_notifier.notification("activities", "2024-01-02"),
+            fitbit_notifier.notification("foods", "2024-01-02"),
+        ]
+        self.assertEqual(fitbit_notifier.post(self.url, first, SECRET), 204)
+        self.assertEqual(fitbit_notifier.post(self.url, second, SECRET), 204)
+
+        self.assertEqual(
+            self.server.queue.drain(),
+            [
+                ("activities", "2024-01-01"),
+                ("sleep", "2024-01-01"),
+                ("activities", "2024-01-02"),
+            ],
+        )
+        self.assertEqual(self.server.queue.drain(), [])
+
+    def test_notifications_that_are_not_objects_are_ignored(self):
+        notifications = [1, "x", fitbit_notifier.notification("body", "2024-01-01")]
+        status = fitbit_notifier.post(self.url, notifications, SECRET)
+
+        self.assertEqual(status, 204)
+        self.assertEqual(self.server.queue.drain(), [("body", "2024-01-01")])
+
+    def test_invalid_signature_is_dropped(self):
+        notifications = [fitbit_notifier.notification("body", "2024-01-01")]
+        status = fitbit_notifier.post(self.url, notifications, "other-secret")
+
+        self.assertEqual(status, 404)
+        self.assertEqual(len(self.server.queue), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,313 @@
+import argparse, json, os, sys, tempfile, unittest
+from datetime import date, datetime
+from unittest import mock
+from tests.standins.fitbit_api import FitbitAPIStandIn
+from tests.standins.influxdb import InfluxDBStandIn
+
+# The syncronizer imports its packages like main.py does, from within app/
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+os.environ.setdefault("FITBIT_LOCAL_TIMEZONE", "Europe/Berlin")
+
+import main
+from db import db
+from fitbit import retry
+from fitbit.scheduler import Priority
+from subscriber.receiver import NotificationQueue
+from fitbit import fitbit
+from syncronizer import state, syncronizer
+
+
+class SyncronizerTestCase(unittest.TestCase):
+    """Syncronizer syncing from a Fitbit API stand-in to an InfluxDB stand-in"""
+
+    def setUp(self):
+        self.now = datetime(2024, 1, 10, 12, 30)
+        self.api = FitbitAPIStandIn(now=lambda: self.now, limit=1000).start()
+        self.addCleanup(self.api.stop)
+        self.influxdb = InfluxDBStandIn().start()
+        self.addCleanup(self.influxdb.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        token_path = os.path.join(directory.name, "tokens.json")
+        with open(token_path, "w") as file:
+            json.dump({"access_token": "access", "refresh_token": "refresh"}, file)
+
+        with mock.patch.dict(os.environ, {"FITBIT_API_BASE": self.api.url}):
+            fitbitClient = fitbit.FitbitClient(
+                client_id="id",
+                client_secret="secret",
+                token_path=token_path,
+                device_name="Charge6",
+            )
+        self.syncState = state.SyncState(os.path.join(directory.name, "state.json"))
+        dbClient = db.InfluxDBClient(
+            self.influxdb.url,
+            "token",
+            "org",
+            "database",
+            dead_letter_path=os.path.join(directory.name, "dead-letter.jsonl"),
+        )
+        self.addCleanup(dbClient.close)
+        self.syncHelper = syncronizer.Syncronizer(
+            fitbitClient=fitbitClient, dbClient=dbClient, syncState=self.syncState
+        )
+
+    def measurements(self) -> set:
+        written = {point.measurement for point in self.influxdb.points}
+        self.influxdb.reset()
+        return written
+
+
+class TestIncrementalSleep(SyncronizerTestCase):
+    def sync(self, day: str) -> None:
+        self.syncHelper.SyncOnce(day, day, ["sleep"])
+
+    def logs_written(self) -> int:
+        written = [p for p in self.influxdb.points if p.measurement == "Sleep Summary"]
+        self.influxdb.reset()
+        return len(written)
+
+    def test_only_new_and_edited_logs_are_written(self):
+        # Listed from the overlap before the day: the nights of the 9th and 10th
+        self.sync("2024-01-10")
+        self.assertEqual(self.logs_written(), 2)
+        self.assertEqual(self.syncState.get("sleep", "cursor"), "2024-01-10")
+
+        self.sync("2024-01-10")
+        self.assertEqual(self.logs_written(), 0)
+
+        self.api.edited["2024-01-09"] = {"efficiency": 50}
+        self.sync("2024-01-10")
+        self.assertEqual(self.logs_written(), 1)
+
+    def test_failed_write_keeps_cursor_and_fingerprints(self):
+        self.influxdb.fail_next(status=503)
+        self.sync("2024-01-10")
+        self.assertIsNone(self.syncState.get("sleep", "cursor"))
+        self.assertEqual(self.syncState.section("sleep_logs"), {})
+
+        self.sync("2024-01-10")
+        self.assertEqual(self.logs_written(), 2)
+        self.assertEqual(self.syncState.get("sleep", "cursor"), "2024-01-10")
+
+    def test_fingerprints_of_nights_no_longer_listed_are_pruned(self):
+        self.sync("2024-01-10")
+        self.now = datetime(2024, 1, 14, 12, 30)
+        self.sync("2024-01-14")
+        self.assertEqual(self.syncState.get("sleep", "cursor"), "2024-01-14")
+
+        self.sync("2024-01-14")
+        nights = [night for night, _ in self.syncState.section("sleep_logs").values()]
+        self.assertEqual(sorted(nights), ["2024-01-13", "2024-01-14"])
+
+    def listed_after(self, start_date: str) -> str:
+        """afterDate the sleep logs are listed from by a daily sync of start_date"""
+        fitbitClient = self.syncHelper.fitbitClient
+        with mock.patch.object(
+            fitbitClient,
+            "get_sleep_logs_after",
+            wraps=fitbitClient.get_sleep_logs_after,
+        ) as listed:
+            self.syncHelper.SyncFitbitToInfluxdb(start_date, start_date)
+        return listed.call_args.args[0]
+
+    def test_cursor_newer_than_start_date_moves_the_listing_forward(self):
+        self.sync("2024-01-10")
+        self.assertEqual(self.logs_written(), 2)
+        self.now = datetime(2024, 1, 20, 12, 30)
+        self.assertEqual(self.listed_after("2024-01-10"), "2024-01-08")
+        self.assertEqual(self.logs_written(), 10)
+        self.assertEqual(self.syncState.get("sleep", "cursor"), "2024-01-20")
+
+        # Listed from the cursor, not from the older start_date
+        self.now = datetime(2024, 1, 22, 12, 30)
+        self.assertEqual(self.listed_after("2024-01-10"), "2024-01-18")
+        self.assertEqual(self.logs_written(), 2)
+        nights = [night for night, _ in self.syncState.section("sleep_logs").values()]
+        self.assertEqual(sorted(nights), ["2024-01-21", "2024-01-22"])
+
+    def test_start_date_before_the_first_listing_is_listed(self):
+        self.sync("2024-01-10")
+        self.assertEqual(self.logs_written(), 2)
+        self.assertEqual(self.listed_after("2024-01-05"), "2024-01-03")
+        self.assertEqual(self.logs_written(), 5)
+        self.assertEqual(self.listed_after("2024-01-05"), "2024-01-08")
+
+    def test_backfill_fetches_sleep_by_date_range(self):
+        self.syncHelper.SyncFitbitBackfillToInfluxdb("2024-01-01", "2024-01-03")
+        self.assertEqual(self.logs_written(), 3)
+        self.assertIsNone(self.syncState.get("sleep", "cursor"))
+        self.assertEqual(self.syncState.section("sleep_logs"), {})
+
+
+class TestSyncNotifications(SyncronizerTestCase):
+    def test_notified_collections_are_synced_and_drained(self):
+        queue = NotificationQueue()
+        queue.add(
+            [
+                {"collectionType": "sleep", "date": "2024-01-10"},
+                {"collectionType": "body", "date": "2024-01-09"},
+            ]
+        )
+
+        self.syncHelper.SyncNotifications(queue.drain())
+
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(len(self.syncHelper.retryQueue), 0)
+        # Only the steps of the notified collections, no intraday activity
+        self.assertEqual(
+            self.measurements(),
+            {
+                "Sleep Summary",
+                "Sleep Levels",
+                "HRV_Intraday",
+                "BreathingRate",
+                "TempSkin",
+                "SPO2_Intraday",
+                "SPO2",
+                "Body",
+            },
+        )
+
+    def test_activities_sync_the_intraday_steps_of_the_date(self):
+        self.syncHelper.SyncNotifications([("activities", "2024-01-10")])
+
+        written = self.measurements()
+        self.assertTrue(
+            {"Steps_Intraday", "HeartRate_Intraday", "Total Steps"} <= written
+        )
+        self.assertNotIn("Sleep Summary", written)
+
+
+class TestDeferredSteps(SyncronizerTestCase):
+    def test_steps_deferred_every_cycle_are_queued_once(self):
+        self.api.limit = 1
+        for _ in range(3):
+            self.syncHelper.SyncFitbitToInfluxdb("2024-01-09", "2024-01-09")
+
+        # Every step waits for the quota once, not once per cycle
+        self.assertEqual(
+            len(self.syncHelper.retryQueue), len(syncronizer.INTERVAL_STEPS)
+        )
+
+
+class TestSchedule(SyncronizerTestCase):
+    def test_default_schedule_fits_an_hour_of_quota(self):
+        self.api.limit = 150
+        for minutes in range(0, 60, 10):
+            self.now = datetime(2024, 1, 10, 12, minutes)
+            self.syncHelper.SyncFitbitActivitiesToInfluxdb("2024-01-10")
+            self.syncHelper.SyncFitbitToInfluxdb("2024-01-10", "2024-01-10")
+            self.syncHelper.RunDeferredRetries()
+
+        # Six cycles of 6 live and 15 daily requests, all in one quota window
+        self.assertEqual(self.api.requests, 126)
+        self.assertEqual(len(self.syncHelper.retryQueue), 0)
+
+
+class TestSyncOnce(SyncronizerTestCase):
+    def test_past_days_leave_out_the_battery_level(self):
+        deferred = self.syncHelper.SyncOnce(
+            "2024-01-08", "2024-01-09", ["steps", "battery"]
+        )
+
+        self.assertEqual(deferred, 0)
+        self.assertEqual(self.measurements(), {"Steps_Intraday"})
+        # Days before today don't take from the live share of the quota
+        self.assertEqual(self.syncHelper.scheduler.used[Priority.LIVE], 0)
+        self.assertEqual(self.syncHelper.scheduler.used[Priority.DAILY], 2)
+
+    def test_today_syncs_the_battery_level_live(self):
+        self.now = datetime.now()
+        today = date.today().isoformat()
+
+        self.syncHelper.SyncOnce(today, today, ["battery"])
+
+        self.assertEqual(self.measurements(), {"DeviceBatteryLevel"})
+        self.assertEqual(self.syncHelper.scheduler.used[Priority.LIVE], 1)
+
+    def test_steps_deferred_briefly_are_retried(self):
+        self.syncHelper.retryQueue = retry.RetryQueue(base_delay=0.1)
+        self.api.fail_next(status=503)
+
+        deferred = self.syncHelper.SyncOnce("2024-01-09", "2024-01-09", ["hrv"])
+
+        self.assertEqual(deferred, 0)
+        self.assertEqual(self.measurements(), {"HRV_Intraday"})
+
+    def run_once(self, retry_wait: float) -> int:
+        args = argparse.Namespace(
+            since="2024-01-09",
+            until="2024-01-09",
+            resources=["steps", "hrv"],
+            retry_wait=retry_wait,
+        )
+        return main.run_once(self.syncHelper, args)
+
+    def test_exit_code_counts_steps_left_deferred(self):
+        self.assertEqual(self.run_once(retry_wait=1), 0)
+
+        # Deferred until the hourly quota resets, which isn't waited for
+        self.api.limit = 1
+        self.api.quota.clear()
+        self.assertEqual(self.run_once(retry_wait=1), 2)
+        self.assertEqual(len(self.syncHelper.retryQueue), 1)
+
+
+class TestBackfill(SyncronizerTestCase):
+    def backfill(self, syncHelper=None) -> str:
+        (syncHelper or self.syncHelper).SyncFitbitBackfillToInfluxdb(
+            "2024-01-01", "2024-01-03"
+        )
+        return self.syncState.get("backfill", "2024-01-01")
+
+    def days_written(self) -> set:
+        """Measurement and local date of every point written"""
+        days = set()
+        for point in self.influxdb.points:
+            time = datetime.fromtimestamp(point.timestamp / 1e9, fitbit.LOCAL_TIMEZONE)
+            days.add(f"{point.measurement} {time.date()}")
+        return days
+
+    def test_failed_writes_keep_the_cursor(self):
+        self.influxdb.error_rate, self.influxdb.error_status = 1, 503
+        self.assertEqual(self.backfill(), "2024-01-01")
+        self.assertEqual(self.influxdb.points, [])
+        self.assertEqual(len(self.syncHelper.retryQueue), 0)
+
+        self.influxdb.error_rate = 0
+        self.assertEqual(self.backfill(), "2024-01-04")
+
+    def test_deferred_steps_are_fetched_again_from_the_cursor(self):
+        # The first step of the first day is deferred, later days aren't backfilled
+        self.api.fail_next(status=503)
+        self.assertEqual(self.backfill(), "2024-01-01")
+        self.assertEqual(len(self.syncHelper.retryQueue), 0)
+        self.assertNotIn("Steps_Intraday 2024-01-02", self.days_written())
+
+        self.assertEqual(self.backfill(), "2024-01-04")
+        self.assertIn("Steps_Intraday 2024-01-02", self.days_written())
+
+    def test_failed_pooled_writes_keep_the_cursor(self):
+        with mock.patch.dict(os.environ, {"SYNC_BACKFILL_WORKERS": "1"}):
+            syncHelper = syncronizer.Syncronizer(
+                fitbitClient=self.syncHelper.fitbitClient,
+                dbClient=self.syncHelper.dbClient,
+                syncState=self.syncState,
+            )
+        self.addCleanup(syncHelper.transformPool.close)
+
+        self.influxdb.error_rate, self.influxdb.error_status = 1, 503
+        self.assertEqual(self.backfill(syncHelper), "2024-01-01")
+        self.assertEqual(self.influxdb.points, [])
+
+        self.influxdb.error_rate = 0
+        self.assertEqual(self.backfill(syncHelper), "2024-01-04")
+        self.assertIn("Steps_Intraday", self.measurements())
+
+
+if __name__ == "__main__":
+    unittest.main()